@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import time
 import uuid
 from json import dumps, loads
 from os import getenv
@@ -6,40 +8,95 @@ from os import getenv
 import websockets
 from dotenv import load_dotenv, set_key
 
+from harmony_modules import metrics
+
 
 class VTSController:
     def __init__(
         self,
         endpoint: str = "ws://localhost:8001",
         plugin_name: str = 'Harmony-Link-Plugin',
-        plugin_developer: str = 'HarmonyAI-Solutions'
+        plugin_developer: str = 'HarmonyAI-Solutions',
+        request_timeout: float = 5.0,
+        parameter_update_rate: float = 30.0,
+        entity_id: str = None
     ) -> None:
         self.base_info = {
             'pluginName': plugin_name,
             'pluginDeveloper': plugin_developer
         }
         self.endpoint = endpoint
+        self.entity_id = entity_id  # label for metrics
         self.vts_token = None
         self.websocket = None
+        # Request multiplexing - replies are routed to the pending request by their requestID
+        self.request_timeout = request_timeout
+        self.pending_requests = {}
+        self.reader_task = None
+        # Parameter sink - latest written value per parameter wins, flushed in batches at a fixed rate
+        self.parameter_update_interval = 1.0 / parameter_update_rate
+        self.pending_parameters = {}
+        self.sink_task = None
+        self.sink_failing = False  # failures are only logged once until an injection succeeds again
 
-    async def send_request(self, message_type: str = 'APIStateRequest', data: dict = None) -> dict:
+    async def send_request(self, message_type: str = 'APIStateRequest', data: dict = None, timeout: float = None) -> dict:
+        request_id = uuid.uuid4().hex
         request = {
             "apiName": "VTubeStudioPublicAPI",
             "apiVersion": "1.0",
-            "requestID": uuid.uuid4().hex,
+            "requestID": request_id,
             "messageType": message_type,
             "data": data
         }
-        await self.websocket.send(dumps(request))
-        result = await self.websocket.recv()
-        return loads(result)
+        if self.reader_task is None or self.reader_task.done():
+            raise ConnectionError('VTS API connection is not established')
+
+        # Register the future before sending, so a fast reply can't get lost
+        response_future = asyncio.get_running_loop().create_future()
+        self.pending_requests[request_id] = response_future
+        try:
+            start_time = time.perf_counter()
+            await self.websocket.send(dumps(request))
+            response = await asyncio.wait_for(response_future, timeout=timeout or self.request_timeout)
+            metrics.VTS_REQUEST_DURATION.labels(entity_id=self.entity_id, message_type=message_type).observe(
+                time.perf_counter() - start_time)
+            return response
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"VTS API request '{message_type}' timed out")
+        finally:
+            self.pending_requests.pop(request_id, None)
+
+    async def receive_responses(self) -> None:
+        # Single reader per websocket, resolving the pending request futures
+        error = ConnectionError('VTS API connection closed')
+        try:
+            async for message in self.websocket:
+                response = loads(message)
+                response_future = self.pending_requests.get(response.get('requestID'))
+                if response_future is None:
+                    logging.debug(f"VTS API: Ignoring unrelated message of type '{response.get('messageType')}'")
+                    continue
+                if not response_future.done():
+                    response_future.set_result(response)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"VTS API receive error: {e}")
+            error = ConnectionError(f'VTS API connection failed: {e}')
+        finally:
+            # Fail all requests still waiting for a reply
+            for response_future in self.pending_requests.values():
+                if not response_future.done():
+                    response_future.set_exception(error)
+            self.pending_requests.clear()
 
     async def authentication(self) -> None:
         self.update_dotenv()
 
         if not self.vts_token:
             logging.debug("VTS Token not set, requesting new token...")
-            res = await self.send_request(message_type='AuthenticationTokenRequest', data=self.base_info)
+            # Token requests wait for the user to confirm the plugin inside VTube Studio
+            res = await self.send_request(message_type='AuthenticationTokenRequest', data=self.base_info, timeout=120)
             if res['messageType'] == 'APIError':
                 raise Exception(f"Error occured:\n\t{res['data']['message']}")
             self.__update_token(res['data']['authenticationToken'])
@@ -55,6 +112,7 @@ class VTSController:
         self.update_dotenv()
         try:
             self.websocket = await websockets.connect(self.endpoint)
+            self.reader_task = asyncio.create_task(self.receive_responses())
             res = await self.send_request(message_type='APIStateRequest')
         except Exception as e:
             logging.error(f"WebSocket initialization error: {e}")
@@ -67,6 +125,22 @@ class VTSController:
                 logging.error(f"Authentication error: {e}")
                 raise
 
+        # Start flushing the parameter sink
+        self.sink_task = asyncio.create_task(self.parameter_sink_loop())
+
+    async def close(self) -> None:
+        if self.sink_task:
+            self.sink_task.cancel()
+            await asyncio.gather(self.sink_task, return_exceptions=True)
+            self.sink_task = None
+        if self.reader_task:
+            self.reader_task.cancel()
+            await asyncio.gather(self.reader_task, return_exceptions=True)
+            self.reader_task = None
+        if self.websocket:
+            await self.websocket.close()
+            self.websocket = None
+
     async def inject_params(self, parameters: list) -> None:
         data = {
             "faceFound": False,
@@ -79,6 +153,39 @@ class VTSController:
     async def set_mouth_open(self, mouth_open: float = 0.0) -> None:
         await self.inject_params([['MouthOpen', mouth_open]])
 
+    def write_parameter(self, param_id: str, value: float) -> None:
+        # Overwrites any value not flushed yet, intermediate values are dropped
+        self.pending_parameters[param_id] = value
+
+    def write_parameters(self, parameters: dict) -> None:
+        self.pending_parameters.update(parameters)
+
+    async def parameter_sink_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            if self.pending_parameters:
+                parameters, self.pending_parameters = self.pending_parameters, {}
+                try:
+                    await self.inject_params(list(parameters.items()))
+                    if self.sink_failing:
+                        logging.info("VTS parameter injection recovered")
+                        self.sink_failing = False
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Only this batch is lost, values written meanwhile are newer and get flushed on the next tick
+                    if not self.sink_failing:
+                        logging.warning(f"VTS parameter injection failed, retrying silently until it recovers: {e}")
+                        self.sink_failing = True
+
+            # Keep a fixed rate, skip ticks we fell behind on instead of bursting to catch up
+            next_tick += self.parameter_update_interval
+            now = loop.time()
+            if next_tick < now:
+                next_tick = now
+            await asyncio.sleep(next_tick - now)
+
     def update_dotenv(self) -> None:
         load_dotenv(override=True)
         self.vts_token = getenv("VTS_TOKEN")
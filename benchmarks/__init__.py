@@ -0,0 +1,5 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Benchmarks - run from the repository root, e.g. `python -m benchmarks.bench_lipsync`
+# All benchmarks at once with JSON results: `python -m benchmarks.run_suite --output results.json`
@@ -0,0 +1,63 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Microphone Audio Codec Benchmark
+# Reports compression ratio and encoding CPU time per second of audio for the uplink codecs,
+# encoding speech-like audio in fetch-sized slices like the STT module does.
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_lipsync import generate_speech_like_audio
+from harmony_modules import audio_codec
+
+
+def run(duration=20.0, slice_duration=1.0, sample_rate=44100, channels=1, bit_depth=16):
+    audio_data = generate_speech_like_audio(duration, sample_rate)
+    samples = np.repeat(audio_data[:, None], channels, axis=1)
+    pcm = (np.clip(samples, -1.0, 1.0) * (2 ** (bit_depth - 1) - 1)).astype('<i{0}'.format(bit_depth // 8)).tobytes()
+    slice_bytes = int(slice_duration * sample_rate) * channels * (bit_depth // 8)
+    slices = [pcm[offset:offset + slice_bytes] for offset in range(0, len(pcm), slice_bytes)]
+
+    results = {}
+    for codec_name in (audio_codec.AUDIO_CODEC_PCM, audio_codec.AUDIO_CODEC_FLAC, audio_codec.AUDIO_CODEC_OGG):
+        if not audio_codec.is_supported(codec_name, bit_depth):
+            continue
+        encoded_bytes = 0
+        start = time.process_time()
+        for audio_slice in slices:
+            encoded_bytes += len(audio_codec.encode_audio(audio_slice, codec_name, sample_rate, channels, bit_depth))
+        encode_time = time.process_time() - start
+        results[codec_name] = {
+            'compression_ratio': len(pcm) / encoded_bytes,
+            'bytes_per_second': encoded_bytes / duration,
+            'encode_cpu_per_second': encode_time / duration,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microphone audio codec benchmark')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of audio to encode')
+    parser.add_argument('--slice', type=float, default=1.0, help='seconds of audio per encoded slice')
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--bit-depth', type=int, choices=(16, 32), default=16)
+    args = parser.parse_args()
+
+    results = run(
+        duration=args.duration,
+        slice_duration=args.slice,
+        sample_rate=args.sample_rate,
+        channels=args.channels,
+        bit_depth=args.bit_depth,
+    )
+    for codec_name, result in results.items():
+        print('{0:>4}: {1:.2f}x compression, {2:.0f} bytes/s, {3:.2f}ms encoding CPU per second of audio'.format(
+            codec_name, result['compression_ratio'], result['bytes_per_second'], result['encode_cpu_per_second'] * 1e3
+        ))
+
+
+if __name__ == '__main__':
+    main()
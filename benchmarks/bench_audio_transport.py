@@ -0,0 +1,95 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Microphone Audio Transport Benchmark
+# Compares bytes on the wire and CPU time per second of audio between base64 JSON events and binary frames.
+import argparse
+import base64
+import os
+import time
+
+from harmony_modules import codec
+from harmony_modules.common import HarmonyLinkEvent, EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT, EVENT_STATE_NEW
+
+
+def create_result_event(audio_data, sample_rate, channels, bit_depth):
+    return HarmonyLinkEvent(
+        event_id='fetch-1',
+        event_type=EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT,
+        status=EVENT_STATE_NEW,
+        payload={
+            'audio_bytes': audio_data,
+            'channels': channels,
+            'bit_depth': bit_depth,
+            'sample_rate': sample_rate,
+        }
+    )
+
+
+def encode_base64(audio_bytes, sample_rate, channels, bit_depth):
+    encoded_data = base64.b64encode(audio_bytes).decode('utf-8')
+    return codec.encode_event(create_result_event(encoded_data, sample_rate, channels, bit_depth))
+
+
+def decode_base64(message):
+    event = codec.decode_event(message)
+    return base64.b64decode(event.payload['audio_bytes'])
+
+
+def encode_binary(audio_bytes, sample_rate, channels, bit_depth):
+    return codec.encode_binary_event(
+        create_result_event(audio_bytes, sample_rate, channels, bit_depth), 'audio_bytes')
+
+
+def decode_binary(message):
+    return codec.decode_binary_event(message).payload['audio_bytes']
+
+
+def measure(func, min_duration, *args):
+    iterations = 0
+    start = time.process_time()
+    elapsed = 0.0
+    while elapsed < min_duration:
+        result = func(*args)
+        iterations += 1
+        elapsed = time.process_time() - start
+    return elapsed / iterations, result
+
+
+def run(window_seconds=1.0, sample_rate=44100, channels=1, bit_depth=16, min_duration=0.5):
+    audio_bytes = os.urandom(int(window_seconds * sample_rate) * channels * (bit_depth // 8))
+    results = {}
+    for transport, encode, decode in (
+            ('base64', encode_base64, decode_base64),
+            ('binary', encode_binary, decode_binary),
+    ):
+        encode_time, message = measure(encode, min_duration, audio_bytes, sample_rate, channels, bit_depth)
+        decode_time, decoded = measure(decode, min_duration, message)
+        assert decoded == audio_bytes
+        results[transport] = {
+            'wire_bytes_per_second': len(message) / window_seconds,
+            'overhead': len(message) / len(audio_bytes) - 1.0,
+            'encode_cpu_per_second': encode_time / window_seconds,
+            'decode_cpu_per_second': decode_time / window_seconds,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microphone audio transport benchmark')
+    parser.add_argument('--window', type=float, default=1.0, help='seconds of audio per fetch result')
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=1)
+    args = parser.parse_args()
+
+    results = run(window_seconds=args.window, sample_rate=args.sample_rate, channels=args.channels)
+    for transport, result in results.items():
+        print('{0}: {1:.0f} bytes/s on the wire ({2:+.1%} overhead), '
+              'encode {3:.3f}ms, decode {4:.3f}ms CPU per second of audio'.format(
+                transport, result['wire_bytes_per_second'], result['overhead'],
+                result['encode_cpu_per_second'] * 1e3, result['decode_cpu_per_second'] * 1e3
+              ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Event Codec Benchmark
+# Compares encoding and decoding of typical Harmony Link events between the codec module and
+# the previous json.dumps(cls=HarmonyEventJSONEncoder) / HarmonyLinkEvent(**json.loads()) path.
+import argparse
+import base64
+import json
+import os
+import time
+
+from harmony_modules import codec
+from harmony_modules.common import HarmonyLinkEvent, EVENT_TYPE_AI_STATUS, EVENT_TYPE_AI_SPEECH, \
+    EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT, EVENT_STATE_DONE
+from harmony_modules.connector import HarmonyEventJSONEncoder
+
+
+def create_events(audio_seconds=5.0):
+    # Typical small status event, a TTS reply and a microphone result carrying 16kHz 16bit mono audio
+    audio_bytes = os.urandom(int(audio_seconds * 16000 * 2))
+    return {
+        'status': HarmonyLinkEvent(
+            event_id='status-1', event_type=EVENT_TYPE_AI_STATUS, status=EVENT_STATE_DONE,
+            payload={'entity_id': 'chara', 'status': 'thinking'}
+        ),
+        'speech': HarmonyLinkEvent(
+            event_id='speech-1', event_type=EVENT_TYPE_AI_SPEECH, status=EVENT_STATE_DONE,
+            payload={'type': 'AI_SPEECH', 'content': 'Hello there! ' * 20, 'audio_file': '/tmp/tts/utterance.wav'}
+        ),
+        'audio_{0:g}s'.format(audio_seconds): HarmonyLinkEvent(
+            event_id='fetch-1', event_type=EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT, status=EVENT_STATE_DONE,
+            payload={
+                'audio_bytes': base64.b64encode(audio_bytes).decode('utf-8'),
+                'channels': 1, 'bit_depth': 16, 'sample_rate': 16000, 'start_byte': 0,
+                'bytes_count': len(audio_bytes),
+            }
+        ),
+    }
+
+
+def legacy_encode(event):
+    return json.dumps(event, cls=HarmonyEventJSONEncoder)
+
+
+def legacy_decode(message):
+    return HarmonyLinkEvent(**json.loads(message))
+
+
+def measure(func, argument, min_duration):
+    # Runs func repeatedly for at least min_duration seconds, returns the mean time per call
+    iterations = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_duration:
+        func(argument)
+        iterations += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / iterations
+
+
+def run(audio_seconds=5.0, min_duration=0.5):
+    results = {}
+    for name, event in create_events(audio_seconds).items():
+        message = codec.encode_event(event)
+        results[name] = {
+            'message_bytes': len(message),
+            'legacy_encode': measure(legacy_encode, event, min_duration),
+            'codec_encode': measure(codec.encode_event, event, min_duration),
+            'legacy_decode': measure(legacy_decode, message, min_duration),
+            'codec_decode': measure(codec.decode_event, message, min_duration),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Event codec benchmark')
+    parser.add_argument('--audio-seconds', type=float, default=5.0, help='audio length of the microphone result event')
+    parser.add_argument('--min-duration', type=float, default=0.5, help='minimum measuring time per case')
+    args = parser.parse_args()
+
+    print('JSON backend: {0}'.format('orjson' if codec.orjson is not None else 'json'))
+    for name, result in run(audio_seconds=args.audio_seconds, min_duration=args.min_duration).items():
+        print('{0:>9} ({1} bytes): encode {2:.2f}us -> {3:.2f}us, decode {4:.2f}us -> {5:.2f}us'.format(
+            name, result['message_bytes'],
+            result['legacy_encode'] * 1e6, result['codec_encode'] * 1e6,
+            result['legacy_decode'] * 1e6, result['codec_decode'] * 1e6
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Connector Dispatch Benchmark
+# Measures the cost of dispatching an inbound event as more modules get registered on a connector.
+# Timings include the module worker tasks, which get a chance to drain their queues periodically.
+import argparse
+import asyncio
+import time
+
+from harmony_modules import common
+from harmony_modules.connector import ConnectorEventHandler
+
+# Event types used for the registered dummy modules, none of them consumes AI_STATUS
+MODULE_EVENT_TYPES = [
+    common.EVENT_TYPE_AI_SPEECH,
+    common.EVENT_TYPE_STT_OUTPUT_TEXT,
+    common.EVENT_TYPE_STT_FETCH_MICROPHONE,
+    common.EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE,
+]
+
+
+# DummyEntityController - minimal entity controller providing the connector to modules
+class DummyEntityController:
+    def __init__(self, connector):
+        self.connector = connector
+
+
+# FilteringModule - consumes a single event type, filtering it like the plugin modules do
+class FilteringModule(common.HarmonyClientModuleBase):
+    def __init__(self, entity_controller, event_type, declare_subscriptions):
+        common.HarmonyClientModuleBase.__init__(self, entity_controller=entity_controller)
+        self.event_type = event_type
+        if declare_subscriptions:
+            self.event_subscriptions = {event_type: (common.EVENT_STATE_DONE,)}
+        self.handled = 0
+
+    async def handle_event(self, event):
+        if event.event_type == self.event_type and event.status == common.EVENT_STATE_DONE:
+            self.handled += 1
+
+
+async def measure_dispatch(module_count, declare_subscriptions, iterations):
+    connector = ConnectorEventHandler(ws_endpoint=None, shutdown_func=None)
+    entity_controller = DummyEntityController(connector)
+    for index in range(module_count):
+        module = FilteringModule(
+            entity_controller,
+            MODULE_EVENT_TYPES[index % len(MODULE_EVENT_TYPES)],
+            declare_subscriptions
+        )
+        module.activate()
+
+    event = common.HarmonyLinkEvent(
+        event_id='ai_status',
+        event_type=common.EVENT_TYPE_AI_STATUS,
+        status=common.EVENT_STATE_DONE,
+        payload={}
+    )
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        await connector.handle_event(event)
+        if iteration % 64 == 0:
+            await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    duration = time.perf_counter() - start
+    # Let the module workers shut down
+    worker_tasks = [event_handler_queue.task for event_handler_queue in connector.event_handler_queues.values()]
+    connector.stop()
+    await asyncio.gather(*worker_tasks)
+    return duration / iterations
+
+
+async def run(module_counts=(1, 4, 16, 64), iterations=20000):
+    results = {}
+    for module_count in module_counts:
+        results[module_count] = {
+            'broadcast_us': await measure_dispatch(module_count, False, iterations) * 1e6,
+            'indexed_us': await measure_dispatch(module_count, True, iterations) * 1e6,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Connector event dispatch benchmark')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(iterations=args.iterations))
+    print('modules | broadcast to all (us/event) | dispatch index (us/event)')
+    for module_count, result in results.items():
+        print('{0:>7} | {1:>27.2f} | {2:>25.2f}'.format(module_count, result['broadcast_us'], result['indexed_us']))
+
+
+if __name__ == '__main__':
+    main()
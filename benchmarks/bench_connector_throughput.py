@@ -0,0 +1,122 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Connector Throughput Benchmark
+# Measures how many events per second a connector sends to the fake Harmony Link and gets dispatched back,
+# with one event in flight at a time and with many queued up at once.
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_harmony_link import FakeHarmonyLink
+from harmony_modules import common
+from harmony_modules.connector import ConnectorEventHandler
+
+
+# DummyEntityController - minimal entity controller providing the connector to modules
+class DummyEntityController:
+    def __init__(self, connector):
+        self.connector = connector
+
+
+# AckCounter - counts the fake Harmony Link's acknowledgements and resolves once all expected ones arrived
+class AckCounter(common.HarmonyClientModuleBase):
+    event_subscriptions = {common.EVENT_TYPE_USER_UTTERANCE: (common.EVENT_STATE_DONE,)}
+
+    def __init__(self, entity_controller):
+        common.HarmonyClientModuleBase.__init__(self, entity_controller=entity_controller)
+        self.acks = 0
+        self.expected = 0
+        self.send_times = {}
+        self.round_trips = []
+        self.completed = None
+
+    def expect(self, count):
+        self.acks = 0
+        self.expected = count
+        self.round_trips = []
+        self.completed = asyncio.get_running_loop().create_future()
+
+    async def handle_event(self, event):
+        self.round_trips.append(time.perf_counter() - self.send_times.pop(event.event_id))
+        self.acks += 1
+        if self.acks >= self.expected and not self.completed.done():
+            self.completed.set_result(time.perf_counter())
+
+
+def create_event(index, payload_size):
+    return common.HarmonyLinkEvent(
+        event_id='utterance_{0}'.format(index),
+        event_type=common.EVENT_TYPE_USER_UTTERANCE,
+        status=common.EVENT_STATE_NEW,
+        payload={'type': common.UTTERANCE_VERBAL, 'content': 'x' * payload_size}
+    )
+
+
+async def measure_throughput(connector, ack_counter, events, pipelined, payload_size):
+    ack_counter.expect(events)
+    start = time.perf_counter()
+    if pipelined:
+        # Everything is queued up front, the producer drains the outbound buffer as fast as it can
+        send_futures = []
+        for index in range(events):
+            ack_counter.send_times['utterance_{0}'.format(index)] = time.perf_counter()
+            send_futures.append(asyncio.ensure_future(connector.send_event(create_event(index, payload_size))))
+        await asyncio.gather(*send_futures)
+    else:
+        for index in range(events):
+            ack_counter.send_times['utterance_{0}'.format(index)] = time.perf_counter()
+            await connector.send_event(create_event(index, payload_size))
+    sent_time = time.perf_counter()
+    acked_time = await asyncio.wait_for(ack_counter.completed, timeout=60)
+    ack_counter.round_trips.sort()
+    return {
+        'sent_per_second': events / (sent_time - start),
+        'acked_per_second': events / (acked_time - start),
+        'median_round_trip': ack_counter.round_trips[len(ack_counter.round_trips) // 2],
+        'max_round_trip': ack_counter.round_trips[-1],
+    }
+
+
+async def run(events=5000, payload_size=64):
+    fake_link = FakeHarmonyLink()
+    await fake_link.start()
+    # Outbound buffer and handler queue have to hold a whole pipelined batch, nothing may get dropped
+    connector = ConnectorEventHandler(
+        ws_endpoint=fake_link.endpoint,
+        shutdown_func=None,
+        handler_queue_size=events,
+        outbound_buffer_size=events
+    )
+    connector.start()
+    await connector.wait_connected()
+    ack_counter = AckCounter(DummyEntityController(connector))
+    ack_counter.activate()
+
+    results = {}
+    for mode, pipelined in (('sequential', False), ('pipelined', True)):
+        results[mode] = await measure_throughput(connector, ack_counter, events, pipelined, payload_size)
+
+    connector.stop()
+    await asyncio.gather(connector.task, return_exceptions=True)
+    await fake_link.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Connector event throughput benchmark')
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--payload-size', type=int, default=64, help='characters of utterance content per event')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(events=args.events, payload_size=args.payload_size))
+    for mode, result in results.items():
+        print('{0:>10}: {1:.0f} events/s sent, {2:.0f} events/s acknowledged, '
+              'round trip median {3:.2f}ms, max {4:.2f}ms'.format(
+                mode, result['sent_per_second'], result['acked_per_second'],
+                result['median_round_trip'] * 1e3, result['max_round_trip'] * 1e3
+              ))
+
+
+if __name__ == '__main__':
+    main()
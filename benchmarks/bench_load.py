@@ -0,0 +1,347 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Scene Load Test
+# Brings up the user entity plus N character entities through the plugin's own startup (harmony.start_harmony_ai)
+# against the fake Harmony Link and fake VTube Studio, and drives rounds of synthetic user speech through the scene:
+# speech started / stopped, then a transcript which every character forwards to Harmony Link as USER_UTTERANCE
+# and answers with a spoken AI_SPEECH reply including lipsync.
+# Reports startup time, event loop lag, memory / file descriptors / threads per entity and the fan-out latency from
+# the transcript to the characters' utterances, for a growing number of characters, e.g.
+# `python -m benchmarks.bench_load --entities 1 10 25 50 --output bench_load.json`.
+# Each entity count runs in its own process, so memory and resource counts don't carry over.
+# The keyboard controls are replaced by the load test toggling the microphone itself. Without --audio-devices,
+# microphone and speakers are replaced by real time paced threads as well.
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import soundfile as sf
+
+import harmony
+import harmony_globals
+from benchmarks.bench_lipsync import generate_speech_like_audio
+from benchmarks.bench_stt_uplink import SyntheticMicrophoneHandler
+from benchmarks.bench_tts_first_sample import VirtualOutputStream
+from benchmarks.fake_harmony_link import FakeHarmonyLink
+from benchmarks.fake_vts import FakeVTubeStudio
+from harmony_modules import common, controls, text_to_speech
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+USER_ENTITY_ID = 'user'
+
+
+# HeadlessMicrophoneHandler - STT module recording silence from a real time paced thread instead of a microphone
+class HeadlessMicrophoneHandler(SyntheticMicrophoneHandler):
+    def __init__(self, entity_controller, stt_config):
+        SyntheticMicrophoneHandler.__init__(self, entity_controller, stt_config, speech_end_byte=None)
+
+
+# HeadlessSpeechHandler - TTS module playing into a real time paced thread instead of a sound card
+class HeadlessSpeechHandler(text_to_speech.TextToSpeechHandler):
+    def setup_speaker(self):
+        pass
+
+    def activate(self):
+        self.output_stream = VirtualOutputStream(self.player, self.output_sample_rate, self.output_channels, block_frames=512)
+        self.output_stream.start()
+        common.HarmonyClientModuleBase.activate(self)
+
+    def deactivate(self):
+        common.HarmonyClientModuleBase.deactivate(self)
+        self.player.clear()
+        if self.output_stream is not None:
+            self.output_stream.stop()
+            self.output_stream = None
+
+
+# ScriptedControlsHandler - user controls without a keyboard listener, the load test toggles the microphone itself
+class ScriptedControlsHandler(controls.ControlsHandler):
+    def activate(self):
+        pass
+
+
+# HeadlessEntityController - the plugin's entity controller without audio devices and keyboard
+class HeadlessEntityController(harmony.EntityController):
+    stt_module_class = HeadlessMicrophoneHandler
+    tts_module_class = HeadlessSpeechHandler
+    controls_module_class = ScriptedControlsHandler
+
+
+# DeviceEntityController - the plugin's entity controller using the real microphone and speakers
+class DeviceEntityController(harmony.EntityController):
+    controls_module_class = ScriptedControlsHandler
+
+
+# ServerThread - runs the fake servers on their own event loop, so their work doesn't show up as plugin loop lag
+class ServerThread:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='fake-servers', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def call(self, coroutine):
+        # Runs a coroutine on the server loop, awaitable from the calling loop
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self.loop))
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+# LoopLagMonitor - measures how late the event loop wakes up a task sleeping for a fixed interval
+class LoopLagMonitor:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lags = []
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(loop.time() - expected)
+
+    def get_stats(self):
+        lags = sorted(self.lags)
+        if not lags:
+            return None
+        return {
+            'median': lags[len(lags) // 2],
+            'p99': lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+            'max': lags[-1],
+        }
+
+
+def get_process_stats():
+    # Resident memory, open file descriptors / handles and threads of this process, None where unavailable
+    stats = {'rss_bytes': None, 'open_fds': None, 'os_threads': None, 'python_threads': threading.active_count()}
+    if psutil is not None:
+        process = psutil.Process()
+        stats['rss_bytes'] = process.memory_info().rss
+        stats['open_fds'] = process.num_fds() if hasattr(process, 'num_fds') else process.num_handles()
+        stats['os_threads'] = process.num_threads()
+        return stats
+    try:
+        with open('/proc/self/statm') as statm_file:
+            stats['rss_bytes'] = int(statm_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        stats['open_fds'] = len(os.listdir('/proc/self/fd'))
+        stats['os_threads'] = len(os.listdir('/proc/self/task'))
+    except (OSError, ValueError, AttributeError):
+        pass
+    return stats
+
+
+def load_config(link_endpoint, vts_endpoint, character_ids, startup_concurrency):
+    # The shipped configuration, pointed at the fake servers and set up with the load test's scene
+    config = harmony.load_config()
+    config.set('Connector', 'ws_endpoint', link_endpoint)
+    config.set('VTS', 'endpoint', vts_endpoint)
+    config.set('Scene', 'user_entity_id', USER_ENTITY_ID)
+    config.set('Scene', 'character_entity_id', ','.join(character_ids))
+    config.set('Harmony', 'startup_concurrency', str(startup_concurrency))
+    return config
+
+
+async def drive_round(servers, fake_link, character_count, speech_duration, timeout):
+    # User talks, then the transcript gets fanned out to all characters, returns their forwarding latencies
+    for event_type in (common.EVENT_TYPE_STT_SPEECH_STARTED, common.EVENT_TYPE_STT_SPEECH_STOPPED):
+        await servers.call(fake_link.send_to_entity(USER_ENTITY_ID, common.HarmonyLinkEvent(
+            event_id='vad', event_type=event_type, status=common.EVENT_STATE_DONE, payload={}
+        )))
+        if event_type == common.EVENT_TYPE_STT_SPEECH_STARTED:
+            await asyncio.sleep(speech_duration)
+
+    first_utterance = len(fake_link.utterance_log)
+    transcript_time = time.perf_counter()
+    await servers.call(fake_link.send_to_entity(USER_ENTITY_ID, common.HarmonyLinkEvent(
+        event_id='stt_output',
+        event_type=common.EVENT_TYPE_STT_OUTPUT_TEXT,
+        status=common.EVENT_STATE_DONE,
+        payload={'type': common.UTTERANCE_VERBAL, 'content': 'Hello everyone!'}
+    )))
+    # Polled at 1ms resolution - the fake Link records the receive times itself
+    while len(fake_link.utterance_log) - first_utterance < character_count and time.perf_counter() - transcript_time < timeout:
+        await asyncio.sleep(0.001)
+    return [receive_time - transcript_time for _, receive_time in fake_link.utterance_log[first_utterance:]]
+
+
+async def run(entity_count=10, rounds=10, round_interval=2.0, speech_duration=0.5, startup_concurrency=4,
+              audio_devices=False, reply_duration=1.5, startup_timeout=60.0):
+    servers = ServerThread()
+    servers.start()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        ai_speech_file = os.path.join(temp_dir, 'ai_speech.wav')
+        sf.write(ai_speech_file, generate_speech_like_audio(reply_duration, 22050), 22050)
+        fake_link = FakeHarmonyLink(ai_speech_file=ai_speech_file)
+        fake_vts = FakeVTubeStudio()
+        await servers.call(fake_link.start())
+        await servers.call(fake_vts.start())
+        character_ids = ['character_{0}'.format(index) for index in range(entity_count)]
+        config = load_config(fake_link.endpoint, fake_vts.endpoint, character_ids, startup_concurrency)
+
+        gc.collect()
+        baseline_stats = get_process_stats()
+
+        # Bring up through the plugin's startup, until the scene finished loading for all entities
+        startup_time = time.perf_counter()
+        entity_controller_class = DeviceEntityController if audio_devices else HeadlessEntityController
+        if not await harmony.start_harmony_ai(config=config, entity_controller_class=entity_controller_class):
+            raise RuntimeError('Plugin startup failed')
+        await asyncio.wait_for(harmony_globals.scene_loaded.wait(), timeout=startup_timeout)
+        startup_duration = time.perf_counter() - startup_time
+        entity_total = len(harmony_globals.active_entities)
+
+        # Like pressing the microphone key
+        user_controller = harmony_globals.active_entities[USER_ENTITY_ID]
+        await user_controller.controlsModule.toggle_record_microphone()
+
+        # Traffic
+        lag_monitor = LoopLagMonitor()
+        lag_monitor.start()
+        fan_out_latencies = []
+        missed_utterances = 0
+        for _ in range(rounds):
+            round_start = time.perf_counter()
+            latencies = await drive_round(servers, fake_link, entity_count, speech_duration, timeout=round_interval * 5)
+            fan_out_latencies.append(latencies)
+            missed_utterances += entity_count - len(latencies)
+            await asyncio.sleep(max(0.0, round_interval - (time.perf_counter() - round_start)))
+        await lag_monitor.stop()
+
+        gc.collect()
+        loaded_stats = get_process_stats()
+        # Both ends of the local connections live in this process, the server side ones are left out
+        server_side_connections = len(fake_link.sessions) + fake_vts.connections
+        vts_stats = dict(injections=fake_vts.injections, requests=dict(fake_vts.requests))
+
+        # Stop listening like the microphone key, then shut down like the plugin does
+        await user_controller.controlsModule.toggle_record_microphone()
+        harmony.shutdown()
+        # Connections are closed on their own tasks
+        pending_tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        if pending_tasks:
+            await asyncio.wait(pending_tasks, timeout=5)
+        await servers.call(fake_link.stop())
+        await servers.call(fake_vts.stop())
+    servers.stop()
+
+    all_latencies = sorted(latency for latencies in fan_out_latencies for latency in latencies)
+    last_latencies = sorted(max(latencies) for latencies in fan_out_latencies if latencies)
+
+    def per_entity(key, offset=0):
+        if loaded_stats[key] is None or baseline_stats[key] is None:
+            return None
+        return (loaded_stats[key] - baseline_stats[key] - offset) / entity_total
+
+    return {
+        'characters': entity_count,
+        'entities': entity_total,
+        'startup_seconds': startup_duration,
+        'loop_lag': lag_monitor.get_stats(),
+        'fan_out_latency': {
+            'median': all_latencies[len(all_latencies) // 2] if all_latencies else None,
+            'median_last_character': last_latencies[len(last_latencies) // 2] if last_latencies else None,
+            'max': all_latencies[-1] if all_latencies else None,
+            'missed_utterances': missed_utterances,
+        },
+        'memory_per_entity_bytes': per_entity('rss_bytes'),
+        'fds_per_entity': per_entity('open_fds', server_side_connections),
+        'os_threads_per_entity': per_entity('os_threads'),
+        'process': loaded_stats,
+        'vts': vts_stats,
+    }
+
+
+def format_milliseconds(value):
+    return '{0:.1f}'.format(value * 1e3) if value is not None else '-'
+
+
+def format_number(value, scale=1.0):
+    return '{0:.1f}'.format(value / scale) if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scene load test with many character entities')
+    parser.add_argument('--entities', type=int, nargs='+', default=[1, 5, 10, 25, 50], help='character counts to test')
+    parser.add_argument('--rounds', type=int, default=10, help='user utterances per entity count')
+    parser.add_argument('--round-interval', type=float, default=2.0, help='seconds between user utterances')
+    parser.add_argument('--startup-concurrency', type=int, default=4)
+    parser.add_argument('--audio-devices', action='store_true', help='use the real microphone and speakers')
+    parser.add_argument('--output', help='JSON file the results are written to')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    arguments = dict(
+        rounds=args.rounds,
+        round_interval=args.round_interval,
+        startup_concurrency=args.startup_concurrency,
+        audio_devices=args.audio_devices,
+    )
+    if args.child:
+        print(json.dumps(asyncio.run(run(entity_count=args.entities[0], **arguments))))
+        return
+
+    results = []
+    for entity_count in args.entities:
+        print('Running with {0} characters...'.format(entity_count), file=sys.stderr)
+        child_args = [
+            sys.executable, '-m', 'benchmarks.bench_load', '--child',
+            '--entities', str(entity_count),
+            '--rounds', str(args.rounds),
+            '--round-interval', str(args.round_interval),
+            '--startup-concurrency', str(args.startup_concurrency),
+        ]
+        if args.audio_devices:
+            child_args.append('--audio-devices')
+        child = subprocess.run(child_args, stdout=subprocess.PIPE, text=True)
+        if child.returncode != 0:
+            print('Load test with {0} characters failed'.format(entity_count), file=sys.stderr)
+            continue
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    print('characters | startup s | loop lag p99 / max ms | fan-out median / last / max ms | '
+          'MB / entity | fds / entity | threads / entity | missed')
+    for result in results:
+        loop_lag = result['loop_lag'] or {}
+        fan_out = result['fan_out_latency']
+        print('{0:>10} | {1:>9.2f} | {2:>9} / {3:<9} | {4:>8} / {5:>8} / {6:<8} | {7:>11} | {8:>12} | {9:>16} | {10}'.format(
+            result['characters'], result['startup_seconds'],
+            format_milliseconds(loop_lag.get('p99')), format_milliseconds(loop_lag.get('max')),
+            format_milliseconds(fan_out['median']), format_milliseconds(fan_out['median_last_character']),
+            format_milliseconds(fan_out['max']),
+            format_number(result['memory_per_entity_bytes'], 1024 * 1024), format_number(result['fds_per_entity']),
+            format_number(result['os_threads_per_entity']), fan_out['missed_utterances']
+        ))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'results': results}, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
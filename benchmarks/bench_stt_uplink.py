@@ -0,0 +1,177 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# STT Uplink Benchmark
+# Measures the latency from the end of speech being recorded to the transcript arriving back in the plugin,
+# for pulled and pushed microphone audio, against the fake Harmony Link.
+# In pull mode, the fetch latency is measured as well - the time from a fetch window being fully recorded
+# (or requested, if that's later) until its result arrived at Harmony Link.
+import argparse
+import asyncio
+import bisect
+import random
+import threading
+import time
+
+import harmony_globals
+from benchmarks.fake_harmony_link import FakeHarmonyLink
+from harmony_modules.common import EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE
+from harmony_modules.connector import ConnectorEventHandler
+from harmony_modules.speech_to_text import SpeechToTextHandler
+
+
+# BenchmarkEntityController - minimal entity controller providing the connector to modules
+class BenchmarkEntityController:
+    def __init__(self, entity_id, connector):
+        self.entity_id = entity_id
+        self.connector = connector
+
+
+# SyntheticMicrophoneHandler - STT module recording silence from a real time paced thread instead of a microphone
+class SyntheticMicrophoneHandler(SpeechToTextHandler):
+    def __init__(self, entity_controller, stt_config, speech_end_byte):
+        SpeechToTextHandler.__init__(self, entity_controller=entity_controller, stt_config=stt_config)
+        self.speech_end_byte = speech_end_byte
+        self.speech_end_time = None
+        self.capture_offsets = []  # bytes recorded after each captured block
+        self.capture_times = []
+        self.capture_thread = None
+        self.capturing = False
+
+    def get_microphone(self):
+        return -1, 'synthetic'
+
+    def start_continuous_recording(self):
+        self.reset_recording()
+        self.capturing = True
+        self.capture_thread = threading.Thread(target=self.capture)
+        self.capture_thread.start()
+        self.audio_stream = self.capture_thread
+        return True
+
+    async def stop_continuous_recording(self):
+        await self.stop_push(flush=False)
+        self.capturing = False
+        await asyncio.get_running_loop().run_in_executor(None, self.capture_thread.join)
+        self.audio_stream = None
+        return True
+
+    def capture(self):
+        block_frames = self.capture_sample_rate * self.record_stepping // 1000
+        block = bytes(block_frames * self.capture_channels * self.capture_bit_depth // 8)
+        next_block_time = time.perf_counter()
+        while self.capturing:
+            next_block_time += self.record_stepping / 1000
+            time.sleep(max(0.0, next_block_time - time.perf_counter()))
+            self.audio_stream_callback(block, block_frames, None, None)
+            self.capture_offsets.append(self.recording_buffer.total_written)
+            self.capture_times.append(time.perf_counter())
+            if (
+                    self.speech_end_byte is not None and self.speech_end_time is None and
+                    self.recording_buffer.total_written >= self.speech_end_byte
+            ):
+                self.speech_end_time = time.perf_counter()
+
+
+async def measure_uplink(uplink_mode, audio_transport, trials, fetch_window, push_chunk_duration, sample_rate):
+    stt_config = {
+        'auto_vad': '1',
+        'microphone': 'default',
+        'channels': '1',
+        'bit_depth': '16',
+        'sample_rate': str(sample_rate),
+        'buffer_clip_duration': '10',
+        'record_stepping': '20',
+        'audio_transport': audio_transport,
+        'uplink_mode': uplink_mode,
+        'push_chunk_duration': str(push_chunk_duration),
+    }
+    rng = random.Random(0)
+    latencies = []
+    fetch_latencies = []
+    for trial in range(trials):
+        # End of speech at a random point, so it falls into different phases of the fetch windows / push chunks
+        speech_end_byte = int(rng.uniform(0.8, 1.3) * sample_rate) * 2
+        fake_link = FakeHarmonyLink(fetch_window=fetch_window, speech_end_byte=speech_end_byte)
+        await fake_link.start()
+        connector = ConnectorEventHandler(ws_endpoint=fake_link.endpoint, shutdown_func=None)
+        connector.start()
+        await connector.wait_connected()
+
+        entity_controller = BenchmarkEntityController('user', connector)
+        handler = SyntheticMicrophoneHandler(entity_controller, stt_config, speech_end_byte)
+        handler.activate()
+        transcript_received = asyncio.get_running_loop().create_future()
+
+        def on_utterance(event):
+            if not transcript_received.done():
+                transcript_received.set_result(time.perf_counter())
+
+        harmony_globals.event_bus.subscribe(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, 'benchmark', on_utterance)
+        await handler.start_listen()
+        transcript_time = await asyncio.wait_for(transcript_received, timeout=10)
+        latencies.append(transcript_time - handler.speech_end_time)
+
+        harmony_globals.event_bus.unsubscribe_all('benchmark')
+        await handler.stop_listen()
+        connector.stop()
+        await asyncio.gather(connector.task, return_exceptions=True)
+        await fake_link.stop()
+
+        for end_byte, request_time, result_time in fake_link.fetch_log:
+            block_index = bisect.bisect_left(handler.capture_offsets, end_byte)
+            if block_index < len(handler.capture_times):
+                fetch_latencies.append(result_time - max(request_time, handler.capture_times[block_index]))
+
+    latencies.sort()
+    result = {
+        'mean_latency': sum(latencies) / len(latencies),
+        'median_latency': latencies[len(latencies) // 2],
+        'max_latency': latencies[-1],
+    }
+    if fetch_latencies:
+        fetch_latencies.sort()
+        result['mean_fetch_latency'] = sum(fetch_latencies) / len(fetch_latencies)
+        result['median_fetch_latency'] = fetch_latencies[len(fetch_latencies) // 2]
+        result['max_fetch_latency'] = fetch_latencies[-1]
+    return result
+
+
+async def run(trials=10, fetch_window=0.5, push_chunk_duration=100, sample_rate=16000, audio_transport='binary'):
+    results = {}
+    for uplink_mode in ('pull', 'push'):
+        results[uplink_mode] = await measure_uplink(
+            uplink_mode, audio_transport, trials, fetch_window, push_chunk_duration, sample_rate
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='STT uplink latency benchmark')
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--fetch-window', type=float, default=0.5, help='seconds per fetch request in pull mode')
+    parser.add_argument('--push-chunk-duration', type=int, default=100, help='milliseconds per chunk in push mode')
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    parser.add_argument('--audio-transport', choices=('base64', 'binary'), default='binary')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(
+        trials=args.trials,
+        fetch_window=args.fetch_window,
+        push_chunk_duration=args.push_chunk_duration,
+        sample_rate=args.sample_rate,
+        audio_transport=args.audio_transport,
+    ))
+    for uplink_mode, result in results.items():
+        print('{0}: end of speech -> transcript mean {1:.1f}ms, median {2:.1f}ms, max {3:.1f}ms'.format(
+            uplink_mode, result['mean_latency'] * 1e3, result['median_latency'] * 1e3, result['max_latency'] * 1e3
+        ))
+        if 'mean_fetch_latency' in result:
+            print('{0}: window recorded -> fetch result mean {1:.1f}ms, median {2:.1f}ms, max {3:.1f}ms'.format(
+                uplink_mode, result['mean_fetch_latency'] * 1e3, result['median_fetch_latency'] * 1e3,
+                result['max_fetch_latency'] * 1e3
+            ))
+
+
+if __name__ == '__main__':
+    main()
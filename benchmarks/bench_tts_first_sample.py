@@ -0,0 +1,138 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# TTS Time To First Sample Benchmark
+# Measures the time from an AI_SPEECH utterance being received to its first sample being played, for several
+# utterance lengths. Decoding and queueing use the TTS module's DecodedAudio and UtteranceQueuePlayer,
+# the output device is replaced by a real time paced thread pulling blocks from the player.
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.bench_lipsync import generate_speech_like_audio
+from harmony_modules import lipsync
+from harmony_modules.text_to_speech import DecodedAudio, UtteranceQueuePlayer
+
+
+# VirtualOutputStream - pulls fixed size blocks from the player at the pace of a sound card
+class VirtualOutputStream:
+    def __init__(self, player, sample_rate, channels, block_frames):
+        self.player = player
+        self.block_duration = block_frames / sample_rate
+        self.outdata = np.zeros((block_frames, channels), dtype=np.float32)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def run(self):
+        next_block_time = time.perf_counter()
+        while self.running:
+            self.player.fill(self.outdata, len(self.outdata))
+            next_block_time += self.block_duration
+            time.sleep(max(0.0, next_block_time - time.perf_counter()))
+
+
+async def play_utterance(player, started, audio_file, decoded_audio, received_time):
+    # Queues the utterance and returns its time to first sample once playback started, then stops it again
+    utterance = {'audio_file': audio_file, 'audio': decoded_audio, 'index': 0,
+                 'received_time': received_time, 'first_sample_time': None}
+    started.clear()
+    player.enqueue(utterance)
+    await started.wait()
+    player.clear()
+    return utterance['first_sample_time'] - received_time
+
+
+async def measure_first_sample(audio_file, player, started, lipsync_mode, sample_rate, channels, trials):
+    loop = asyncio.get_running_loop()
+    latencies = []
+    decoded_audio = None
+    for _ in range(trials):
+        # Same steps as TextToSpeechHandler.handle_event() on a cache miss
+        received_time = time.perf_counter()
+        decoded_audio = DecodedAudio(audio_file, loop, lipsync_mode, sample_rate, channels).start()
+        await decoded_audio.ready
+        latencies.append(await play_utterance(player, started, audio_file, decoded_audio, received_time))
+        # Decoding continues in the background, don't let it overlap with the next trial
+        await decoded_audio.completed
+
+    # Cache hit - the utterance is decoded already
+    cached_latencies = []
+    for _ in range(trials):
+        received_time = time.perf_counter()
+        cached_latencies.append(await play_utterance(player, started, audio_file, decoded_audio, received_time))
+
+    latencies.sort()
+    cached_latencies.sort()
+    return {
+        'median_first_sample': latencies[len(latencies) // 2],
+        'max_first_sample': latencies[-1],
+        'median_first_sample_cached': cached_latencies[len(cached_latencies) // 2],
+    }
+
+
+async def run(durations=(2.0, 30.0, 120.0), trials=5, source_sample_rate=22050, sample_rate=44100, channels=2,
+              block_frames=512, lipsync_mode=lipsync.LIPSYNC_MODE_SPECTRAL):
+    loop = asyncio.get_running_loop()
+    started = asyncio.Event()
+    player = UtteranceQueuePlayer(
+        loop=loop,
+        on_started=lambda utterance: started.set(),
+        on_finished=lambda utterance: None
+    )
+    output_stream = VirtualOutputStream(player, sample_rate, channels, block_frames)
+    output_stream.start()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for duration in durations:
+            audio_file = os.path.join(temp_dir, 'utterance_{0:g}s.wav'.format(duration))
+            sf.write(audio_file, generate_speech_like_audio(duration, source_sample_rate), source_sample_rate)
+            results[duration] = await measure_first_sample(
+                audio_file, player, started, lipsync_mode, sample_rate, channels, trials
+            )
+
+    output_stream.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TTS time to first sample benchmark')
+    parser.add_argument('--trials', type=int, default=5)
+    parser.add_argument('--source-sample-rate', type=int, default=22050, help='sample rate of the utterance files')
+    parser.add_argument('--sample-rate', type=int, default=44100, help='sample rate of the output stream')
+    parser.add_argument('--block-frames', type=int, default=512, help='frames per output stream callback')
+    parser.add_argument('--lipsync-mode', default=lipsync.LIPSYNC_MODE_SPECTRAL,
+                        choices=(lipsync.LIPSYNC_MODE_FAKE, lipsync.LIPSYNC_MODE_ENVELOPE, lipsync.LIPSYNC_MODE_SPECTRAL))
+    args = parser.parse_args()
+
+    results = asyncio.run(run(
+        trials=args.trials,
+        source_sample_rate=args.source_sample_rate,
+        sample_rate=args.sample_rate,
+        block_frames=args.block_frames,
+        lipsync_mode=args.lipsync_mode,
+    ))
+    for duration, result in results.items():
+        print('{0:>5.0f}s utterance: first sample after median {1:.1f}ms, max {2:.1f}ms, cached {3:.1f}ms'.format(
+            duration, result['median_first_sample'] * 1e3, result['max_first_sample'] * 1e3,
+            result['median_first_sample_cached'] * 1e3
+        ))
+
+
+if __name__ == '__main__':
+    main()
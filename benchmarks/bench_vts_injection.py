@@ -0,0 +1,113 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# VTS Injection Benchmark
+# Measures the parameter injection rate VTSController achieves against the fake VTube Studio API:
+# raw request rate with one or several requests in flight, and the injection rate of the parameter sink
+# while parameters are written much faster than it flushes them.
+import argparse
+import asyncio
+import time
+
+from VTSController import VTSController
+from benchmarks.fake_vts import FakeVTubeStudio
+
+# Parameters written per update, like the spectral lipsync mode does
+LIPSYNC_PARAMETERS = ('MouthOpen', 'MouthSmile', 'CheekPuff')
+
+
+async def measure_requests(vtsc, requests, concurrency):
+    round_trips = []
+
+    async def inject_worker(count):
+        for index in range(count):
+            start = time.perf_counter()
+            await vtsc.inject_params([[parameter, (index % 100) / 100] for parameter in LIPSYNC_PARAMETERS])
+            round_trips.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(inject_worker(requests // concurrency) for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+    round_trips.sort()
+    return {
+        'requests_per_second': len(round_trips) / duration,
+        'median_round_trip': round_trips[len(round_trips) // 2],
+        'max_round_trip': round_trips[-1],
+    }
+
+
+async def measure_parameter_sink(vtsc, fake_vts, duration, write_rate):
+    # Writes parameters at write_rate from the event loop, the sink injects them at its own fixed rate
+    fake_vts.reset_stats()
+    writes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        vtsc.write_parameters({parameter: (writes % 100) / 100 for parameter in LIPSYNC_PARAMETERS})
+        writes += 1
+        await asyncio.sleep(1.0 / write_rate)
+    # Let the last pending values get flushed
+    await asyncio.sleep(vtsc.parameter_update_interval * 2)
+
+    intervals = [b - a for a, b in zip(fake_vts.injection_times, fake_vts.injection_times[1:])]
+    intervals.sort()
+    return {
+        'writes_per_second': writes / duration,
+        'injections_per_second': fake_vts.injections / duration,
+        'values_per_injection': fake_vts.injected_values / max(1, fake_vts.injections),
+        'max_injection_interval': intervals[-1] if intervals else None,
+        'latest_values_delivered': all(
+            fake_vts.parameters.get(parameter) == ((writes - 1) % 100) / 100 for parameter in LIPSYNC_PARAMETERS
+        ),
+    }
+
+
+async def run(requests=2000, concurrency=16, sink_duration=2.0, write_rate=500.0, parameter_update_rate=30.0, response_delay=0.0):
+    fake_vts = FakeVTubeStudio(response_delay=response_delay)
+    await fake_vts.start()
+    vtsc = VTSController(endpoint=fake_vts.endpoint, parameter_update_rate=parameter_update_rate)
+    await vtsc.initialise()
+
+    results = {
+        'sequential': await measure_requests(vtsc, requests, 1),
+        'concurrent': await measure_requests(vtsc, requests, concurrency),
+        'parameter_sink': await measure_parameter_sink(vtsc, fake_vts, sink_duration, write_rate),
+    }
+
+    await vtsc.close()
+    await fake_vts.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VTS parameter injection benchmark')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16, help='requests in flight in the concurrent case')
+    parser.add_argument('--sink-duration', type=float, default=2.0, help='seconds of parameter writes to the sink')
+    parser.add_argument('--write-rate', type=float, default=500.0, help='parameter writes per second to the sink')
+    parser.add_argument('--parameter-update-rate', type=float, default=30.0)
+    parser.add_argument('--response-delay', type=float, default=0.0, help='seconds the fake VTube Studio delays replies')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(
+        requests=args.requests,
+        concurrency=args.concurrency,
+        sink_duration=args.sink_duration,
+        write_rate=args.write_rate,
+        parameter_update_rate=args.parameter_update_rate,
+        response_delay=args.response_delay,
+    ))
+    for mode in ('sequential', 'concurrent'):
+        result = results[mode]
+        print('{0:>10}: {1:.0f} injections/s, round trip median {2:.2f}ms, max {3:.2f}ms'.format(
+            mode, result['requests_per_second'], result['median_round_trip'] * 1e3, result['max_round_trip'] * 1e3
+        ))
+    result = results['parameter_sink']
+    print('parameter sink: {0:.0f} writes/s -> {1:.1f} injections/s with {2:.1f} values each, '
+          'max interval {3:.1f}ms, latest values delivered: {4}'.format(
+            result['writes_per_second'], result['injections_per_second'], result['values_per_injection'],
+            (result['max_injection_interval'] or 0.0) * 1e3, result['latest_values_delivered']
+          ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Fake Harmony Link
+# Local stand-in for Harmony Link's event backend, speaking the event protocol from harmony_modules/common.py.
+# It answers the plugin's requests right away and emulates the STT pipeline: microphone audio is pulled
+# via STT_FETCH_MICROPHONE or received via STT_INPUT_AUDIO, and once the audio up to a configured
+# end-of-speech offset has arrived, a transcript is sent back as STT_OUTPUT_TEXT.
+# Optionally every USER_UTTERANCE is answered with an AI_SPEECH event playing a given audio file,
+# and events can be sent to the sessions of specific entities to drive a scene.
+import asyncio
+import logging
+import time
+
+import websockets
+
+from harmony_modules import codec
+from harmony_modules.common import *
+
+
+# FakeHarmonyLink - websocket server accepting any number of plugin connections
+class FakeHarmonyLink:
+    def __init__(
+            self,
+            host='127.0.0.1',
+            port=0,
+            audio_transports=('base64', 'binary'),
+            uplink_modes=('pull', 'push'),
+            audio_codecs=('pcm', 'flac', 'ogg'),
+            local_vad_modes=('off', 'mark', 'skip'),
+            fetch_window=0.5,
+            speech_end_byte=None,
+            vad_hangover=0.0,
+            transcript='Hello there!',
+            ai_speech_file=None
+    ):
+        self.host = host
+        self.port = port
+        # Features confirmed when the plugin requests them in STT_START_LISTEN
+        self.audio_transports = audio_transports
+        self.uplink_modes = uplink_modes
+        self.audio_codecs = audio_codecs
+        self.local_vad_modes = local_vad_modes
+        # STT emulation
+        self.fetch_window = fetch_window  # seconds of audio per STT_FETCH_MICROPHONE request in pull mode
+        self.speech_end_byte = speech_end_byte  # offset at which the emulated speaker stops talking
+        self.vad_hangover = vad_hangover  # seconds of silence required after the end of speech
+        self.transcript = transcript
+        # AI emulation - audio file sent back as AI_SPEECH for every USER_UTTERANCE, None = no reply
+        self.ai_speech_file = ai_speech_file
+        self.server = None
+        self.sessions = []
+        # Statistics across all sessions
+        self.events_received = 0
+        self.fetch_log = []  # (window end byte, request time, result time) per STT_FETCH_MICROPHONE in pull mode
+        self.utterance_log = []  # (entity id, receive time) per USER_UTTERANCE
+
+    @property
+    def endpoint(self):
+        return 'ws://{0}:{1}'.format(self.host, self.port)
+
+    async def start(self):
+        self.server = await websockets.serve(self.handle_connection, self.host, self.port, max_size=None)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def get_session(self, entity_id):
+        for session in self.sessions:
+            if session.entity_id == entity_id:
+                return session
+        return None
+
+    async def send_to_entity(self, entity_id, event):
+        # Sends an event to the connection which initialized the given entity, returns False if there is none
+        session = self.get_session(entity_id)
+        if session is None:
+            return False
+        await session.send_event(event)
+        return True
+
+    async def handle_connection(self, websocket):
+        session = FakeLinkSession(self, websocket)
+        self.sessions.append(session)
+        try:
+            await session.run()
+        finally:
+            session.stop_fetching()
+            self.sessions.remove(session)
+
+
+# FakeLinkSession - state of a single plugin connection
+class FakeLinkSession:
+    def __init__(self, server, websocket):
+        self.server = server
+        self.websocket = websocket
+        self.entity_id = None  # set by INIT_ENTITY
+        self.listen_config = None
+        self.received_bytes = 0  # end offset of the contiguous microphone audio received
+        self.transcript_sent = False
+        self.fetch_task = None
+        self.fetch_results = {}  # event id -> future
+        self.fetch_sequence = 0
+        self.events_received = 0
+
+    async def run(self):
+        async for message in self.websocket:
+            self.events_received += 1
+            self.server.events_received += 1
+            try:
+                if isinstance(message, bytes):
+                    event = codec.decode_binary_event(message)
+                else:
+                    event = codec.decode_event(message)
+            except ValueError as e:
+                logging.error(f'Fake Harmony Link: Invalid message: {e}')
+                continue
+            await self.handle_event(event)
+
+    async def send_event(self, event):
+        await self.websocket.send(codec.encode_event(event))
+
+    async def reply(self, event, payload=None):
+        await self.send_event(HarmonyLinkEvent(
+            event_id=event.event_id,
+            event_type=event.event_type,
+            status=EVENT_STATE_DONE,
+            payload=payload if payload is not None else {}
+        ))
+
+    async def handle_event(self, event):
+        if event.event_type == EVENT_TYPE_STT_START_LISTEN and event.status == EVENT_STATE_NEW:
+            await self.start_listen(event)
+        elif event.event_type == EVENT_TYPE_STT_STOP_LISTEN and event.status == EVENT_STATE_NEW:
+            self.stop_fetching()
+            self.listen_config = None
+            await self.reply(event)
+        elif event.event_type == EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT:
+            result_future = self.fetch_results.pop(event.event_id, None)
+            if result_future is not None and not result_future.done():
+                result_future.set_result(event)
+        elif event.event_type == EVENT_TYPE_STT_INPUT_AUDIO:
+            await self.receive_audio(event.payload['start_byte'], event.payload['bytes_count'])
+        elif event.event_type == EVENT_TYPE_USER_UTTERANCE and event.status == EVENT_STATE_NEW:
+            self.server.utterance_log.append((self.entity_id, time.perf_counter()))
+            await self.reply(event, payload=event.payload)
+            if self.server.ai_speech_file is not None:
+                await self.send_event(HarmonyLinkEvent(
+                    event_id='ai_speech_{0}'.format(len(self.server.utterance_log)),
+                    event_type=EVENT_TYPE_AI_SPEECH,
+                    status=EVENT_STATE_DONE,
+                    payload={'type': UTTERANCE_VERBAL, 'content': self.server.transcript, 'audio_file': self.server.ai_speech_file}
+                ))
+        elif event.status == EVENT_STATE_NEW:
+            if event.event_type == EVENT_TYPE_INIT_ENTITY:
+                self.entity_id = event.payload.get('entity_id')
+            # Everything else gets acknowledged, e.g. INIT_ENTITY or ENVIRONMENT_LOADED
+            await self.reply(event, payload=event.payload)
+
+    async def start_listen(self, event):
+        requested = event.payload
+        self.listen_config = {
+            'audio_transport': requested.get('audio_transport') if requested.get('audio_transport') in self.server.audio_transports else 'base64',
+            'uplink_mode': requested.get('uplink_mode') if requested.get('uplink_mode') in self.server.uplink_modes else 'pull',
+            'audio_codec': requested.get('audio_codec') if requested.get('audio_codec') in self.server.audio_codecs else 'pcm',
+            'local_vad': requested.get('local_vad') if requested.get('local_vad') in self.server.local_vad_modes else 'off',
+            'bytes_per_second': requested['sample_rate'] * requested['channels'] * requested['bit_depth'] // 8,
+            'frame_bytes': requested['channels'] * requested['bit_depth'] // 8,
+        }
+        self.received_bytes = 0
+        self.transcript_sent = False
+        await self.reply(event, payload={
+            'audio_transport': self.listen_config['audio_transport'],
+            'uplink_mode': self.listen_config['uplink_mode'],
+            'audio_codec': self.listen_config['audio_codec'],
+            'local_vad': self.listen_config['local_vad'],
+        })
+        if self.listen_config['uplink_mode'] == 'pull' and requested.get('auto_vad'):
+            self.stop_fetching()
+            self.fetch_task = asyncio.create_task(self.fetch_loop())
+
+    def stop_fetching(self):
+        if self.fetch_task is not None:
+            self.fetch_task.cancel()
+            self.fetch_task = None
+
+    async def fetch_loop(self):
+        # Requests consecutive windows like Harmony Link's auto VAD, the next one after the previous result arrived
+        window_bytes = int(self.server.fetch_window * self.listen_config['bytes_per_second'])
+        window_bytes -= window_bytes % self.listen_config['frame_bytes']
+        start_byte = 0
+        while True:
+            event_id = 'fetch_{0}'.format(self.fetch_sequence)
+            self.fetch_sequence += 1
+            result_future = asyncio.get_running_loop().create_future()
+            self.fetch_results[event_id] = result_future
+            request_time = time.perf_counter()
+            await self.send_event(HarmonyLinkEvent(
+                event_id=event_id,
+                event_type=EVENT_TYPE_STT_FETCH_MICROPHONE,
+                status=EVENT_STATE_DONE,
+                payload={'start_byte': start_byte, 'bytes_count': window_bytes}
+            ))
+            await result_future
+            self.server.fetch_log.append((start_byte + window_bytes, request_time, time.perf_counter()))
+            # The result covers the requested window, even if its audio was skipped or compressed
+            await self.receive_audio(start_byte, window_bytes)
+            start_byte += window_bytes
+
+    async def receive_audio(self, start_byte, bytes_count):
+        if start_byte <= self.received_bytes:
+            self.received_bytes = max(self.received_bytes, start_byte + bytes_count)
+
+        # Emulated VAD + transcription - done once the end of speech and the hangover after it arrived
+        if self.server.speech_end_byte is None or self.transcript_sent or self.listen_config is None:
+            return
+        hangover_bytes = int(self.server.vad_hangover * self.listen_config['bytes_per_second'])
+        if self.received_bytes >= self.server.speech_end_byte + hangover_bytes:
+            self.transcript_sent = True
+            await self.send_event(HarmonyLinkEvent(
+                event_id='stt_output_{0}'.format(self.fetch_sequence),
+                event_type=EVENT_TYPE_STT_OUTPUT_TEXT,
+                status=EVENT_STATE_DONE,
+                payload={'type': UTTERANCE_VERBAL, 'content': self.server.transcript}
+            ))
@@ -0,0 +1,104 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Fake VTube Studio
+# Local stand-in for the VTube Studio public API, answering the requests used by VTSController:
+# APIStateRequest, AuthenticationTokenRequest, AuthenticationRequest and InjectParameterDataRequest.
+# Injected parameter values are recorded, so benchmarks can check what actually reached the model.
+import asyncio
+import json
+import time
+
+import websockets
+
+
+# FakeVTubeStudio - websocket server accepting any number of plugin connections
+class FakeVTubeStudio:
+    def __init__(self, host='127.0.0.1', port=0, authenticated=True, token='fake-vts-token', response_delay=0.0):
+        self.host = host
+        self.port = port
+        # New sessions start authenticated by default, so VTSController doesn't request and store a token
+        self.authenticated = authenticated
+        self.token = token
+        self.response_delay = response_delay  # seconds added to every reply, emulating a busy VTube Studio
+        self.server = None
+        self.connections = 0
+        # Statistics across all connections
+        self.requests = {}  # message type -> count
+        self.injections = 0
+        self.injected_values = 0
+        self.injection_times = []
+        self.parameters = {}  # parameter id -> last injected value
+
+    @property
+    def endpoint(self):
+        return 'ws://{0}:{1}'.format(self.host, self.port)
+
+    async def start(self):
+        self.server = await websockets.serve(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def reset_stats(self):
+        self.requests = {}
+        self.injections = 0
+        self.injected_values = 0
+        self.injection_times = []
+
+    async def handle_connection(self, websocket):
+        self.connections += 1
+        session_authenticated = self.authenticated
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                message_type = request.get('messageType')
+                self.requests[message_type] = self.requests.get(message_type, 0) + 1
+
+                response_type, data = self.handle_request(message_type, request.get('data') or {}, session_authenticated)
+                if message_type == 'AuthenticationRequest':
+                    session_authenticated = data['authenticated']
+
+                if self.response_delay > 0:
+                    await asyncio.sleep(self.response_delay)
+                await websocket.send(json.dumps({
+                    'apiName': 'VTubeStudioPublicAPI',
+                    'apiVersion': '1.0',
+                    'timestamp': int(time.time() * 1000),
+                    'requestID': request.get('requestID'),
+                    'messageType': response_type,
+                    'data': data,
+                }))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.connections -= 1
+
+    def handle_request(self, message_type, data, session_authenticated):
+        if message_type == 'APIStateRequest':
+            return 'APIStateResponse', {
+                'active': True,
+                'vTubeStudioVersion': 'fake',
+                'currentSessionAuthenticated': session_authenticated,
+            }
+        if message_type == 'AuthenticationTokenRequest':
+            return 'AuthenticationTokenResponse', {'authenticationToken': self.token}
+        if message_type == 'AuthenticationRequest':
+            authenticated = data.get('authenticationToken') == self.token
+            return 'AuthenticationResponse', {
+                'authenticated': authenticated,
+                'reason': 'Token valid.' if authenticated else 'Token invalid.',
+            }
+        if message_type == 'InjectParameterDataRequest':
+            if not session_authenticated:
+                return 'APIError', {'errorID': 8, 'message': 'Plugin is not authenticated.'}
+            parameter_values = data.get('parameterValues', [])
+            self.injections += 1
+            self.injected_values += len(parameter_values)
+            self.injection_times.append(time.perf_counter())
+            for parameter in parameter_values:
+                self.parameters[parameter['id']] = parameter['value']
+            return 'InjectParameterDataResponse', {}
+        return 'APIError', {'errorID': 1, 'message': 'Unknown message type: {0}'.format(message_type)}
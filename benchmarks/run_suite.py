@@ -0,0 +1,126 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Benchmark Suite Runner
+# Runs the benchmarks against the local fake Harmony Link / VTube Studio servers and writes all results into one
+# JSON file, e.g. `python -m benchmarks.run_suite --output results.json --baseline baseline.json`.
+# Numeric results are compared against a previous run if a baseline file is given.
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+
+# Benchmark name -> (module, run() arguments for a full run, run() arguments for a quick run)
+BENCHMARKS = {
+    'connector_throughput': ('benchmarks.bench_connector_throughput', {}, {'events': 1000}),
+    'connector_dispatch': ('benchmarks.bench_connector_dispatch', {}, {'iterations': 2000}),
+    'vts_injection': ('benchmarks.bench_vts_injection', {}, {'requests': 500, 'sink_duration': 1.0}),
+    'stt_uplink': ('benchmarks.bench_stt_uplink', {}, {'trials': 3}),
+    'tts_first_sample': ('benchmarks.bench_tts_first_sample', {}, {'durations': (2.0, 30.0), 'trials': 3}),
+    'codec': ('benchmarks.bench_codec', {}, {'min_duration': 0.1}),
+    'audio_transport': ('benchmarks.bench_audio_transport', {}, {'min_duration': 0.1}),
+    'audio_codec': ('benchmarks.bench_audio_codec', {}, {'duration': 5.0}),
+    'lipsync': ('benchmarks.bench_lipsync', {}, {'duration': 30.0, 'repeats': 1}),
+}
+
+
+def run_benchmark(module_name, arguments):
+    module = importlib.import_module(module_name)
+    if asyncio.iscoroutinefunction(module.run):
+        return asyncio.run(module.run(**arguments))
+    return module.run(**arguments)
+
+
+def get_git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def to_json(value):
+    # numpy scalars and other non-JSON numbers
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def flatten_numbers(results, prefix=''):
+    # Maps dotted result paths onto their numeric values, e.g. 'stt_uplink.push.mean_latency'
+    numbers = {}
+    for key, value in results.items():
+        path = '{0}.{1}'.format(prefix, key) if prefix else str(key)
+        if isinstance(value, dict):
+            numbers.update(flatten_numbers(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            numbers[path] = value
+    return numbers
+
+
+def compare(results, baseline_results):
+    current = flatten_numbers(results)
+    baseline = flatten_numbers(baseline_results)
+    for path, value in current.items():
+        baseline_value = baseline.get(path)
+        if baseline_value is None:
+            continue
+        change = (value - baseline_value) / baseline_value if baseline_value != 0 else 0.0
+        print('{0:<60} {1:>14.6g} -> {2:<14.6g} {3:+.1%}'.format(path, baseline_value, value, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Harmony Link plugin benchmark suite')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file the results are written to')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run, default all')
+    parser.add_argument('--quick', action='store_true', help='shorter runs, for smoke testing')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {}
+    errors = {}
+    for name in args.only or BENCHMARKS:
+        module_name, arguments, quick_arguments = BENCHMARKS[name]
+        print('Running {0}...'.format(name))
+        start = time.perf_counter()
+        try:
+            results[name] = run_benchmark(module_name, quick_arguments if args.quick else arguments)
+        except Exception as e:
+            # e.g. audio libraries missing on this machine, the remaining benchmarks still run
+            logging.error('Benchmark {0} failed: {1}'.format(name, e))
+            errors[name] = str(e)
+        print('{0} done after {1:.1f}s'.format(name, time.perf_counter() - start))
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_revision': get_git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': results,
+        'errors': errors,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2, default=to_json)
+    print('Results written to {0}'.format(args.output))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline_report = json.load(baseline_file)
+        print('Changes against baseline {0} ({1}):'.format(args.baseline, baseline_report.get('git_revision')))
+        # Round trip through JSON, so keys compare the same way as in the baseline
+        compare(json.loads(json.dumps(results, default=to_json)), baseline_report['results'])
+
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
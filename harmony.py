@@ -7,25 +7,33 @@
 #
 import asyncio
 import configparser
+import functools
 import logging
 import os
+import time
 
 import harmony_globals
 from VTSController import VTSController
 from harmony_modules import connector, common, text_to_speech, speech_to_text, \
-    perception, controls  # , backend, countenance, movement
+    perception, controls, metrics, profiling  # , backend, countenance, movement
 from harmony_modules.common import EVENT_TYPE_INIT_ENTITY
 
 # Config
 _config = None
 
 _syncLock = asyncio.Lock()
+# Scene setup, started once all entities are initialized on Harmony Link
+_post_init_task = None
 
 
 # EntityInitHandler
 class EntityInitHandler(common.HarmonyClientModuleBase):
     global _syncLock
 
+    event_subscriptions = {
+        EVENT_TYPE_INIT_ENTITY: None,
+    }
+
     def __init__(self, entity_controller, entity_id):
         super().__init__(entity_controller=entity_controller)
         self.entity_id = entity_id
@@ -43,23 +51,11 @@ class EntityInitHandler(common.HarmonyClientModuleBase):
                 else:
                     harmony_globals.failed_entities.append(self.entity_id)
 
-                # Check for init done condition
-                await self.check_init_done()
+                # Check for init done condition, the scene setup runs on its own task
+                _check_init_done()
                 # Disable this handler, it is not needed anymore after init
                 self.deactivate()
 
-    async def check_init_done(self):
-        logging.debug("Ready entities: {}".format(len(harmony_globals.ready_entities)))
-        logging.debug("Failed entities: {}".format(len(harmony_globals.failed_entities)))
-        logging.debug("Active entities: {}".format(len(harmony_globals.active_entities)))
-
-        if len(harmony_globals.ready_entities) + len(harmony_globals.failed_entities) == len(harmony_globals.active_entities):
-            if len(harmony_globals.failed_entities) == 0:
-                # Entity Initialization done - start VTS routines
-                await post_init()
-            else:
-                _error_abort('Harmony Link: Entity Initialization failed.')
-
 
 # Chara - Internal representation for a chara actor
 class Chara:
@@ -68,6 +64,11 @@ class Chara:
 
 
 class EntityController:
+    # Module implementations, can be replaced in subclasses, e.g. for running without audio devices
+    stt_module_class = speech_to_text.SpeechToTextHandler
+    tts_module_class = text_to_speech.TextToSpeechHandler
+    controls_module_class = controls.ControlsHandler
+
     def __init__(self, entity_id, config):
         # Flow Control
         self.active = False
@@ -104,18 +105,25 @@ class EntityController:
                 'entity_id': self.entity_id
             }
         )
-        init_send_success = await self.connector.send_event(init_event)
+        # Replayed automatically if the connection to Harmony Link gets re-established
+        init_send_success = await self.connector.send_event(init_event, replay_on_reconnect=True)
         if init_send_success:
             logging.debug('Harmony Link: Initializing entity \'{0}\'...'.format(self.entity_id))
         else:
             raise RuntimeError('Harmony Link: Failed to send entity initialize Event for entity \'{0}\'.'.format(self.entity_id))
 
     # init_modules initializes all the interfaces and handlers needed by harmony_modules
-    async def init_modules(self):
+    def init_modules(self):
         # Init comms module for interfacing with external helper binaries
         self.connector = connector.ConnectorEventHandler(
             ws_endpoint=self.config.get('Connector', 'ws_endpoint'),
             shutdown_func=shutdown,  # -> A hard error with a single entity should cause the whole plugin to shut down.
+            handler_queue_size=int(self.config.get('Connector', 'handler_queue_size', fallback=256)),
+            outbound_buffer_size=int(self.config.get('Connector', 'outbound_buffer_size', fallback=1000)),
+            reconnect_base_delay=float(self.config.get('Connector', 'reconnect_base_delay', fallback=0.5)),
+            reconnect_max_delay=float(self.config.get('Connector', 'reconnect_max_delay', fallback=30)),
+            max_reconnect_attempts=int(self.config.get('Connector', 'max_reconnect_attempts', fallback=0)),
+            entity_id=self.entity_id,
         )
         self.connector.start()
 
@@ -127,7 +135,7 @@ class EntityController:
         # self.backendModule.activate()
 
         # Init Module for Audio Recording / Streaming + Player Speech-To-Text
-        self.sttModule = speech_to_text.SpeechToTextHandler(
+        self.sttModule = self.stt_module_class(
             entity_controller=self,
             stt_config=dict(self.config.items('STT'))
         )
@@ -140,11 +148,13 @@ class EntityController:
         # self.countenanceModule.activate()
 
         # Init Module for AI Voice Streaming + Audio-2-LipSync
-        self.ttsModule = text_to_speech.TextToSpeechHandler(
+        self.ttsModule = self.tts_module_class(
             entity_controller=self,
             tts_config=dict(self.config.items('TTS'))
         )
-        self.ttsModule.activate()
+        # Only characters speak, the user entity doesn't need to keep an output stream open
+        if self.entity_id != harmony_globals.user_controlled_entity_id:
+            self.ttsModule.activate()
 
         # Init Module for AI Roleplay to Animation
         # self.movementModule = movement.MovementHandler(
@@ -161,7 +171,7 @@ class EntityController:
         self.perceptionModule.activate()
 
         # Init User Controls Module
-        self.controlsModule = controls.ControlsHandler(
+        self.controlsModule = self.controls_module_class(
             entity_controller=self,
             shutdown_func=shutdown,
             controls_keymap_config=dict(self.config.items('Controls.Keymap'))
@@ -184,24 +194,55 @@ class EntityController:
         # self.movementModule.update_chara(self.chara)
 
     def shutdown_modules(self):
+        # Modules may be missing if the entity failed during bring-up
         # self.backendModule.deactivate()
-        self.sttModule.deactivate()
-        self.ttsModule.deactivate()
+        if self.sttModule is not None:
+            self.sttModule.deactivate()
+        if self.ttsModule is not None:
+            self.ttsModule.deactivate()
         # self.countenanceModule.deactivate()
         # self.movementModule.deactivate()
-        self.controlsModule.deactivate()
-        self.connector.stop()
+        if self.controlsModule is not None:
+            self.controlsModule.deactivate()
+        if self.connector is not None:
+            self.connector.stop()
+        # Close VTS API connection
+        if self.chara is not None:
+            asyncio.create_task(self.chara.controller.close())
 
 
-async def start_harmony_ai():
+async def start_harmony_ai(config=None, entity_controller_class=EntityController):
     global _config
 
-    # Read Config data from .ini file
-    _config = load_config()
+    # Read Config data from .ini file, unless given already
+    _config = config if config is not None else load_config()
 
     # Actual Plugin Initialization
     logging.info("Initializing VTS-Plugin for Harmony Link")
 
+    # Optional metrics endpoint, started first so startup can be observed as well
+    if _config.getboolean('Metrics', 'enabled', fallback=False):
+        harmony_globals.metrics_server = metrics.MetricsServer(
+            metrics_registry=metrics.registry,
+            host=_config.get('Metrics', 'host', fallback='127.0.0.1'),
+            port=int(_config.get('Metrics', 'port', fallback=9464))
+        )
+        try:
+            await harmony_globals.metrics_server.start()
+        except OSError as e:
+            logging.warning(f'Failed to start metrics endpoint: {e}')
+            harmony_globals.metrics_server = None
+
+    # Optional on-demand profiling, controlled via signals and the metrics endpoint
+    if _config.getboolean('Profiling', 'enabled', fallback=False):
+        harmony_globals.profiler = profiling.Profiler(
+            output_dir=_config.get('Profiling', 'output_dir', fallback='profiles'),
+            top_entries=int(_config.get('Profiling', 'top_entries', fallback=profiling.DEFAULT_TOP_ENTRIES))
+        )
+        harmony_globals.profiler.install_signal_handlers()
+        if harmony_globals.metrics_server is not None:
+            harmony_globals.profiler.add_routes(harmony_globals.metrics_server)
+
     # Scene Config - contains references for characters and objects
     scene_config = dict(_config.items('Scene'))
 
@@ -215,15 +256,13 @@ async def start_harmony_ai():
         _error_abort('Harmony Plugin: Character entity id/list is invalid.')
         return False
 
+    # Entities are brought up concurrently, limited to avoid overloading Harmony Link & VTS during startup
+    startup_concurrency = int(_config.get('Harmony', 'startup_concurrency', fallback=4))
+    startup_time = time.perf_counter()
+
     # Setup user entity
     user_entity_id = scene_config["user_entity_id"].strip()
-    controller = EntityController(entity_id=user_entity_id, config=_config)
-    # Initialize Client modules
-    await controller.init_modules()
-    # Create Startup Init handler
-    controller.create_startup_handler()
-    # Add to character list
-    harmony_globals.active_entities[user_entity_id] = controller
+    harmony_globals.active_entities[user_entity_id] = entity_controller_class(entity_id=user_entity_id, config=_config)
     harmony_globals.user_controlled_entity_id = user_entity_id
 
     # Setup character entities
@@ -231,30 +270,115 @@ async def start_harmony_ai():
     for entity_id in character_list:
         # Create entity controller for characters
         entity_id = entity_id.strip()
-        controller = EntityController(entity_id=entity_id, config=_config)
-        # Initialize Client modules
-        await controller.init_modules()
-        # Create Startup Init handler
-        controller.create_startup_handler()
-        # Add to character list
-        harmony_globals.active_entities[entity_id] = controller
-
-    # Warmup time to allow for the backend threads to connect to the websocket server
-    warmup_time = int(_config.get('Harmony', 'start_warmup_time'))
-    await asyncio.sleep(warmup_time)
+        harmony_globals.active_entities[entity_id] = entity_controller_class(entity_id=entity_id, config=_config)
 
-    # Initialize Entities on Harmony Link
+    # Initialize Client modules - this doesn't wait for anything, so entities are set up one after the other
+    failed_entities = []
     for entity_id, controller in harmony_globals.active_entities.items():
         try:
-            await controller.activate()
-        except RuntimeError as e:
-            _error_abort(f"Initialization on Harmony Link failed for entity '{entity_id}': {e}")
+            controller.init_modules()
+        except Exception as e:
+            logging.error(f"Module initialization failed for entity '{entity_id}': {e}")
+            failed_entities.append(entity_id)
+    if not _deactivate_failed_entities('Module initialization', failed_entities):
+        return False
+
+    # Create Startup Init handlers
+    for controller in harmony_globals.active_entities.values():
+        controller.create_startup_handler()
+
+    # Wait until all entities are connected to the websocket server
+    connect_timeout = float(_config.get('Harmony', 'start_connect_timeout', fallback=10))
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(controller.connector.wait_connected() for controller in harmony_globals.active_entities.values())),
+            timeout=connect_timeout
+        )
+    except asyncio.TimeoutError:
+        pending_entities = [entity_id for entity_id, controller in harmony_globals.active_entities.items()
+                            if not controller.connector.connected.is_set()]
+        logging.error(f"Harmony Link: Entities failed to connect within {connect_timeout}s: {', '.join(pending_entities)}")
+        if not _deactivate_failed_entities('Connecting to Harmony Link', pending_entities):
             return False
+    for entity_id, controller in harmony_globals.active_entities.items():
+        logging.info("Harmony Link: Entity '{0}' connected after {1:.0f} ms".format(entity_id, controller.connector.connect_duration * 1000))
+
+    # Initialize Entities on Harmony Link
+    failed_entities = await _bring_up_entities(
+        stage='Initialization on Harmony Link',
+        entity_tasks={entity_id: controller.activate for entity_id, controller in harmony_globals.active_entities.items()},
+        concurrency=startup_concurrency
+    )
+    if not _deactivate_failed_entities('Initialization on Harmony Link', failed_entities):
+        return False
+    if len(failed_entities) > 0:
+        # The remaining entities might all have reported their init result already
+        async with _syncLock:
+            _check_init_done()
 
     # Launched successfully
+    logging.info('Harmony Plugin: Startup of {0} entities took {1:.0f} ms'.format(
+        len(harmony_globals.active_entities), (time.perf_counter() - startup_time) * 1000))
     return True
 
 
+async def _bring_up_entities(stage, entity_tasks, concurrency):
+    # Runs one bring-up stage for all entities concurrently, with at most `concurrency` entities at a time.
+    # A failing entity doesn't interrupt the others, failures are returned as a dict of entity id -> error.
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bring_up(entity_id, task_func):
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                await task_func()
+            except Exception as e:
+                logging.error(f"{stage} failed for entity '{entity_id}': {e}")
+                return entity_id, e
+            logging.info("{0} for entity '{1}' took {2:.0f} ms".format(stage, entity_id, (time.perf_counter() - start_time) * 1000))
+            return entity_id, None
+
+    results = await asyncio.gather(*(bring_up(entity_id, task_func) for entity_id, task_func in entity_tasks.items()))
+    return {entity_id: error for entity_id, error in results if error is not None}
+
+
+def _deactivate_failed_entities(stage, failed_entities):
+    # Failed entities are shut down on their own, the rest of the scene keeps going.
+    # Returns False if the scene can't continue, which is when the user entity or all characters failed
+    for entity_id in failed_entities:
+        logging.warning(f"{stage} failed for entity '{entity_id}', deactivating it")
+        harmony_globals.active_entities.pop(entity_id).shutdown_modules()
+
+    if harmony_globals.user_controlled_entity_id in failed_entities:
+        _error_abort(f"{stage} failed for the user entity '{harmony_globals.user_controlled_entity_id}'.")
+        return False
+    if len(harmony_globals.active_entities) <= 1:
+        _error_abort(f"{stage} failed for all character entities.")
+        return False
+    return True
+
+
+def _check_init_done():
+    # Starts the scene setup once all remaining entities reported their init result, failed ones get deactivated.
+    # It isn't awaited here, e.g. the VTS token prompt may take minutes and would block the init handlers meanwhile
+    global _post_init_task
+    if _post_init_task is not None:
+        return
+    reported_entities = [entity_id for entity_id in harmony_globals.ready_entities + harmony_globals.failed_entities
+                         if entity_id in harmony_globals.active_entities]
+    logging.debug("Ready entities: {}".format(len(harmony_globals.ready_entities)))
+    logging.debug("Failed entities: {}".format(len(harmony_globals.failed_entities)))
+    logging.debug("Active entities: {}".format(len(harmony_globals.active_entities)))
+    if len(reported_entities) < len(harmony_globals.active_entities):
+        return
+
+    failed_entities = [entity_id for entity_id in harmony_globals.failed_entities if entity_id in harmony_globals.active_entities]
+    if not _deactivate_failed_entities('Entity initialization on Harmony Link', failed_entities):
+        return
+    # Entity Initialization done - start VTS routines
+    _post_init_task = asyncio.create_task(post_init())
+
+
 async def post_init():
     global _config
 
@@ -262,40 +386,53 @@ async def post_init():
     vts_config = dict(_config.items('VTS'))
 
     # Link VTS Controller with Entity controller
-    for entity_id, controller in harmony_globals.active_entities.items():
-
-        # Initialize controls module and STT module if it's the user entity
-        if entity_id == harmony_globals.user_controlled_entity_id:
-            controller.controlsModule.activate()
-            controller.sttModule.activate()
-        else:
-            # Setup VTS Plugin Controller for Entity and set initial values
-            vtsc = VTSController(
-                endpoint=vts_config["endpoint"].strip(),
-                plugin_name=f"Harmony-Link-Plugin-{entity_id}",
-            )
-            try:
-                await vtsc.initialise()
-                chara = Chara(controller=vtsc)
-                await chara.controller.set_mouth_open(0)
-                # Update all controller modules with new chara actor
-                controller.update_chara(chara)
-            except Exception as e:
-                _error_abort(f"Initialization on VTS failed for entity '{entity_id}': {e}")
-                return
-
-        # Inform Harmony Link that the scene finished loading for this Entity
-        environment_loaded_event = common.HarmonyLinkEvent(
-            event_id='environment_loaded',
-            event_type=common.EVENT_TYPE_ENVIRONMENT_LOADED,
-            status=common.EVENT_STATE_NEW,
-            payload={}
+    startup_concurrency = int(_config.get('Harmony', 'startup_concurrency', fallback=4))
+    failed_entities = await _bring_up_entities(
+        stage='Scene setup',
+        entity_tasks={
+            entity_id: functools.partial(_setup_entity_scene, entity_id, controller, vts_config)
+            for entity_id, controller in harmony_globals.active_entities.items()
+        },
+        concurrency=startup_concurrency
+    )
+    if _deactivate_failed_entities('Scene setup', failed_entities):
+        harmony_globals.scene_loaded.set()
+
+
+async def _setup_entity_scene(entity_id, controller, vts_config):
+    # Initialize controls module and STT module if it's the user entity
+    if entity_id == harmony_globals.user_controlled_entity_id:
+        controller.controlsModule.activate()
+        controller.sttModule.activate()
+    else:
+        # Setup VTS Plugin Controller for Entity and set initial values
+        vtsc = VTSController(
+            endpoint=vts_config["endpoint"].strip(),
+            plugin_name=f"Harmony-Link-Plugin-{entity_id}",
+            parameter_update_rate=float(vts_config.get("parameter_update_rate", 30)),
+            entity_id=entity_id,
         )
-        send_success = await controller.connector.send_event(environment_loaded_event)
-        if send_success:
-            logging.info('Harmony Link: Scene Data finished loading for entity "{0}"'.format(entity_id))
-        else:
-            logging.warning('Harmony Link: Failed to transmit scene loading finished for entity "{0}"'.format(entity_id))
+        try:
+            await vtsc.initialise()
+            chara = Chara(controller=vtsc)
+            await chara.controller.set_mouth_open(0)
+            # Update all controller modules with new chara actor
+            controller.update_chara(chara)
+        except Exception as e:
+            raise RuntimeError(f"Initialization on VTS failed: {e}")
+
+    # Inform Harmony Link that the scene finished loading for this Entity
+    environment_loaded_event = common.HarmonyLinkEvent(
+        event_id='environment_loaded',
+        event_type=common.EVENT_TYPE_ENVIRONMENT_LOADED,
+        status=common.EVENT_STATE_NEW,
+        payload={}
+    )
+    send_success = await controller.connector.send_event(environment_loaded_event, replay_on_reconnect=True)
+    if send_success:
+        logging.info('Harmony Link: Scene Data finished loading for entity "{0}"'.format(entity_id))
+    else:
+        logging.warning('Harmony Link: Failed to transmit scene loading finished for entity "{0}"'.format(entity_id))
 
 
 def _error_abort(error):
@@ -315,3 +452,12 @@ def shutdown():
     # Shutdown all Entities
     for controller in harmony_globals.active_entities.values():
         controller.shutdown_modules()
+    # Write a CPU profile still running
+    if harmony_globals.profiler is not None:
+        harmony_globals.profiler.remove_signal_handlers()
+        asyncio.create_task(harmony_globals.profiler.stop_cpu_profile())
+        harmony_globals.profiler = None
+    # Stop metrics endpoint
+    if harmony_globals.metrics_server is not None:
+        asyncio.create_task(harmony_globals.metrics_server.stop())
+        harmony_globals.metrics_server = None
@@ -3,6 +3,9 @@
 #
 # Global list referencer to keep track of entities and objects
 # FIXME: Turn this into proper Dependency Injection
+import asyncio
+
+from harmony_modules.event_bus import EventBus
 
 # Object, character & user controllers
 user_controlled_entity_id = None
@@ -10,4 +13,14 @@ active_entities = {}
 
 # List of ready characters - this is used to synchronize characters finished initialization
 ready_entities = []
-failed_entities = []
\ No newline at end of file
+failed_entities = []
+# Set once the scene setup finished for all remaining entities
+scene_loaded = asyncio.Event()
+
+# Event bus for distributing events between entities, e.g. user utterances to the AI characters' perception
+event_bus = EventBus()
+
+# Metrics HTTP endpoint, if enabled
+metrics_server = None
+# On-demand profiling hooks, if enabled
+profiler = None
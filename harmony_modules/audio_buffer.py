@@ -0,0 +1,106 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Audio Buffer Module
+# Fixed size ring buffer for continuous audio capture, addressed by absolute byte offsets since recording start.
+import heapq
+import itertools
+
+
+# AudioRingBuffer - single writer (the capture callback), any number of readers.
+# Writes copy the data once into preallocated memory, so their cost doesn't depend on the buffer size.
+# Readers don't lock the writer out - they copy their range and validate afterwards that it wasn't overwritten meanwhile.
+class AudioRingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.total_written = 0  # absolute offset of the end of the readable data
+        self.write_end = 0  # absolute offset up to which a write may currently be in progress
+
+    @property
+    def dropped_bytes(self):
+        # Bytes which have been overwritten since recording start
+        return max(0, self.total_written - self.capacity)
+
+    def get_oldest_available(self):
+        # Oldest absolute offset which can still be read
+        return max(0, self.write_end - self.capacity)
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        end = self.total_written + len(data)
+        if len(data) > self.capacity:
+            # Only the newest bytes fit, the others count as written and dropped right away
+            data = data[len(data) - self.capacity:]
+        start = end - len(data)
+
+        # Announce the range before overwriting its old contents, see is_available()
+        self.write_end = end
+        position = start % self.capacity
+        first_length = min(len(data), self.capacity - position)
+        self.view[position:position + first_length] = data[:first_length]
+        if first_length < len(data):
+            self.view[:len(data) - first_length] = data[first_length:]
+        self.total_written = end
+
+    def get_segments(self, start_byte, end_byte):
+        # Zero-copy views onto an absolute range, which needs to be written already.
+        # Views become invalid once the range gets overwritten, check is_available() after using them.
+        if end_byte <= start_byte:
+            return []
+        position = start_byte % self.capacity
+        length = end_byte - start_byte
+        first_length = min(length, self.capacity - position)
+        segments = [self.view[position:position + first_length]]
+        if first_length < length:
+            segments.append(self.view[:length - first_length])
+        return segments
+
+    def is_available(self, start_byte):
+        # True if the data from start_byte onwards hasn't been overwritten, including by a write in progress
+        return start_byte >= self.write_end - self.capacity
+
+    def read(self, start_byte, end_byte):
+        # Copies an absolute range into a bytes object, returns None if it has been overwritten before or during reading
+        if end_byte <= start_byte:
+            return b''
+        if end_byte > self.total_written:
+            raise ValueError('range end {0} exceeds written data ({1} bytes)'.format(end_byte, self.total_written))
+        if not self.is_available(start_byte):
+            return None
+        data = b''.join(self.get_segments(start_byte, end_byte))
+        if not self.is_available(start_byte):
+            return None
+        return data
+
+
+# OffsetWaiterQueue - pending reads ordered by the absolute offset they wait for.
+# Only used from the event loop thread, except next_offset which the capture thread may read
+# to decide whether it needs to wake the event loop up.
+class OffsetWaiterQueue:
+    def __init__(self):
+        self.waiters = []  # heap of (offset, sequence, waiter)
+        self.sequence = itertools.count()
+        self.next_offset = None
+
+    def __len__(self):
+        return len(self.waiters)
+
+    def add(self, offset, waiter):
+        heapq.heappush(self.waiters, (offset, next(self.sequence), waiter))
+        self.next_offset = self.waiters[0][0]
+
+    def pop_ready(self, offset):
+        # Removes and returns all waiters for offsets up to the given one, in offset order
+        ready = []
+        while self.waiters and self.waiters[0][0] <= offset:
+            ready.append(heapq.heappop(self.waiters)[2])
+        self.next_offset = self.waiters[0][0] if self.waiters else None
+        return ready
+
+    def clear(self):
+        waiters = [waiter for _, _, waiter in sorted(self.waiters)]
+        self.waiters = []
+        self.next_offset = None
+        return waiters
@@ -0,0 +1,49 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Audio Codec Module
+# In-memory compression of raw PCM microphone audio before it's sent to Harmony Link.
+# Each encoded slice is a complete FLAC / Ogg stream, so it can be decoded on its own.
+import io
+
+import numpy as np
+import soundfile as sf
+
+from harmony_modules import dsp
+
+# Audio Codecs
+AUDIO_CODEC_PCM = 'pcm'  # raw interleaved integer PCM, no encoding
+AUDIO_CODEC_FLAC = 'flac'  # lossless, compression depends on the microphone's noise floor
+AUDIO_CODEC_OGG = 'ogg'  # lossy Ogg/Vorbis, much smaller but with per-stream header overhead
+
+# FLAC sample formats per PCM bit depth - 32 bit integer PCM can't be stored losslessly in FLAC
+FLAC_SUBTYPES = {
+    8: 'PCM_S8',
+    16: 'PCM_16',
+    24: 'PCM_24',
+}
+
+
+def is_supported(audio_codec, bit_depth):
+    if audio_codec == AUDIO_CODEC_FLAC:
+        return bit_depth in FLAC_SUBTYPES
+    return audio_codec in (AUDIO_CODEC_PCM, AUDIO_CODEC_OGG)
+
+
+def encode_audio(audio_bytes, audio_codec, sample_rate, channels, bit_depth):
+    # Returns the encoded stream as bytes, to be run off the event loop
+    if audio_codec == AUDIO_CODEC_PCM or len(audio_bytes) == 0:
+        return audio_bytes
+
+    samples = dsp.pcm_to_array(audio_bytes, bit_depth, channels)
+    encoded = io.BytesIO()
+    if audio_codec == AUDIO_CODEC_FLAC:
+        if bit_depth == 8:
+            # libsndfile writes 8 bit from the upper byte of 16 bit samples
+            samples = samples.astype(np.int16) << 8
+        sf.write(encoded, samples, sample_rate, format='FLAC', subtype=FLAC_SUBTYPES[bit_depth])
+    elif audio_codec == AUDIO_CODEC_OGG:
+        sf.write(encoded, samples / dsp.get_pcm_full_scale(bit_depth), sample_rate, format='OGG', subtype='VORBIS')
+    else:
+        raise ValueError('Unsupported audio codec: {0}'.format(audio_codec))
+    return encoded.getvalue()
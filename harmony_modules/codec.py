@@ -0,0 +1,92 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Codec Module
+# Encoding and decoding of Harmony Link events for the websocket connection.
+# Uses orjson if it is installed, and falls back to the standard library json module otherwise.
+#
+# Besides JSON text frames, events can be sent as binary frames which carry a raw binary payload field
+# (e.g. microphone audio) without base64 encoding:
+#   magic (4 bytes) | header length (uint32, big endian) | JSON header | binary data
+# The JSON header is the event itself plus 'binary_field', the payload field the binary data belongs to.
+import json
+import struct
+
+from harmony_modules.common import HarmonyLinkEvent
+
+# Optional faster JSON backend
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BINARY_FRAME_MAGIC = b'HLB1'
+BINARY_FRAME_PREFIX = struct.Struct('>4sI')
+
+
+def json_dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data, separators=(',', ':'))
+
+
+def json_loads(message):
+    # Both backends raise a ValueError subclass on invalid input
+    if orjson is not None:
+        return orjson.loads(message)
+    return json.loads(message)
+
+
+def encode_event(event):
+    # Text frame containing the event as JSON
+    return json_dumps(event.to_dict())
+
+
+def decode_event(message):
+    return event_from_dict(json_loads(message))
+
+
+def event_from_dict(data):
+    if not isinstance(data, dict):
+        raise ValueError('event message is not a JSON object')
+    try:
+        return HarmonyLinkEvent(
+            event_id=data['event_id'],
+            event_type=data['event_type'],
+            status=data['status'],
+            payload=data.get('payload')
+        )
+    except KeyError as e:
+        raise ValueError(f'event message is missing field {e}')
+
+
+def encode_binary_event(event, binary_field):
+    # Moves the bytes-like payload field out of the JSON header and appends it as is
+    payload = dict(event.payload)
+    binary_data = payload.pop(binary_field)
+    header = event.to_dict()
+    header['payload'] = payload
+    header['binary_field'] = binary_field
+    header_bytes = json_dumps(header).encode('utf-8')
+    return b''.join((BINARY_FRAME_PREFIX.pack(BINARY_FRAME_MAGIC, len(header_bytes)), header_bytes, binary_data))
+
+
+def decode_binary_event(frame):
+    if len(frame) < BINARY_FRAME_PREFIX.size:
+        raise ValueError('binary frame is too short')
+    magic, header_length = BINARY_FRAME_PREFIX.unpack_from(frame)
+    if magic != BINARY_FRAME_MAGIC:
+        raise ValueError('binary frame has an unknown format')
+    header_end = BINARY_FRAME_PREFIX.size + header_length
+    if header_end > len(frame):
+        raise ValueError('binary frame header exceeds frame size')
+
+    header = json_loads(bytes(frame[BINARY_FRAME_PREFIX.size:header_end]))
+    event = event_from_dict(header)
+    binary_field = header.get('binary_field')
+    if not isinstance(binary_field, str):
+        raise ValueError('binary frame header is missing the binary field')
+    if not isinstance(event.payload, dict):
+        event.payload = {}
+    event.payload[binary_field] = bytes(frame[header_end:])
+    return event
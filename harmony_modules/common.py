@@ -55,6 +55,11 @@ UTTERANCE_NONVERBAL_DELAYED = 'UTTERANCE_NONVERBAL_DELAYED'
 
 # HarmonyClientModuleBase - used for registering further modules for handling events
 class HarmonyClientModuleBase:
+    # Events consumed by this module, used by the connector to only dispatch relevant events.
+    # Maps event type -> tuple of accepted event states, or None to accept every state.
+    # None instead of a dict makes the module receive all events.
+    event_subscriptions = None
+
     def __init__(self, entity_controller):
         self.entity_controller = entity_controller
         self.backend_connector = entity_controller.connector
@@ -126,15 +131,30 @@ class HarmonyClientModuleBase:
         # To be implemented in subclasses
         return
 
+    def handle_reconnect(self):
+        # Called after the connection to Harmony Link has been re-established and session events were replayed.
+        # To be implemented in subclasses which keep state tied to the previous connection
+        return
+
 
 # HarmonyLinkEvent - Base class for exchanging data with harmony link
 class HarmonyLinkEvent:
+    __slots__ = ('event_id', 'event_type', 'status', 'payload')
+
     def __init__(self, event_id, event_type, status, payload):
         self.event_id = event_id
         self.event_type = event_type
         self.status = status
         self.payload = payload
 
+    def to_dict(self):
+        return {
+            'event_id': self.event_id,
+            'event_type': self.event_type,
+            'status': self.status,
+            'payload': self.payload,
+        }
+
 
 # AIState - describes the current state of an AI character
 class AIState:
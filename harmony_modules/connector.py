@@ -6,86 +6,292 @@
 
 import asyncio
 import logging
+import random
+import time
 
 import websockets
 import json
 
-from harmony_modules.common import HarmonyLinkEvent
+from harmony_modules import codec, metrics
+from harmony_modules.common import HarmonyLinkEvent, EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT, EVENT_TYPE_STT_INPUT_AUDIO
+
+# Outbound retry policy - send attempts per event type before an event is dropped.
+# Events with 0 attempts are not buffered while disconnected, e.g. microphone audio requested by a previous session.
+EVENT_SEND_ATTEMPTS = {
+    EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT: 0,
+    EVENT_TYPE_STT_INPUT_AUDIO: 0,
+}
+DEFAULT_EVENT_SEND_ATTEMPTS = 3
 
 
 # Define Classes
 class HarmonyEventJSONEncoder(json.JSONEncoder):
     def default(self, o):
+        if isinstance(o, HarmonyLinkEvent):
+            return o.to_dict()
         return o.__dict__
 
 
+# EventHandlerQueue - bounded inbox with its own worker task for a single event handler.
+# Events are handled in order per handler, without blocking reads from the websocket.
+class EventHandlerQueue:
+    def __init__(self, event_handler, max_size, entity_id=None):
+        self.event_handler = event_handler
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.task = None
+        self.closed = False
+        # Drops are logged once per burst, until the queue has room again
+        self.burst_dropped_events = 0
+        # Metrics
+        handler_name = event_handler.__class__.__name__
+        self.depth_metric = metrics.CONNECTOR_HANDLER_QUEUE_DEPTH.labels(entity_id=entity_id, handler=handler_name)
+        self.wait_time_metric = metrics.CONNECTOR_HANDLER_WAIT_TIME.labels(entity_id=entity_id, handler=handler_name)
+        self.dropped_events_metric = metrics.CONNECTOR_HANDLER_DROPPED_EVENTS.labels(entity_id=entity_id, handler=handler_name)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def close(self):
+        # The worker finishes the event in progress first, since handlers may unregister themselves while handling
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass  # Worker is busy and will see the closed flag after its current event
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait((event, time.perf_counter()))
+        except asyncio.QueueFull:
+            if self.burst_dropped_events == 0:
+                logging.warning('[{0}]: Event queue full, dropping events until it has room again, starting with {1}'.format(
+                    self.event_handler.__class__.__name__, event.event_type))
+            self.burst_dropped_events += 1
+            self.dropped_events_metric.inc()
+            return False
+        if self.burst_dropped_events > 0:
+            logging.warning('[{0}]: Event queue has room again, {1} events were dropped'.format(
+                self.event_handler.__class__.__name__, self.burst_dropped_events))
+            self.burst_dropped_events = 0
+        self.depth_metric.set(self.queue.qsize())
+        return True
+
+    async def run(self):
+        while not self.closed:
+            item = await self.queue.get()
+            if item is None or self.closed:
+                break
+
+            event, enqueue_time = item
+            self.depth_metric.set(self.queue.qsize())
+            self.wait_time_metric.observe(time.perf_counter() - enqueue_time)
+            try:
+                await self.event_handler.handle_event(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error('[{0}]: Error handling event {1}: {2}'.format(
+                    self.event_handler.__class__.__name__, event.event_type, e))
+
+
+# OutboundEvent - event waiting in the send queue, together with its delivery state
+class OutboundEvent:
+    def __init__(self, event, future, replay_on_reconnect, binary_field=None):
+        self.event = event
+        self.future = future
+        self.replay_on_reconnect = replay_on_reconnect
+        self.binary_field = binary_field  # payload field sent as raw bytes in a binary frame
+        self.attempts = 0
+        self.max_attempts = EVENT_SEND_ATTEMPTS.get(event.event_type, DEFAULT_EVENT_SEND_ATTEMPTS)
+
+
 class ConnectorEventHandler:
-    def __init__(self, ws_endpoint, shutdown_func):
+    def __init__(
+            self,
+            ws_endpoint,
+            shutdown_func,
+            handler_queue_size=256,
+            outbound_buffer_size=1000,
+            reconnect_base_delay=0.5,
+            reconnect_max_delay=30.0,
+            max_reconnect_attempts=0,
+            entity_id=None
+    ):
         # Setup Config Params
         self.ws_endpoint = ws_endpoint
+        self.entity_id = entity_id
+        self.handler_queue_size = handler_queue_size
+        # Reconnect with jittered exponential backoff, 0 attempts = retry forever
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.max_reconnect_attempts = max_reconnect_attempts
 
         # Setup Connector
         self.eventHandlers = []
+        self.event_handler_queues = {}
+        self.closing_event_handler_tasks = set()
+        # Dispatch index: event type -> list of (event handler queue, accepted states)
+        self.event_handler_index = {}
+        self.wildcard_event_handlers = []
         self.shutdown_func = shutdown_func
         self.running = False
         self.websocket = None
-        self.send_queue = asyncio.Queue()
+        # Outbound events are kept in a bounded buffer while disconnected, oldest ones get dropped first
+        self.send_queue = asyncio.Queue(maxsize=outbound_buffer_size)
+        self.retry_event = None
+        # Session events (e.g. entity init) get replayed on reconnect, latest event per type
+        self.session_events = {}
+        self.connection_count = 0
+        # Readiness - set while the websocket is connected
+        self.connected = asyncio.Event()
+        self.start_time = None
+        self.connect_duration = None
         self.task = None
         self.event_loop = None
+        # Metrics
+        self.send_queue_depth_metric = metrics.CONNECTOR_SEND_QUEUE_DEPTH.labels(entity_id=entity_id)
+        self.event_count_metrics = {}  # (event type, direction) -> counter
 
     def start(self):
         logging.debug('Starting ConnectorEventHandler')
         self.running = True
         self.event_loop = asyncio.get_running_loop()
+        self.start_time = time.perf_counter()
         self.task = asyncio.create_task(self.run())
 
+    async def wait_connected(self):
+        await self.connected.wait()
+        return self.connect_duration
+
     async def run(self):
+        reconnect_attempt = 0
+        while self.running:
+            try:
+                async with websockets.connect(self.ws_endpoint, close_timeout=1) as websocket:
+                    self.websocket = websocket
+                    self.connection_count += 1
+                    reconnect_attempt = 0
+                    if self.connection_count > 1:
+                        logging.info('Harmony Link: Reconnected to {0}'.format(self.ws_endpoint))
+                        await self.replay_session_events()
+                    else:
+                        self.connect_duration = time.perf_counter() - self.start_time
+                    self.connected.set()
+                    if self.connection_count > 1:
+                        self.notify_reconnect()
+                    await self.run_connection()
+            except asyncio.CancelledError:
+                logging.info('ConnectorEventHandler run() cancelled')
+                raise  # Propagate the cancellation
+            except Exception as e:
+                logging.error(f'WebSocket connection failed: {e}')
+            finally:
+                self.connected.clear()
+                self.websocket = None
+                self.drop_unbuffered_events()
+
+            if not self.running:
+                break
+
+            reconnect_attempt += 1
+            if 0 < self.max_reconnect_attempts < reconnect_attempt:
+                logging.error('Harmony Link: Giving up after {0} reconnect attempts'.format(self.max_reconnect_attempts))
+                self.shutdown_func()
+                return
+
+            # Full jitter keeps many entities from reconnecting in lockstep
+            reconnect_delay = random.uniform(0, min(self.reconnect_max_delay, self.reconnect_base_delay * 2 ** (reconnect_attempt - 1)))
+            logging.warning('Harmony Link: Connection lost, reconnecting in {0:.1f}s (attempt {1})'.format(reconnect_delay, reconnect_attempt))
+            await asyncio.sleep(reconnect_delay)
+
+    async def run_connection(self):
+        # Runs until either direction of the connection fails
+        consumer_task = asyncio.create_task(self.consumer_handler())
+        producer_task = asyncio.create_task(self.producer_handler())
         try:
-            async with websockets.connect(self.ws_endpoint, close_timeout=1) as websocket:
-                self.websocket = websocket
-                consumer_task = asyncio.create_task(self.consumer_handler())
-                producer_task = asyncio.create_task(self.producer_handler())
-                await asyncio.gather(consumer_task, producer_task)
-        except asyncio.CancelledError:
-            logging.info('ConnectorEventHandler run() cancelled')
+            await asyncio.wait((consumer_task, producer_task), return_when=asyncio.FIRST_COMPLETED)
+        finally:
             # Cancel sub-tasks
             consumer_task.cancel()
             producer_task.cancel()
             await asyncio.gather(consumer_task, producer_task, return_exceptions=True)
-            raise  # Propagate the cancellation
-        except Exception as e:
-            logging.error(f'WebSocket connection failed: {e}')
-            self.shutdown_func()
+
+    async def replay_session_events(self):
+        for event in list(self.session_events.values()):
+            logging.debug('Harmony Link: Replaying session event {0}'.format(event.event_type))
+            await self.websocket.send(codec.encode_event(event))
+
+    def notify_reconnect(self):
+        # Modules keeping state tied to the previous connection re-establish it, e.g. STT restarts listening
+        for event_handler in list(self.eventHandlers):
+            try:
+                event_handler.handle_reconnect()
+            except Exception as e:
+                logging.error('[{0}]: Error handling reconnect: {1}'.format(event_handler.__class__.__name__, e))
+
+    def drop_unbuffered_events(self):
+        # Events which aren't buffered while disconnected are only valid for the connection they were created for,
+        # e.g. microphone audio requested by the previous session. Drop the ones still waiting to be sent
+        kept_events = []
+        while not self.send_queue.empty():
+            outbound_event = self.send_queue.get_nowait()
+            if outbound_event.max_attempts > 0:
+                kept_events.append(outbound_event)
+            elif not outbound_event.future.done():
+                outbound_event.future.set_exception(RuntimeError('connection lost'))
+        for outbound_event in kept_events:
+            self.send_queue.put_nowait(outbound_event)
+        self.send_queue_depth_metric.set(self.send_queue.qsize())
 
     async def consumer_handler(self):
         try:
             async for message in self.websocket:
-                # TODO: Check if this should be creating a task instead for better performance
+                # Only decodes and enqueues the event, handlers process it on their own worker tasks
                 await self.process_event_message(message)
         except asyncio.CancelledError:
             logging.info('consumer_handler cancelled')
             raise
         except Exception as e:
             logging.error(f'Error in consumer_handler: {e}')
-            self.shutdown_func()
 
     async def producer_handler(self):
         try:
             while self.running:
-                event, future = await self.send_queue.get()
-                message_string = json.dumps(event, cls=HarmonyEventJSONEncoder)
+                # An event which failed to send on the previous connection goes first
+                if self.retry_event is not None:
+                    outbound_event, self.retry_event = self.retry_event, None
+                else:
+                    outbound_event = await self.send_queue.get()
+                    self.send_queue_depth_metric.set(self.send_queue.qsize())
+
+                if outbound_event.binary_field is not None:
+                    message = codec.encode_binary_event(outbound_event.event, outbound_event.binary_field)
+                else:
+                    message = codec.encode_event(outbound_event.event)
                 try:
-                    await self.websocket.send(message_string)
-                    future.set_result(True)
+                    await self.websocket.send(message)
                 except Exception as e:
-                    future.set_exception(e)
-                    logging.error(f"Failed to send event: {e}")
+                    outbound_event.attempts += 1
+                    if outbound_event.attempts < outbound_event.max_attempts:
+                        logging.warning(f"Failed to send event, retrying after reconnect: {e}")
+                        self.retry_event = outbound_event
+                    else:
+                        logging.error(f"Failed to send event: {e}")
+                        # The sender may have given up meanwhile, cancelling the future
+                        if not outbound_event.future.done():
+                            outbound_event.future.set_exception(e)
+                    return  # The connection is broken, leave it to run() to reconnect
+
+                self.count_event(outbound_event.event.event_type, 'sent')
+                if outbound_event.replay_on_reconnect:
+                    self.session_events[outbound_event.event.event_type] = outbound_event.event
+                if not outbound_event.future.done():
+                    outbound_event.future.set_result(True)
         except asyncio.CancelledError:
-            logging.info('consumer_handler cancelled')
+            logging.info('producer_handler cancelled')
             raise
         except Exception as e:
             logging.error(f'Error in producer_handler: {e}')
-            self.shutdown_func()
 
     async def process_event_message(self, message_string):
         if len(message_string) == 0:
@@ -93,13 +299,18 @@ class ConnectorEventHandler:
             return
 
         try:
-            message_json = json.loads(message_string)
-            logging.debug(f'Event message received: {message_string}')
-            message = HarmonyLinkEvent(**message_json)
+            if isinstance(message_string, bytes):
+                # Binary frame carrying raw data next to the event header
+                message = codec.decode_binary_event(message_string)
+                logging.debug('Binary event message received: %s (%d bytes)', message.event_type, len(message_string))
+            else:
+                message = codec.decode_event(message_string)
+                # Lazy formatting and truncation, messages may carry large audio payloads
+                logging.debug('Event message received: %.500s', message_string)
             await self.handle_event(event=message)
         except ValueError as e:
             logging.error(f'Failed to read event message: {str(e)}')
-            logging.error(f'Original message: {message_string}')
+            logging.error('Original message: %.500r', message_string)
 
     def stop(self):
         logging.debug('Stopping ConnectorEventHandler')
@@ -108,8 +319,8 @@ class ConnectorEventHandler:
         if self.websocket:
             asyncio.create_task(self.websocket.close())
 
-        # Deactivate event handlers
-        for event_handler in self.eventHandlers:
+        # Deactivate event handlers - iterating a copy, since deactivating unregisters them
+        for event_handler in list(self.eventHandlers):
             event_handler.deactivate()
 
         # Cancel the run task if it's running
@@ -119,16 +330,71 @@ class ConnectorEventHandler:
     def register_event_handler(self, event_handler):
         if event_handler not in self.eventHandlers:
             self.eventHandlers.append(event_handler)
+            event_handler_queue = EventHandlerQueue(event_handler, max_size=self.handler_queue_size, entity_id=self.entity_id)
+            event_handler_queue.start()
+            self.event_handler_queues[event_handler] = event_handler_queue
+            self.update_event_handler_index()
 
     def unregister_event_handler(self, event_handler):
         if event_handler in self.eventHandlers:
             self.eventHandlers.remove(event_handler)
+            event_handler_queue = self.event_handler_queues.pop(event_handler)
+            event_handler_queue.close()
+            # Keep a reference to the worker until it finished, so it doesn't get garbage collected mid-event
+            self.closing_event_handler_tasks.add(event_handler_queue.task)
+            event_handler_queue.task.add_done_callback(self.closing_event_handler_tasks.discard)
+            self.update_event_handler_index()
+
+    def queue_event(self, event_handler, event):
+        # Queues an event from within the plugin for one registered handler, e.g. one published on the event bus.
+        # Returns False if the handler isn't registered or its queue is full
+        event_handler_queue = self.event_handler_queues.get(event_handler)
+        if event_handler_queue is None:
+            return False
+        return event_handler_queue.put(event)
+
+    def update_event_handler_index(self):
+        # Rebuilt from scratch on each change, so a dispatch in progress keeps iterating its own copy
+        event_handler_index = {}
+        wildcard_event_handlers = []
+        for event_handler in self.eventHandlers:
+            event_handler_queue = self.event_handler_queues[event_handler]
+            if event_handler.event_subscriptions is None:
+                wildcard_event_handlers.append(event_handler_queue)
+                continue
+            for event_type, event_states in event_handler.event_subscriptions.items():
+                event_handler_index.setdefault(event_type, []).append((event_handler_queue, event_states))
+        self.event_handler_index = event_handler_index
+        self.wildcard_event_handlers = wildcard_event_handlers
 
-    async def send_event(self, event):
+    def count_event(self, event_type, direction):
+        counter = self.event_count_metrics.get((event_type, direction))
+        if counter is None:
+            counter = metrics.CONNECTOR_EVENTS.labels(entity_id=self.entity_id, event_type=event_type, direction=direction)
+            self.event_count_metrics[(event_type, direction)] = counter
+        counter.inc()
+
+    def clear_session_event(self, event_type):
+        # Stops an event from being replayed on reconnect, e.g. when its effect has been reverted
+        self.session_events.pop(event_type, None)
+
+    async def send_event(self, event, replay_on_reconnect=False, binary_field=None):
         # Create a Future associated with the current event loop
         send_event_future = self.event_loop.create_future()
+        outbound_event = OutboundEvent(event, send_event_future, replay_on_reconnect, binary_field=binary_field)
+        if not self.connected.is_set() and outbound_event.max_attempts == 0:
+            raise RuntimeError("Failed to send event to Harmony Link: not connected")
+
+        # Drop the oldest buffered event if the buffer is full
+        if self.send_queue.full():
+            dropped_event = self.send_queue.get_nowait()
+            logging.warning('Harmony Link: Outbound buffer full, dropping event {0}'.format(dropped_event.event.event_type))
+            if not dropped_event.future.done():
+                dropped_event.future.set_exception(RuntimeError('outbound buffer overflow'))
+
         # Enqueue the event and its Future to be sent by the producer handler
-        self.send_queue.put_nowait((event, send_event_future))
+        self.send_queue.put_nowait(outbound_event)
+        self.send_queue_depth_metric.set(self.send_queue.qsize())
         try:
             send_success = await send_event_future
             return send_success
@@ -141,5 +407,9 @@ class ConnectorEventHandler:
                 event = json.dumps(event, cls=HarmonyEventJSONEncoder)
             logging.warning(f'Invalid event received. Data: {event}')
         else:
-            for event_handler in self.eventHandlers:
-                await event_handler.handle_event(event)
+            self.count_event(event.event_type, 'received')
+            for event_handler_queue, event_states in self.event_handler_index.get(event.event_type, ()):
+                if event_states is None or event.status in event_states:
+                    event_handler_queue.put(event)
+            for event_handler_queue in self.wildcard_event_handlers:
+                event_handler_queue.put(event)
@@ -11,6 +11,9 @@ from pynput import keyboard
 
 # ControlsHandler - module main class
 class ControlsHandler(HarmonyClientModuleBase):
+    # User controls don't consume any Harmony Link events
+    event_subscriptions = {}
+
     def __init__(self, entity_controller, shutdown_func, controls_keymap_config):
         # execute the base constructor
         HarmonyClientModuleBase.__init__(self, entity_controller=entity_controller)
@@ -0,0 +1,142 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# DSP Module
+# Streaming audio format conversion (sample rate & channels) shared by the audio modules.
+from math import gcd
+
+import numpy as np
+
+# Integer sample formats of raw PCM audio, 24 bit is handled separately since it's packed
+PCM_DTYPES = {
+    8: np.int8,
+    16: np.int16,
+    32: np.int32,
+}
+
+
+# PolyphaseResampler - rational resampler which can be fed chunk by chunk.
+# Filter history is carried across chunks, so chunked output matches resampling the whole signal at once.
+class PolyphaseResampler:
+    def __init__(self, input_rate, output_rate, taps_per_phase=16, rolloff=0.9, kaiser_beta=8.0):
+        divisor = gcd(input_rate, output_rate)
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.up = output_rate // divisor
+        self.down = input_rate // divisor
+        self.taps_per_phase = taps_per_phase
+
+        # Windowed sinc lowpass at the upsampled rate, cutting off below the lower Nyquist frequency
+        filter_length = taps_per_phase * self.up
+        cutoff = 0.5 * rolloff * min(input_rate, output_rate) / (input_rate * self.up)
+        t = np.arange(filter_length) - (filter_length - 1) / 2.0
+        prototype = 2.0 * cutoff * np.sinc(2.0 * cutoff * t) * np.kaiser(filter_length, kaiser_beta) * self.up
+        # Phase p uses taps p, p + up, p + 2 * up, ... - stored per phase for a single gather per chunk
+        self.phase_filters = prototype.reshape(taps_per_phase, self.up).T.astype(np.float32)
+
+        # Streaming state
+        self.history = None  # last (taps_per_phase - 1) input frames
+        self.input_position = 0  # absolute index of the next input frame
+        self.output_position = 0  # absolute index of the next output frame
+
+    def process(self, chunk):
+        # chunk: float array of shape (frames, channels), returns resampled float32 array of the same layout
+        if self.up == self.down:
+            return chunk.astype(np.float32, copy=False)
+
+        if self.history is None:
+            self.history = np.zeros((self.taps_per_phase - 1, chunk.shape[1]), dtype=np.float32)
+        buffer = np.concatenate((self.history, chunk.astype(np.float32, copy=False)))
+        buffer_start = self.input_position - len(self.history)
+        self.input_position += len(chunk)
+
+        # All output frames whose newest input frame is available by now
+        output_end = -(-self.input_position * self.up // self.down)
+        output_indices = np.arange(self.output_position, output_end, dtype=np.int64)
+        self.output_position = output_end
+        self.history = buffer[len(buffer) - (self.taps_per_phase - 1):]
+
+        source_positions = output_indices * self.down
+        newest_input = source_positions // self.up - buffer_start
+        phases = source_positions % self.up
+        gather = newest_input[:, None] - np.arange(self.taps_per_phase)[None, :]
+        return np.einsum('nk,nkc->nc', self.phase_filters[phases], buffer[gather]).astype(np.float32)
+
+
+def pcm_to_array(audio_bytes, bit_depth, channels):
+    # Interleaved integer PCM as an integer array of shape (frames, channels).
+    # Packed 24 bit samples are widened to int32 by putting them into the upper bytes, see get_pcm_full_scale()
+    if bit_depth == 24:
+        packed = np.frombuffer(audio_bytes, dtype=np.uint8)
+        packed = packed[:len(packed) - len(packed) % 3].reshape(-1, 3)
+        widened = np.zeros((len(packed), 4), dtype=np.uint8)
+        widened[:, 1:] = packed
+        samples = widened.view('<i4').reshape(-1)
+    else:
+        dtype = np.dtype(PCM_DTYPES[bit_depth]).newbyteorder('<')
+        samples = np.frombuffer(audio_bytes[:len(audio_bytes) - len(audio_bytes) % dtype.itemsize], dtype=dtype)
+    return samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+
+
+def get_pcm_full_scale(bit_depth):
+    # Value of a full scale sample in the arrays returned by pcm_to_array()
+    return 2.0 ** 31 if bit_depth == 24 else 2.0 ** (bit_depth - 1)
+
+
+def pcm_to_float(audio_bytes, bit_depth, channels):
+    # Interleaved integer PCM as float32 array of shape (frames, channels) in the range -1.0 - 1.0
+    samples = pcm_to_array(audio_bytes, bit_depth, channels)
+    return (samples / get_pcm_full_scale(bit_depth)).astype(np.float32)
+
+
+def float_to_pcm(samples, bit_depth):
+    # Float samples in the range -1.0 - 1.0 as interleaved little endian integer PCM bytes
+    full_scale = 2.0 ** (bit_depth - 1)
+    integers = np.rint(np.clip(samples, -1.0, 1.0) * full_scale)
+    integers = np.clip(integers, -full_scale, full_scale - 1)
+    if bit_depth == 24:
+        # Pack the lower three bytes of each little endian int32
+        return integers.astype('<i4').reshape(-1, 1).view(np.uint8)[:, :3].tobytes()
+    return integers.astype(np.dtype(PCM_DTYPES[bit_depth]).newbyteorder('<')).tobytes()
+
+
+def convert_channels(block, channels):
+    # Converts a (frames, channels) block to the given channel count by downmixing / duplicating
+    if block.shape[1] == channels:
+        return block
+    mono = block.mean(axis=1, keepdims=True) if block.shape[1] > 1 else block
+    return np.repeat(mono, channels, axis=1)
+
+
+# AudioConverter - converts a stream of audio chunks into a target sample rate and channel layout
+class AudioConverter:
+    def __init__(self, input_rate, input_channels, output_rate, output_channels):
+        self.input_rate = input_rate
+        self.input_channels = input_channels
+        self.output_rate = output_rate
+        self.output_channels = output_channels
+        self.resampler = PolyphaseResampler(input_rate, output_rate)
+
+    def get_output_frames(self, input_frames):
+        return -(-input_frames * self.output_rate // self.input_rate)
+
+    def process(self, chunk):
+        # Downmix before resampling to save work, upmix after it
+        if self.output_channels < chunk.shape[1]:
+            chunk = convert_channels(chunk, self.output_channels)
+        chunk = self.resampler.process(chunk)
+        return convert_channels(chunk, self.output_channels)
+
+
+# PcmConverter - converts a stream of integer PCM chunks into another sample rate, channel layout and bit depth.
+# Filter state is kept across chunks, so offsets in the output stream only depend on the total input length.
+class PcmConverter:
+    def __init__(self, input_rate, input_channels, input_bit_depth, output_rate, output_channels, output_bit_depth):
+        self.input_channels = input_channels
+        self.input_bit_depth = input_bit_depth
+        self.output_bit_depth = output_bit_depth
+        self.converter = AudioConverter(input_rate, input_channels, output_rate, output_channels)
+
+    def process(self, audio_bytes):
+        samples = pcm_to_float(audio_bytes, self.input_bit_depth, self.input_channels)
+        return float_to_pcm(self.converter.process(samples), self.output_bit_depth)
@@ -0,0 +1,56 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Event Bus Module
+# In-process publish / subscribe for events exchanged between the entities of a scene,
+# e.g. for distributing a user's utterance to the perception of all AI characters.
+import copy
+import logging
+
+from harmony_modules.common import HarmonyLinkEvent
+
+
+# EventBus - topic based fan-out with isolated delivery.
+# Handlers are called right away and must not block, e.g. by putting the event into a module's handler queue,
+# so a slow or disconnected subscriber can't hold up the publisher.
+class EventBus:
+    def __init__(self):
+        # topic -> {subscriber id -> handler function}
+        self.subscriptions = {}
+
+    def subscribe(self, topic, subscriber_id, handler):
+        self.subscriptions.setdefault(topic, {})[subscriber_id] = handler
+
+    def unsubscribe(self, topic, subscriber_id):
+        self.subscriptions.get(topic, {}).pop(subscriber_id, None)
+
+    def unsubscribe_all(self, subscriber_id):
+        for topic_subscriptions in self.subscriptions.values():
+            topic_subscriptions.pop(subscriber_id, None)
+
+    def publish(self, topic, event, source_id=None):
+        # Hands the event to all subscribers of the topic except the source, returns the number of receivers
+        receivers = [
+            (subscriber_id, handler)
+            for subscriber_id, handler in self.subscriptions.get(topic, {}).items()
+            if subscriber_id != source_id
+        ]
+        for subscriber_id, handler in receivers:
+            self.deliver(topic, subscriber_id, handler, event)
+        return len(receivers)
+
+    def deliver(self, topic, subscriber_id, handler, event):
+        # Every subscriber gets its own copy, so it can't affect what other subscribers see
+        try:
+            handler(copy_event(event))
+        except Exception as e:
+            logging.error(f"EventBus: Delivery of '{topic}' to subscriber '{subscriber_id}' failed: {e}")
+
+
+def copy_event(event):
+    return HarmonyLinkEvent(
+        event_id=event.event_id,
+        event_type=event.event_type,
+        status=event.status,
+        payload=copy.deepcopy(event.payload)
+    )
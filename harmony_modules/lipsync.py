@@ -0,0 +1,137 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Lipsync Module
+# Precomputes VTS parameter tracks from decoded utterance audio once, so that playback
+# only needs a single array lookup per lipsync tick.
+
+import numpy as np
+
+# Lipsync Modes
+LIPSYNC_MODE_FAKE = 'fake'  # Random mouth movement, no audio analysis
+LIPSYNC_MODE_ENVELOPE = 'envelope'  # MouthOpen follows the loudness envelope of the utterance
+LIPSYNC_MODE_SPECTRAL = 'spectral'  # MouthOpen, MouthSmile and CheekPuff derived from band energies
+
+# Analysis defaults
+DEFAULT_FRAME_DURATION = 0.02  # seconds of audio per track frame
+DEFAULT_FLOOR_DB = -50.0  # RMS level (dBFS) mapped to a closed mouth
+DEFAULT_CEILING_DB = -15.0  # RMS level (dBFS) mapped to a fully opened mouth
+
+# Frequency bands (Hz) used by the spectral analysis
+# low: voicing and closed / rounded vowels, f1: first formant of open vowels,
+# f2: second formant of spread vowels (ee, eh), high: fricatives and sibilants
+SPECTRAL_BANDS = {
+    'low': (80, 300),
+    'f1': (300, 1000),
+    'f2': (1000, 2800),
+    'high': (2800, 8000),
+}
+
+
+# Parameters driven per lipsync mode
+LIPSYNC_PARAMETERS = {
+    LIPSYNC_MODE_ENVELOPE: ['MouthOpen'],
+    LIPSYNC_MODE_SPECTRAL: ['MouthOpen', 'MouthSmile', 'CheekPuff'],
+}
+
+
+# LipsyncTrack - precomputed per-frame parameter values for a single utterance
+class LipsyncTrack:
+    def __init__(self, parameter_ids, values, sample_rate, hop_length, mode):
+        self.parameter_ids = parameter_ids
+        self.values = values.astype(np.float16)  # array of shape (frames, len(parameter_ids))
+        self.sample_rate = sample_rate
+        self.hop_length = hop_length
+        self.mode = mode
+
+    def analyze(self, audio_block, start_sample):
+        # Fill in the frames covered by a block of audio, blocks need to start at a frame boundary
+        start_frame = start_sample // self.hop_length
+        values = compute_track_values(audio_block, self.sample_rate, self.hop_length, self.mode)
+        values = values[:len(self.values) - start_frame]
+        self.values[start_frame:start_frame + len(values)] = values
+
+    def parameters_at(self, sample_index):
+        # Look up the parameter values for the audio frame at the given sample index
+        frame = min(sample_index // self.hop_length, len(self.values) - 1)
+        if frame < 0:
+            return {}
+        return dict(zip(self.parameter_ids, self.values[frame].tolist()))
+
+
+def get_hop_length(sample_rate, frame_duration=DEFAULT_FRAME_DURATION):
+    return max(1, int(round(sample_rate * frame_duration)))
+
+
+def frame_audio(audio_data, hop_length):
+    # Downmix to mono and split into non-overlapping frames, zero padding the last one
+    mono = audio_data.mean(axis=1) if audio_data.ndim > 1 else audio_data
+    frame_count = -(-len(mono) // hop_length)
+    padded = np.zeros(frame_count * hop_length, dtype=np.float32)
+    padded[:len(mono)] = mono
+    return padded.reshape(frame_count, hop_length)
+
+
+def compute_envelope(frames, floor_db=DEFAULT_FLOOR_DB, ceiling_db=DEFAULT_CEILING_DB):
+    # RMS per frame, mapped from dBFS onto 0.0 - 1.0 between floor and ceiling
+    rms = np.sqrt(np.mean(np.square(frames), axis=1))
+    level_db = 20.0 * np.log10(np.maximum(rms, 1e-6))
+    return np.clip((level_db - floor_db) / (ceiling_db - floor_db), 0.0, 1.0).astype(np.float32)
+
+
+def compute_band_shares(frames, sample_rate):
+    # Batched short-time FFT over all frames in one pass, returns each band's share of the
+    # in-band energy per frame as a dict of arrays
+    fft_size = 1 << (frames.shape[1] - 1).bit_length()
+    window = np.hanning(frames.shape[1]).astype(np.float32)
+    power = np.abs(np.fft.rfft(frames * window, n=fft_size, axis=1)) ** 2
+    frequencies = np.fft.rfftfreq(fft_size, d=1.0 / sample_rate)
+
+    band_energies = {
+        band: power[:, (frequencies >= low) & (frequencies < high)].sum(axis=1)
+        for band, (low, high) in SPECTRAL_BANDS.items()
+    }
+    total_energy = np.maximum(sum(band_energies.values()), 1e-12)
+    return {band: energy / total_energy for band, energy in band_energies.items()}
+
+
+def compute_spectral_values(frames, sample_rate):
+    envelope = compute_envelope(frames)
+    shares = compute_band_shares(frames, sample_rate)
+
+    # Open vowels carry most energy around the first formant, spread vowels around the second,
+    # rounded vowels concentrate it in the lowest band
+    mouth_open = envelope * np.clip(0.4 + 1.2 * shares['f1'], 0.0, 1.0)
+    mouth_smile = np.clip((shares['f2'] - 0.15) / 0.35, 0.0, 1.0) * np.minimum(envelope * 2.0, 1.0)
+    cheek_puff = np.clip((shares['low'] - 0.6) / 0.4, 0.0, 1.0) * envelope
+    return np.stack([mouth_open, mouth_smile, cheek_puff], axis=1)
+
+
+def compute_track_values(audio_data, sample_rate, hop_length, mode):
+    frames = frame_audio(audio_data, hop_length)
+    if mode == LIPSYNC_MODE_SPECTRAL:
+        return compute_spectral_values(frames, sample_rate)
+    return compute_envelope(frames)[:, None]
+
+
+def create_lipsync_track(sample_count, sample_rate, mode=LIPSYNC_MODE_ENVELOPE, frame_duration=DEFAULT_FRAME_DURATION):
+    # Creates an empty track for an utterance of the given length, to be filled via LipsyncTrack.analyze()
+    if mode not in LIPSYNC_PARAMETERS:
+        return None
+
+    hop_length = get_hop_length(sample_rate, frame_duration)
+    parameter_ids = LIPSYNC_PARAMETERS[mode]
+    return LipsyncTrack(
+        parameter_ids=parameter_ids,
+        values=np.zeros((-(-sample_count // hop_length), len(parameter_ids))),
+        sample_rate=sample_rate,
+        hop_length=hop_length,
+        mode=mode
+    )
+
+
+def compute_lipsync_track(audio_data, sample_rate, mode=LIPSYNC_MODE_ENVELOPE):
+    track = create_lipsync_track(len(audio_data), sample_rate, mode=mode)
+    if track is not None:
+        track.analyze(audio_data, 0)
+    return track
@@ -0,0 +1,315 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Metrics Module
+# Counters, gauges and latency histograms for the speech pipeline, labelled by entity.
+# Metrics are always collected in memory, the HTTP endpoint exposing them in Prometheus text format is optional.
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+# Default histogram buckets in seconds, from a few ms (local hops) up to LLM / TTS generation times
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(label_names, label_values, extra_labels=()):
+    labels = list(zip(label_names, label_values)) + list(extra_labels)
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, escape_label_value(value)) for name, value in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# MetricFamily - base for a named metric with a fixed set of label names and one child per label value combination
+class MetricFamily:
+    metric_type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, **label_values):
+        key = tuple(str(label_values[name]) for name in self.label_names)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.create_child())
+        return child
+
+    def create_child(self):
+        raise NotImplementedError
+
+    def expose(self):
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.documentation),
+            '# TYPE {0} {1}'.format(self.name, self.metric_type),
+        ]
+        for label_values, child in sorted(self.children.items()):
+            lines.extend(self.expose_child(label_values, child))
+        return lines
+
+    def expose_child(self, label_values, child):
+        return ['{0}{1} {2}'.format(self.name, format_labels(self.label_names, label_values), format_value(child.value))]
+
+
+# Counter - monotonically increasing value, e.g. number of events sent
+class CounterValue:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Counter(MetricFamily):
+    metric_type = 'counter'
+
+    def create_child(self):
+        return CounterValue()
+
+
+# Gauge - value which can go up and down, e.g. a queue depth
+class GaugeValue:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(MetricFamily):
+    metric_type = 'gauge'
+
+    def create_child(self):
+        return GaugeValue()
+
+
+# Histogram - distribution of observed values in cumulative buckets, plus their sum and count
+class HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(MetricFamily):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        MetricFamily.__init__(self, name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def create_child(self):
+        return HistogramValue(self.buckets)
+
+    def expose_child(self, label_values, child):
+        with child.lock:
+            bucket_counts = list(child.bucket_counts)
+            value_sum, count = child.sum, child.count
+        lines = []
+        cumulative_count = 0
+        for upper_bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+            cumulative_count += bucket_count
+            lines.append('{0}_bucket{1} {2}'.format(
+                self.name, format_labels(self.label_names, label_values, [('le', format_value(float(upper_bound)))]), cumulative_count))
+        labels = format_labels(self.label_names, label_values)
+        lines.append('{0}_sum{1} {2}'.format(self.name, labels, repr(value_sum)))
+        lines.append('{0}_count{1} {2}'.format(self.name, labels, count))
+        return lines
+
+
+# MetricsRegistry - owns all metric families and renders them in the Prometheus text exposition format
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError('Metric {0} is registered already'.format(metric.name))
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def expose(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+# StageTimer - measures the time from a start event to the next end event per entity, e.g. speech stopped -> transcript.
+# Ends without a preceding start are ignored, a repeated start restarts the measurement.
+class StageTimer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start_times = {}
+
+    def start(self, entity_id, start_time=None):
+        self.start_times[entity_id] = time.perf_counter() if start_time is None else start_time
+
+    def stop(self, entity_id, end_time=None):
+        start_time = self.start_times.pop(entity_id, None)
+        if start_time is None:
+            return None
+        duration = (time.perf_counter() if end_time is None else end_time) - start_time
+        self.histogram.labels(entity_id=entity_id).observe(duration)
+        return duration
+
+
+# MetricsServer - minimal HTTP endpoint serving the registry on GET /metrics.
+# Other modules can add routes for local diagnostics, e.g. the profiling module.
+class MetricsServer:
+    def __init__(self, metrics_registry, host='127.0.0.1', port=9464):
+        self.registry = metrics_registry
+        self.host = host
+        self.port = port
+        self.server = None
+        # path -> (async handler(query parameters) returning (status, body), content type)
+        self.routes = {}
+        self.add_route('/metrics', self.serve_metrics, 'text/plain; version=0.0.4; charset=utf-8')
+
+    def add_route(self, path, handler, content_type='text/plain; charset=utf-8'):
+        self.routes[path] = (handler, content_type)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info('Metrics endpoint listening on http://{0}:{1}/metrics'.format(self.host, self.port))
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Skip the headers, requests don't have a body
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            method, target = (request_line.decode('latin-1').split() + ['', ''])[:2]
+            url = urlsplit(target)
+            route = self.routes.get(url.path)
+            if method != 'GET' or route is None:
+                await self.send_response(writer, '404 Not Found', 'Not Found\n', 'text/plain; charset=utf-8')
+                return
+            handler, content_type = route
+            try:
+                status, body = await handler(dict(parse_qsl(url.query)))
+            except Exception as e:
+                logging.error(f'Metrics endpoint: {url.path} failed: {e}')
+                status, body, content_type = '500 Internal Server Error', f'{e}\n', 'text/plain; charset=utf-8'
+            await self.send_response(writer, status, body, content_type)
+        except Exception as e:
+            logging.debug(f'Metrics endpoint request failed: {e}')
+        finally:
+            writer.close()
+
+    async def serve_metrics(self, query):
+        return '200 OK', self.registry.expose()
+
+    async def send_response(self, writer, status, body, content_type):
+        body_bytes = body.encode('utf-8')
+        writer.write('HTTP/1.1 {0}\r\nContent-Type: {1}\r\nContent-Length: {2}\r\nConnection: close\r\n\r\n'.format(
+            status, content_type, len(body_bytes)).encode('latin-1') + body_bytes)
+        await writer.drain()
+
+
+# Plugin-wide registry and the speech pipeline metrics
+registry = MetricsRegistry()
+
+STT_TRANSCRIPT_LATENCY = registry.histogram(
+    'harmony_stt_transcript_latency_seconds',
+    'Time from the end of speech (STT_SPEECH_STOPPED) to the transcript (STT_OUTPUT_TEXT)',
+    ('entity_id',)
+)
+AI_RESPONSE_LATENCY = registry.histogram(
+    'harmony_ai_response_latency_seconds',
+    'Time from sending a USER_UTTERANCE to receiving the AI_SPEECH reply',
+    ('entity_id',)
+)
+TTS_FIRST_SAMPLE_LATENCY = registry.histogram(
+    'harmony_tts_first_sample_latency_seconds',
+    'Time from receiving AI_SPEECH to its first audio sample being audible, including the output latency',
+    ('entity_id',)
+)
+TTS_AUDIO_CACHE_LOOKUPS = registry.counter(
+    'harmony_tts_audio_cache_lookups_total',
+    'Lookups in the decoded utterance audio cache, by result (hit / miss)',
+    ('entity_id', 'result')
+)
+TTS_AUDIO_CACHE_SIZE = registry.gauge(
+    'harmony_tts_audio_cache_size_bytes',
+    'Memory used by the decoded utterance audio cache',
+    ('entity_id',)
+)
+VTS_REQUEST_DURATION = registry.histogram(
+    'harmony_vts_request_duration_seconds',
+    'Round trip time of VTube Studio API requests',
+    ('entity_id', 'message_type'),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+CONNECTOR_SEND_QUEUE_DEPTH = registry.gauge(
+    'harmony_connector_send_queue_depth',
+    'Events waiting in the outbound buffer to Harmony Link',
+    ('entity_id',)
+)
+CONNECTOR_HANDLER_QUEUE_DEPTH = registry.gauge(
+    'harmony_connector_handler_queue_depth',
+    'Events waiting in a module\'s inbox to be handled',
+    ('entity_id', 'handler')
+)
+CONNECTOR_HANDLER_WAIT_TIME = registry.histogram(
+    'harmony_connector_handler_wait_seconds',
+    'Time events spent in a module\'s inbox before being handled',
+    ('entity_id', 'handler'),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+CONNECTOR_HANDLER_DROPPED_EVENTS = registry.counter(
+    'harmony_connector_handler_dropped_events_total',
+    'Events dropped because a module\'s inbox was full',
+    ('entity_id', 'handler')
+)
+CONNECTOR_EVENTS = registry.counter(
+    'harmony_connector_events_total',
+    'Events exchanged with Harmony Link',
+    ('entity_id', 'event_type', 'direction')
+)
+
+stt_transcript_timer = StageTimer(STT_TRANSCRIPT_LATENCY)
+ai_response_timer = StageTimer(AI_RESPONSE_LATENCY)
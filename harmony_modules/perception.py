@@ -5,16 +5,44 @@
 
 # Import Backend base Module
 from harmony_modules.common import *
+from harmony_modules import metrics
+import harmony_globals
+
+# Event bus topics perceived from other entities
+PERCEPTION_TOPICS = (
+    EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE,
+    EVENT_TYPE_STT_SPEECH_STARTED,
+    EVENT_TYPE_STT_SPEECH_STOPPED,
+)
 
 
 # PerceptionHandler - module main class
 class PerceptionHandler(HarmonyClientModuleBase):
+    event_subscriptions = {
+        EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE: (EVENT_STATE_DONE,),
+        EVENT_TYPE_STT_SPEECH_STARTED: (EVENT_STATE_DONE,),
+        EVENT_TYPE_STT_SPEECH_STOPPED: (EVENT_STATE_DONE,),
+    }
+
     def __init__(self, entity_controller, perception_config):
         # execute the base constructor
         HarmonyClientModuleBase.__init__(self, entity_controller=entity_controller)
         # Set config
         self.config = perception_config
 
+    def activate(self):
+        HarmonyClientModuleBase.activate(self)
+        # Receive events published by other entities of the scene, through this module's own bounded handler queue
+        for topic in PERCEPTION_TOPICS:
+            harmony_globals.event_bus.subscribe(topic, self.entity_controller.entity_id, self.queue_event)
+
+    def deactivate(self):
+        harmony_globals.event_bus.unsubscribe_all(self.entity_controller.entity_id)
+        HarmonyClientModuleBase.deactivate(self)
+
+    def queue_event(self, event):
+        self.backend_connector.queue_event(self, event)
+
     async def handle_event(
             self,
             event  # HarmonyLinkEvent
@@ -29,6 +57,7 @@ class PerceptionHandler(HarmonyClientModuleBase):
                 payload=event.payload
             )
             await self.backend_connector.send_event(event)
+            metrics.ai_response_timer.start(self.entity_controller.entity_id)
             return
 
         # Suppress Speech output for the current entity
@@ -0,0 +1,236 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Profiling Module
+# On-demand diagnostics of the running plugin, written to timestamped files:
+# CPU profiles of the event loop thread (cProfile), memory allocation diffs between snapshots (tracemalloc)
+# and stack dumps of all asyncio tasks and threads.
+# Profilers are only hooked into the interpreter while a profile or memory trace is running.
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+
+DEFAULT_PROFILE_DURATION = 30.0  # seconds, for CPU profiles started via the endpoint
+DEFAULT_TOP_ENTRIES = 50  # functions / allocation sites listed in the text summaries
+
+
+# Profiler - controls the profiling tools, via its methods, signals or routes on the metrics endpoint
+class Profiler:
+    def __init__(self, output_dir='profiles', top_entries=DEFAULT_TOP_ENTRIES, traceback_frames=1):
+        self.output_dir = output_dir
+        self.top_entries = top_entries
+        self.traceback_frames = traceback_frames  # frames stored per traced allocation, more = slower
+        # CPU profile
+        self.cpu_profile = None
+        self.cpu_profile_start = None
+        self.cpu_profile_timer = None
+        # Memory tracing - the last snapshot is the baseline for the next diff
+        self.memory_snapshot = None
+        self.started_memory_tracing = False
+        self.signal_handlers_installed = False
+
+    def get_output_path(self, kind, extension):
+        os.makedirs(self.output_dir, exist_ok=True)
+        now = time.time()
+        timestamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + '-{0:03d}'.format(int(now * 1000) % 1000)
+        return os.path.join(self.output_dir, '{0}_{1}.{2}'.format(kind, timestamp, extension))
+
+    # CPU Profiling
+
+    def start_cpu_profile(self, duration=None):
+        # Profiles the calling thread (the event loop) until stopped, or for `duration` seconds if given.
+        # Worker threads like audio decoding aren't covered. Returns False if a profile is running already
+        if self.cpu_profile is not None:
+            return False
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Another profiler / debugger is active
+            logging.warning(f'Profiling: Failed to start CPU profile: {e}')
+            return False
+        self.cpu_profile = profile
+        self.cpu_profile_start = time.perf_counter()
+        if duration:
+            self.cpu_profile_timer = asyncio.get_running_loop().call_later(
+                duration, lambda: asyncio.create_task(self.stop_cpu_profile()))
+        logging.info('Profiling: CPU profile started{0}'.format(' for {0:g}s'.format(duration) if duration else ''))
+        return True
+
+    async def stop_cpu_profile(self):
+        # Writes the profile, returns its path or None if no profile was running
+        if self.cpu_profile is None:
+            return None
+        profile, self.cpu_profile = self.cpu_profile, None
+        profile.disable()
+        if self.cpu_profile_timer is not None:
+            self.cpu_profile_timer.cancel()
+            self.cpu_profile_timer = None
+        duration = time.perf_counter() - self.cpu_profile_start
+
+        path = self.get_output_path('cpu', 'prof')
+        await asyncio.get_running_loop().run_in_executor(None, self.write_cpu_profile, profile, path, duration)
+        logging.info(f'Profiling: CPU profile written to {path}')
+        return path
+
+    def toggle_cpu_profile(self):
+        if self.cpu_profile is None:
+            self.start_cpu_profile()
+        else:
+            asyncio.create_task(self.stop_cpu_profile())
+
+    def write_cpu_profile(self, profile, path, duration):
+        # Raw profile for pstats / snakeviz, plus a text summary next to it
+        profile.dump_stats(path)
+        with open(os.path.splitext(path)[0] + '.txt', 'w') as summary_file:
+            summary_file.write('CPU profile of the event loop thread over {0:.1f}s\n\n'.format(duration))
+            pstats.Stats(profile, stream=summary_file).sort_stats('cumulative').print_stats(self.top_entries)
+
+    # Memory Tracing
+
+    async def take_memory_snapshot(self):
+        # The first snapshot starts tracing allocations, every later one writes the changes since the previous one.
+        # Returns the path of the written diff, or None for the first snapshot
+        loop = asyncio.get_running_loop()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.traceback_frames)
+            self.started_memory_tracing = True
+            logging.info('Profiling: Memory tracing started')
+
+        snapshot = await loop.run_in_executor(None, tracemalloc.take_snapshot)
+        previous_snapshot, self.memory_snapshot = self.memory_snapshot, snapshot
+        if previous_snapshot is None:
+            logging.info('Profiling: Baseline memory snapshot taken, the next snapshot is compared to it')
+            return None
+        path = self.get_output_path('memory', 'txt')
+        await loop.run_in_executor(None, self.write_memory_diff, previous_snapshot, snapshot, path)
+        logging.info(f'Profiling: Memory snapshot diff written to {path}')
+        return path
+
+    def stop_memory_tracing(self):
+        # Only stops tracing started by this profiler, e.g. not one enabled via PYTHONTRACEMALLOC
+        self.memory_snapshot = None
+        if not self.started_memory_tracing:
+            return False
+        tracemalloc.stop()
+        self.started_memory_tracing = False
+        logging.info('Profiling: Memory tracing stopped')
+        return True
+
+    def write_memory_diff(self, previous_snapshot, snapshot, path):
+        # Allocations of the tracing itself and of imports are left out
+        trace_filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ]
+        statistics = snapshot.filter_traces(trace_filters).compare_to(previous_snapshot.filter_traces(trace_filters), 'lineno')
+        current_size, peak_size = tracemalloc.get_traced_memory()
+        with open(path, 'w') as diff_file:
+            diff_file.write('Traced memory: {0:.1f} MiB, peak {1:.1f} MiB\n'.format(current_size / 2 ** 20, peak_size / 2 ** 20))
+            diff_file.write('Top {0} allocation sites by growth since the previous snapshot:\n\n'.format(self.top_entries))
+            for statistic in statistics[:self.top_entries]:
+                diff_file.write('{0}\n'.format(statistic))
+
+    # Stack Dumps
+
+    async def dump_tasks(self):
+        # Stacks of all asyncio tasks and all threads, e.g. to see what a stuck event loop waits for
+        output = io.StringIO()
+        tasks = asyncio.all_tasks()
+        output.write('{0} asyncio tasks\n\n'.format(len(tasks)))
+        for task in sorted(tasks, key=lambda task: task.get_name()):
+            task.print_stack(file=output)
+            output.write('\n')
+
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        thread_frames = sys._current_frames()
+        output.write('{0} threads\n\n'.format(len(thread_frames)))
+        for thread_id, frame in thread_frames.items():
+            output.write('Thread {0} ({1}):\n'.format(thread_names.get(thread_id, 'unknown'), thread_id))
+            output.write(''.join(traceback.format_stack(frame)))
+            output.write('\n')
+
+        path = self.get_output_path('tasks', 'txt')
+        await asyncio.get_running_loop().run_in_executor(None, self.write_text, path, output.getvalue())
+        logging.info(f'Profiling: Task dump written to {path}')
+        return path
+
+    def write_text(self, path, text):
+        with open(path, 'w') as text_file:
+            text_file.write(text)
+
+    # Controls
+
+    def install_signal_handlers(self):
+        # POSIX only: SIGUSR1 starts / stops a CPU profile, SIGUSR2 dumps all tasks and takes a memory snapshot
+        if not hasattr(signal, 'SIGUSR1'):
+            return False
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, self.toggle_cpu_profile)
+            loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.create_task(self.dump_diagnostics()))
+        except (NotImplementedError, RuntimeError) as e:
+            logging.warning(f'Profiling: Signal handlers not available: {e}')
+            return False
+        self.signal_handlers_installed = True
+        logging.info(f'Profiling: Send SIGUSR1 to process {os.getpid()} to start / stop a CPU profile, '
+                     f'SIGUSR2 to dump tasks and take a memory snapshot')
+        return True
+
+    def remove_signal_handlers(self):
+        if self.signal_handlers_installed:
+            loop = asyncio.get_running_loop()
+            loop.remove_signal_handler(signal.SIGUSR1)
+            loop.remove_signal_handler(signal.SIGUSR2)
+            self.signal_handlers_installed = False
+
+    async def dump_diagnostics(self):
+        await self.dump_tasks()
+        await self.take_memory_snapshot()
+
+    def add_routes(self, server):
+        # Local control endpoint on the metrics server, e.g. GET /debug/profile/start?duration=10
+        server.add_route('/debug/profile/start', self.handle_profile_start)
+        server.add_route('/debug/profile/stop', self.handle_profile_stop)
+        server.add_route('/debug/memory/snapshot', self.handle_memory_snapshot)
+        server.add_route('/debug/memory/stop', self.handle_memory_stop)
+        server.add_route('/debug/tasks', self.handle_tasks)
+
+    async def handle_profile_start(self, query):
+        try:
+            duration = float(query.get('duration', DEFAULT_PROFILE_DURATION))
+        except ValueError:
+            return '400 Bad Request', 'Invalid duration\n'
+        if not self.start_cpu_profile(duration):
+            return '409 Conflict', 'CPU profile could not be started, is one running already?\n'
+        return '200 OK', 'CPU profile started for {0:g}s\n'.format(duration)
+
+    async def handle_profile_stop(self, query):
+        path = await self.stop_cpu_profile()
+        if path is None:
+            return '409 Conflict', 'No CPU profile running\n'
+        return '200 OK', '{0}\n'.format(path)
+
+    async def handle_memory_snapshot(self, query):
+        path = await self.take_memory_snapshot()
+        if path is None:
+            return '200 OK', 'Memory tracing started, take another snapshot to get the changes\n'
+        return '200 OK', '{0}\n'.format(path)
+
+    async def handle_memory_stop(self, query):
+        if not self.stop_memory_tracing():
+            return '409 Conflict', 'Memory tracing was not started here\n'
+        return '200 OK', 'Memory tracing stopped\n'
+
+    async def handle_tasks(self, query):
+        return '200 OK', '{0}\n'.format(await self.dump_tasks())
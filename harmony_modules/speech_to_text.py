@@ -5,49 +5,125 @@
 #
 # Import Client base Module
 from harmony_modules.common import *
+from harmony_modules.audio_buffer import AudioRingBuffer, OffsetWaiterQueue
+from harmony_modules import audio_codec, dsp, metrics, vad
 import harmony_globals
 
 import asyncio
 import logging
-import threading
 import base64
 import time
 import sounddevice as sd
+from concurrent.futures import ThreadPoolExecutor
 
 # Constants
 RESULT_MODE_PROCESS = "process"
 RESULT_MODE_RETURN = "return"
+# Audio transports for microphone fetch results
+AUDIO_TRANSPORT_BASE64 = "base64"  # base64 string inside the JSON event
+AUDIO_TRANSPORT_BINARY = "binary"  # raw bytes in a binary websocket frame, see codec module
+# Uplink modes for microphone audio
+UPLINK_MODE_PULL = "pull"  # Harmony Link requests audio ranges via STT_FETCH_MICROPHONE
+UPLINK_MODE_PUSH = "push"  # audio is streamed to Harmony Link in STT_INPUT_AUDIO chunks as soon as it's recorded
+
+# Worker threads for copying and encoding fetched microphone audio off the event loop
+encode_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='stt-encode')
 
 
 # SpeechToTextHandler - module main class
 class SpeechToTextHandler(HarmonyClientModuleBase):
+    event_subscriptions = {
+        EVENT_TYPE_STT_OUTPUT_TEXT: (EVENT_STATE_DONE,),
+        EVENT_TYPE_STT_SPEECH_STARTED: (EVENT_STATE_DONE,),
+        EVENT_TYPE_STT_SPEECH_STOPPED: (EVENT_STATE_DONE,),
+        EVENT_TYPE_STT_FETCH_MICROPHONE: (EVENT_STATE_DONE,),
+        EVENT_TYPE_STT_START_LISTEN: (EVENT_STATE_DONE,),
+    }
+
     def __init__(self, entity_controller, stt_config):
         # execute the base constructor
         HarmonyClientModuleBase.__init__(self, entity_controller=entity_controller)
         # Set config
         self.config = stt_config
         # Get Base vars from config
-        self.channels = int(self.config['channels'])
-        self.bit_depth = int(self.config['bit_depth'])
-        self.sample_rate = int(self.config['sample_rate'])
+        self.capture_channels = int(self.config['channels'])
+        self.capture_bit_depth = int(self.config['bit_depth'])
+        self.capture_sample_rate = int(self.config['sample_rate'])
+        # Format of the audio sent to Harmony Link, recorded audio gets converted right after capture.
+        # Empty values keep the recording format
+        self.channels = int(self.config.get('uplink_channels') or self.capture_channels)
+        self.bit_depth = int(self.config.get('uplink_bit_depth') or self.capture_bit_depth)
+        self.sample_rate = int(self.config.get('uplink_sample_rate') or self.capture_sample_rate)
+        self.uplink_converter = None
         self.buffer_clip_duration = int(self.config['buffer_clip_duration'])
         self.record_stepping = int(self.config['record_stepping'])
         self.microphone_index, self.microphone_name = self.get_microphone()
+        # Audio transport requested from Harmony Link, base64 is used until it confirmed the request
+        self.audio_transport = self.config.get('audio_transport', AUDIO_TRANSPORT_BASE64)
+        if self.audio_transport not in (AUDIO_TRANSPORT_BASE64, AUDIO_TRANSPORT_BINARY):
+            logging.warning('Unknown audio transport "{0}", using base64'.format(self.audio_transport))
+            self.audio_transport = AUDIO_TRANSPORT_BASE64
+        self.negotiated_audio_transport = AUDIO_TRANSPORT_BASE64
+        # Uplink mode requested from Harmony Link, pull is used until it confirmed push mode
+        self.uplink_mode = self.config.get('uplink_mode', UPLINK_MODE_PULL)
+        if self.uplink_mode not in (UPLINK_MODE_PULL, UPLINK_MODE_PUSH):
+            logging.warning('Unknown uplink mode "{0}", using pull'.format(self.uplink_mode))
+            self.uplink_mode = UPLINK_MODE_PULL
+        self.negotiated_uplink_mode = UPLINK_MODE_PULL
+        # Audio codec requested from Harmony Link, raw PCM is sent until it confirmed the request
+        self.audio_codec = self.config.get('audio_codec', audio_codec.AUDIO_CODEC_PCM)
+        if not audio_codec.is_supported(self.audio_codec, self.bit_depth):
+            logging.warning('Audio codec "{0}" is not supported for {1} bit audio, using pcm'.format(self.audio_codec, self.bit_depth))
+            self.audio_codec = audio_codec.AUDIO_CODEC_PCM
+        self.negotiated_audio_codec = audio_codec.AUDIO_CODEC_PCM
         # Event loop reference for synchronizing threads
         self.loop = asyncio.get_event_loop()
         # Recording Handling
         self.is_recording_microphone = False
         self.active_recording_events = {}
-        self.recording_buffer = None # bytearray
+        # Fetch requests waiting for their audio to be recorded, completed from the capture callback
+        self.fetch_waiters = OffsetWaiterQueue()
+        self.fetch_tasks = set()
+        self.restart_listen_task = None
+        self.recording_buffer = None # AudioRingBuffer
         self.recording_start_time = None # time.time
-        self.dropped_buffer_bytes = 0
-        self.lock = threading.Lock()
         self.audio_stream = None
         # Calculate bytes per second
         self.bytes_per_sample = self.bit_depth // 8
         self.bytes_per_second = self.sample_rate * self.channels * self.bytes_per_sample
         # Calculate maximum buffer size in bytes
         self.max_buffer_bytes = self.bytes_per_second * self.buffer_clip_duration
+        # Push Mode - chunks are aligned to whole frames
+        frame_bytes = self.channels * self.bytes_per_sample
+        push_chunk_duration = int(self.config.get('push_chunk_duration', 100))
+        self.push_chunk_bytes = max(1, self.sample_rate * push_chunk_duration // 1000) * frame_bytes
+        self.push_offset = 0  # absolute offset of the next byte to push
+        self.push_next_offset = None  # offset completing the next chunk, read by the capture thread
+        self.push_sequence = 0
+        self.push_wakeup = asyncio.Event()
+        self.push_stopping = False
+        self.push_task = None
+        # Local VAD - classifies audio before it's sent, silent audio can be marked or skipped
+        self.local_vad = self.config.get('local_vad', vad.LOCAL_VAD_OFF)
+        if self.local_vad not in (vad.LOCAL_VAD_OFF, vad.LOCAL_VAD_MARK, vad.LOCAL_VAD_SKIP):
+            logging.warning('Unknown local VAD mode "{0}", disabling it'.format(self.local_vad))
+            self.local_vad = vad.LOCAL_VAD_OFF
+        self.negotiated_local_vad = vad.LOCAL_VAD_OFF
+        self.vad = None
+        self.vad_lookahead_bytes = 0  # only while skipping has been confirmed
+        self.vad_skip_lookahead_bytes = 0
+        self.vad_skipped_bytes = 0
+        if self.local_vad != vad.LOCAL_VAD_OFF:
+            self.vad = vad.EnergyVAD(
+                self.sample_rate,
+                energy_threshold_db=float(self.config.get('vad_energy_threshold', vad.DEFAULT_ENERGY_THRESHOLD_DB)),
+                hangover=int(self.config.get('vad_hangover', vad.DEFAULT_HANGOVER * 1000)) / 1000,
+                preroll=int(self.config.get('vad_preroll', vad.DEFAULT_PREROLL * 1000)) / 1000
+            )
+            if self.local_vad == vad.LOCAL_VAD_SKIP:
+                # Audio gets sent after the pre-roll following it has been recorded,
+                # so a window right before a word onset isn't skipped
+                self.vad_skip_lookahead_bytes = self.vad.preroll_frames * self.vad.frame_length * frame_bytes
 
     async def handle_event(
             self,
@@ -55,53 +131,79 @@ class SpeechToTextHandler(HarmonyClientModuleBase):
     ):
         # Audio processed and utterance received
         if event.event_type == EVENT_TYPE_STT_OUTPUT_TEXT and event.status == EVENT_STATE_DONE:
+            metrics.stt_transcript_timer.stop(self.entity_controller.entity_id)
 
             utterance_data = event.payload
 
             if len(utterance_data["content"]) > 0:
                 # Since this was an output created by the current entity, it needs to be distributed
                 # to the other entities, which then "decide" if it's relevant to them in some way or not
-                utterance_data["entity_id"] = self.entity_controller.entity_id
-                event = HarmonyLinkEvent(
+                perception_event = HarmonyLinkEvent(
                     event_id='actor_{0}_VAD_utterance'.format(self.entity_controller.entity_id),
                     event_type=EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE,
                     status=EVENT_STATE_DONE,
-                    payload=utterance_data
+                    payload=dict(utterance_data, entity_id=self.entity_controller.entity_id)
+                )
+                harmony_globals.event_bus.publish(
+                    EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, perception_event, source_id=self.entity_controller.entity_id
                 )
 
-                # FIXME: This is not very performant, will cause issues with many characters
-                for entity_id, controller in harmony_globals.active_entities.items():
-                    if entity_id == self.entity_controller.entity_id or controller.perceptionModule is None:
-                        continue
-                    await controller.perceptionModule.handle_event(event)
-
-        # User / Source entity starts talking
-        if event.event_type == EVENT_TYPE_STT_SPEECH_STARTED and event.status == EVENT_STATE_DONE:
+        # User / Source entity starts or stops talking
+        if (
+                event.event_type == EVENT_TYPE_STT_SPEECH_STARTED or
+                event.event_type == EVENT_TYPE_STT_SPEECH_STOPPED
+        ) and event.status == EVENT_STATE_DONE:
+            if event.event_type == EVENT_TYPE_STT_SPEECH_STOPPED:
+                metrics.stt_transcript_timer.start(self.entity_controller.entity_id)
             # This event is intended to perform as an "interruption event" for LLM and TTS
             # on the listening entities.
-            # FIXME: This is not very performant, will cause issues with many characters
-            for entity_id, controller in harmony_globals.active_entities.items():
-                if entity_id == self.entity_controller.entity_id or controller.perceptionModule is None:
-                    continue
-                #
-                event.payload = {
+            perception_event = HarmonyLinkEvent(
+                event_id=event.event_id,
+                event_type=event.event_type,
+                status=event.status,
+                payload={
                     "entity_id": self.entity_controller.entity_id
                 }
-                await controller.perceptionModule.handle_event(event)
+            )
+            harmony_globals.event_bus.publish(
+                event.event_type, perception_event, source_id=self.entity_controller.entity_id
+            )
 
-        # User / Source entity stops talking
-        if event.event_type == EVENT_TYPE_STT_SPEECH_STOPPED and event.status == EVENT_STATE_DONE:
-            # This event is intended to perform as an "interruption event" for LLM and TTS
-            # on the listening entities.
-            # FIXME: This is not very performant, will cause issues with many characters
-            for entity_id, controller in harmony_globals.active_entities.items():
-                if entity_id == self.entity_controller.entity_id or controller.perceptionModule is None:
-                    continue
-                #
-                event.payload = {
-                    "entity_id": self.entity_controller.entity_id
-                }
-                await controller.perceptionModule.handle_event(event)
+        # Harmony Link confirmed listening, including the audio transport it accepts
+        if event.event_type == EVENT_TYPE_STT_START_LISTEN and event.status == EVENT_STATE_DONE:
+            accepted_transport = event.payload.get('audio_transport') if isinstance(event.payload, dict) else None
+            if accepted_transport == self.audio_transport:
+                self.negotiated_audio_transport = accepted_transport
+            else:
+                # Harmony Link versions without transport negotiation only understand base64
+                self.negotiated_audio_transport = AUDIO_TRANSPORT_BASE64
+            logging.debug('Microphone audio transport: {0}'.format(self.negotiated_audio_transport))
+
+            accepted_audio_codec = event.payload.get('audio_codec') if isinstance(event.payload, dict) else None
+            if accepted_audio_codec == self.audio_codec:
+                self.negotiated_audio_codec = accepted_audio_codec
+            else:
+                self.negotiated_audio_codec = audio_codec.AUDIO_CODEC_PCM
+            logging.debug('Microphone audio codec: {0}'.format(self.negotiated_audio_codec))
+
+            # Harmony Link versions without local VAD support would take skipped audio for real silence.
+            # Skipping may be downgraded to marking, which doesn't change the audio itself
+            accepted_local_vad = event.payload.get('local_vad') if isinstance(event.payload, dict) else None
+            if accepted_local_vad == self.local_vad or (accepted_local_vad == vad.LOCAL_VAD_MARK and self.local_vad == vad.LOCAL_VAD_SKIP):
+                self.negotiated_local_vad = accepted_local_vad
+            else:
+                self.negotiated_local_vad = vad.LOCAL_VAD_OFF
+            self.vad_lookahead_bytes = self.vad_skip_lookahead_bytes if self.negotiated_local_vad == vad.LOCAL_VAD_SKIP else 0
+            logging.debug('Microphone local VAD: {0}'.format(self.negotiated_local_vad))
+
+            accepted_uplink_mode = event.payload.get('uplink_mode') if isinstance(event.payload, dict) else None
+            if accepted_uplink_mode == UPLINK_MODE_PUSH and self.uplink_mode == UPLINK_MODE_PUSH and self.recording_buffer is not None:
+                self.negotiated_uplink_mode = UPLINK_MODE_PUSH
+                self.start_push()
+            else:
+                self.negotiated_uplink_mode = UPLINK_MODE_PULL
+                await self.stop_push(flush=False)
+            logging.debug('Microphone uplink mode: {0}'.format(self.negotiated_uplink_mode))
 
         # Received event to start recording Audio through the Game's utilities
         if event.event_type == EVENT_TYPE_STT_FETCH_MICROPHONE and event.status == EVENT_STATE_DONE:
@@ -112,16 +214,19 @@ class SpeechToTextHandler(HarmonyClientModuleBase):
             start_byte = recording_task.get('start_byte', 0)
             bytes_count = recording_task.get('bytes_count', self.bytes_per_second * 5)  # Default to 5 seconds
 
-            # Start a new thread to handle recording
-            fetch_microphone_thread = threading.Thread(
-                target=self.process_recording_request,
-                args=(event.event_id, start_byte, bytes_count)
-            )
-            fetch_microphone_thread.start()
+            # Audio which isn't being recorded will never arrive, so the request can't wait for it
+            if self.audio_stream is None or self.recording_buffer is None:
+                logging.warning('Rejecting microphone fetch request {0}, not recording'.format(event.event_id))
+                await self.send_fetch_error(event.event_id, 'microphone is not recording')
+                return
 
             # Store event to mark it as processing
             self.active_recording_events[event.event_id] = event
 
+            # Wait for the end of the requested range to be recorded, it might be available already
+            self.fetch_waiters.add(start_byte + bytes_count + self.vad_lookahead_bytes, (event.event_id, start_byte, bytes_count))
+            self.complete_fetch_requests()
+
     async def start_listen(self):
         if self.is_recording_microphone:
             return False
@@ -130,7 +235,18 @@ class SpeechToTextHandler(HarmonyClientModuleBase):
         if not self.start_continuous_recording():
             return False
 
-        # Send Event to Harmony Link to listen to the recorded Audio
+        success = await self.send_start_listen()
+        if success:
+            logging.info('Harmony Link: listening...')
+            self.is_recording_microphone = True
+            return True
+        else:
+            logging.error('Harmony Link: listen failed')
+            # Stop recording
+            return False
+
+    async def send_start_listen(self):
+        # Send Event to Harmony Link to listen to the recorded Audio, transport / codec / uplink mode / local VAD get negotiated anew
         event = HarmonyLinkEvent(
             event_id='start_listen',  # This is an arbitrary dummy ID to conform the Harmony Link API
             event_type=EVENT_TYPE_STT_START_LISTEN,
@@ -140,22 +256,52 @@ class SpeechToTextHandler(HarmonyClientModuleBase):
                 "result_mode": RESULT_MODE_RETURN if bool(self.config['auto_vad']) else RESULT_MODE_PROCESS,
                 "channels": self.channels,
                 "bit_depth": self.bit_depth,
-                "sample_rate": self.sample_rate
+                "sample_rate": self.sample_rate,
+                "audio_transport": self.audio_transport,
+                "uplink_mode": self.uplink_mode,
+                "local_vad": self.local_vad,
+                "audio_codec": self.audio_codec
             }
         )
-        success = await self.backend_connector.send_event(event)
-        if success:
-            logging.info('Harmony Link: listening...')
-            self.is_recording_microphone = True
-            return True
-        else:
-            logging.error('Harmony Link: listen failed')
-            # Stop recording
-            return False
+        self.negotiated_audio_transport = AUDIO_TRANSPORT_BASE64
+        self.negotiated_audio_codec = audio_codec.AUDIO_CODEC_PCM
+        self.negotiated_uplink_mode = UPLINK_MODE_PULL
+        self.negotiated_local_vad = vad.LOCAL_VAD_OFF
+        self.vad_lookahead_bytes = 0
+        return await self.backend_connector.send_event(event)
+
+    def handle_reconnect(self):
+        # A reconnected Harmony Link starts a new listening session, requesting audio from offset 0 again
+        if not self.is_recording_microphone:
+            return
+        if self.restart_listen_task is not None:
+            self.restart_listen_task.cancel()
+        self.restart_listen_task = asyncio.create_task(self.restart_listen())
+
+    async def restart_listen(self):
+        # Drops everything tied to the previous session, recording continues into a fresh buffer
+        await self.stop_push(flush=False)
+        for fetch_task in list(self.fetch_tasks):
+            fetch_task.cancel()
+        for event_id, _, _ in self.fetch_waiters.clear():
+            self.active_recording_events.pop(event_id, None)
+        self.reset_recording()
+        try:
+            await self.send_start_listen()
+            logging.info('Harmony Link: listening again after reconnect')
+        except Exception as e:
+            # Retried on the next reconnect
+            logging.error(f'Harmony Link: Failed to restart listening after reconnect: {e}')
 
     async def stop_listen(self):
         if not self.is_recording_microphone:
             return False
+        if self.restart_listen_task is not None:
+            self.restart_listen_task.cancel()
+            self.restart_listen_task = None
+
+        # Pushed audio needs to be complete before Harmony Link stops listening
+        await self.stop_push(flush=True)
 
         # Send Event to Harmony Link to stop listening
         event = HarmonyLinkEvent(
@@ -218,45 +364,31 @@ class SpeechToTextHandler(HarmonyClientModuleBase):
         # audio samples for Harmony's STT transcription module from the microphone
 
         # Reset Buffer before starting recording
-        self.recording_buffer = bytearray()
-        self.dropped_buffer_bytes = 0
+        self.reset_recording()
 
         logging.debug('Recording with microphone: "{0}"'.format(self.microphone_name))
 
-        def audio_stream_callback(indata, frames, time_info, status):
-            if status:
-                logging.debug(f"recording callback status: {status}")
-            audio_data = bytes(indata)
-            with self.lock:
-                self.recording_buffer.extend(audio_data)
-                # Remove oldest data if buffer exceeds max size
-                buffer_length = len(self.recording_buffer)
-                if buffer_length > self.max_buffer_bytes:
-                    excess_bytes = buffer_length - self.max_buffer_bytes
-                    del self.recording_buffer[:excess_bytes]
-                    self.dropped_buffer_bytes += excess_bytes
-
         try:
             # Get correct dtype
-            if self.bit_depth == 8:
+            if self.capture_bit_depth == 8:
                 dtype = 'int8'
-            elif self.bit_depth == 16:
+            elif self.capture_bit_depth == 16:
                 dtype = 'int16'
-            elif self.bit_depth == 24:
+            elif self.capture_bit_depth == 24:
                 dtype = 'int24'  # Note: int24 might not be supported directly
-            elif self.bit_depth == 32:
+            elif self.capture_bit_depth == 32:
                 dtype = 'int32'
             else:
-                raise ValueError(f"Unsupported bit depth: {self.bit_depth}")
+                raise ValueError(f"Unsupported bit depth: {self.capture_bit_depth}")
 
             # Create stream
             self.audio_stream = sd.RawInputStream(
-                samplerate=self.sample_rate,
-                blocksize=int(self.sample_rate * self.record_stepping / 1000),
+                samplerate=self.capture_sample_rate,
+                blocksize=int(self.capture_sample_rate * self.record_stepping / 1000),
                 device=self.microphone_index,
-                channels=self.channels,
+                channels=self.capture_channels,
                 dtype=dtype,
-                callback=audio_stream_callback
+                callback=self.audio_stream_callback
             )
             self.audio_stream.start()
             self.recording_start_time = time.time()
@@ -266,9 +398,40 @@ class SpeechToTextHandler(HarmonyClientModuleBase):
             logging.error('Failed to start continuous recording: {}'.format(e))
             return False
 
+    def reset_recording(self):
+        self.recording_buffer = AudioRingBuffer(self.max_buffer_bytes)
+        if (self.capture_sample_rate, self.capture_channels, self.capture_bit_depth) != (self.sample_rate, self.channels, self.bit_depth):
+            # Fresh filter state, the buffer only holds converted audio, so all offsets are in the uplink format
+            self.uplink_converter = dsp.PcmConverter(
+                self.capture_sample_rate, self.capture_channels, self.capture_bit_depth,
+                self.sample_rate, self.channels, self.bit_depth
+            )
+        else:
+            self.uplink_converter = None
+        self.push_offset = 0
+        self.push_sequence = 0
+
+    def audio_stream_callback(self, indata, frames, time_info, status):
+        # Runs on the capture thread
+        if status:
+            logging.debug(f"recording callback status: {status}")
+        if self.uplink_converter is not None:
+            indata = self.uplink_converter.process(indata)
+        # Single copy into the preallocated ring, oldest data gets overwritten once it's full
+        self.recording_buffer.write(indata)
+        total_written = self.recording_buffer.total_written
+        # Wake up the event loop if a fetch request can be completed or a push chunk is complete now
+        next_offset = self.fetch_waiters.next_offset
+        if next_offset is not None and total_written >= next_offset:
+            self.loop.call_soon_threadsafe(self.complete_fetch_requests)
+        next_offset = self.push_next_offset
+        if next_offset is not None and total_written >= next_offset:
+            self.loop.call_soon_threadsafe(self.push_wakeup.set)
+
     async def stop_continuous_recording(self):
         if self.audio_stream is None:
             return False
+        await self.stop_push(flush=False)
 
         # Wait until all recording events have completed
         timeout_counter = 0
@@ -287,85 +450,185 @@ class SpeechToTextHandler(HarmonyClientModuleBase):
             self.audio_stream.close()
             self.audio_stream = None
             logging.debug('Continuous recording stopped.')
+            # Requests for audio which won't be recorded anymore can't be completed
+            for event_id, _, _ in self.fetch_waiters.clear():
+                logging.warning('Dropping microphone fetch request {0}, recording stopped'.format(event_id))
+                self.active_recording_events.pop(event_id, None)
             return True
         except Exception as e:
             logging.error('Failed to stop recording: {}'.format(e))
             return False
 
-    def get_buffer_fetch_indices(self, start_byte, end_byte):
-        actual_start_byte = start_byte - self.dropped_buffer_bytes
-        actual_end_byte = end_byte - self.dropped_buffer_bytes
-        buffer_size = len(self.recording_buffer)
-        return actual_start_byte, actual_end_byte, buffer_size
-
-    def process_recording_request(self, event_id, start_byte, bytes_count):
-        # Get end byte
-        end_byte = start_byte + bytes_count
-        # Determine if we need to wait
-        with self.lock:
-            actual_start_byte, actual_end_byte, buffer_size = self.get_buffer_fetch_indices(start_byte, end_byte)
-
-        # If start index is after current buffer boundary
-        while actual_start_byte > buffer_size:
-            time_till_buffer_reached = (actual_start_byte - buffer_size) / self.bytes_per_second
-            time.sleep(time_till_buffer_reached)
-            # Determine again if we need to wait more
-            with self.lock:
-                actual_start_byte, actual_end_byte, buffer_size = self.get_buffer_fetch_indices(start_byte, end_byte)
-
-        # If end index is after current buffer boundary
-        while actual_end_byte > buffer_size:
-            time_till_buffer_reached = (actual_end_byte - buffer_size) / self.bytes_per_second
-            time.sleep(time_till_buffer_reached)
-            # Determine again if we need to wait more
-            with self.lock:
-                actual_start_byte, actual_end_byte, buffer_size = self.get_buffer_fetch_indices(start_byte, end_byte)
-
-        # Get bytes from buffer
-        with self.lock:
-            actual_start_byte, actual_end_byte, buffer_size = self.get_buffer_fetch_indices(start_byte, end_byte)
-
-            # Log final indices
-            logging.debug("Bytes count: {0}".format(bytes_count))
-            logging.debug("Start byte (total / buffer): {0} / {1}".format(start_byte, start_byte - self.dropped_buffer_bytes))
-            logging.debug("End byte (total / buffer): {0} / {1}".format(end_byte, end_byte - self.dropped_buffer_bytes))
-
-            audio_bytes = self.recording_buffer[actual_start_byte:actual_end_byte]
-
-        # DEBUG CODE
-        # print "Length of audio_bytes:", len(audio_bytes)
-        # print "First 20 bytes of audio_bytes:", audio_bytes[:20]
-
-        # Encode to base64
-        encoded_data = base64.b64encode(audio_bytes).decode('utf-8')
+    def complete_fetch_requests(self):
+        # Runs on the event loop, hands all fetch requests whose audio is recorded now to the encoder pool
+        if self.recording_buffer is None:
+            return
+        for event_id, start_byte, bytes_count in self.fetch_waiters.pop_ready(self.recording_buffer.total_written):
+            fetch_task = asyncio.create_task(self.send_recording_result(event_id, start_byte, bytes_count))
+            self.fetch_tasks.add(fetch_task)
+            fetch_task.add_done_callback(self.fetch_tasks.discard)
 
-        # DEBUG CODE
-        # print "Length of encoded_data:", len(encoded_data)
-        # print "First 50 characters of encoded_data:", encoded_data[:50]
+    async def send_recording_result(self, event_id, start_byte, bytes_count):
+        try:
+            _, audio_fields, binary_field = await self.loop.run_in_executor(
+                encode_executor, self.read_recording, start_byte, bytes_count
+            )
 
-        # Send result event
-        result_event = HarmonyLinkEvent(
-            event_id=event_id,
-            event_type=EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT,
-            status=EVENT_STATE_NEW,
-            payload={
-                'audio_bytes': encoded_data,
-                'channels': self.channels,
-                'bit_depth': self.bit_depth,
-                'sample_rate': self.sample_rate,
-            }
-        )
+            # Send result event
+            result_event = HarmonyLinkEvent(
+                event_id=event_id,
+                event_type=EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT,
+                status=EVENT_STATE_NEW,
+                payload={
+                    **audio_fields,
+                    'channels': self.channels,
+                    'bit_depth': self.bit_depth,
+                    'sample_rate': self.sample_rate,
+                }
+            )
+            await self.backend_connector.send_event(result_event, binary_field=binary_field)
+        except Exception as e:
+            logging.error(f"Failed to send event to Harmony Link: {e}")
+        finally:
+            # Remove the event from the tracking
+            self.active_recording_events.pop(event_id, None)
 
-        # Submit the coroutine to send the event and ensure it could be sent
-        future = asyncio.run_coroutine_threadsafe(
-            self.backend_connector.send_event(result_event),
-            self.loop
-        )
+    async def send_fetch_error(self, event_id, message):
         try:
-            future.result()
+            error_event = HarmonyLinkEvent(
+                event_id=event_id,
+                event_type=EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT,
+                status=EVENT_STATE_ERROR,
+                payload={'error': message}
+            )
+            await self.backend_connector.send_event(error_event)
         except Exception as e:
             logging.error(f"Failed to send event to Harmony Link: {e}")
 
-        # Remove the event from the tracking
-        del self.active_recording_events[event_id]
+    def start_push(self):
+        if self.push_task is not None and not self.push_task.done():
+            return
+        self.push_stopping = False
+        self.push_task = asyncio.create_task(self.push_loop())
+
+    async def stop_push(self, flush=True):
+        if self.push_task is None:
+            return
+        if flush:
+            # The push loop sends the remaining partial chunk, then exits
+            self.push_stopping = True
+            self.push_wakeup.set()
+            await asyncio.gather(self.push_task, return_exceptions=True)
+        else:
+            self.push_task.cancel()
+            await asyncio.gather(self.push_task, return_exceptions=True)
+        self.push_task = None
+        self.push_next_offset = None
+
+    async def push_loop(self):
+        # Streams recorded audio to Harmony Link in order, one chunk in flight at a time
+        while True:
+            self.push_next_offset = self.push_offset + self.push_chunk_bytes + self.vad_lookahead_bytes
+            if self.recording_buffer.total_written < self.push_next_offset and not self.push_stopping:
+                await self.push_wakeup.wait()
+                self.push_wakeup.clear()
+                continue
+
+            bytes_count = min(self.push_chunk_bytes, self.recording_buffer.total_written - self.push_offset)
+            if bytes_count <= 0:
+                break  # Stopping with nothing left to send
+            start_byte = self.push_offset
+            self.push_offset += bytes_count
+            try:
+                start_byte, audio_fields, binary_field = await self.loop.run_in_executor(
+                    encode_executor, self.read_recording, start_byte, bytes_count
+                )
+                input_audio_event = HarmonyLinkEvent(
+                    event_id='input_audio_{0}'.format(self.push_sequence),
+                    event_type=EVENT_TYPE_STT_INPUT_AUDIO,
+                    status=EVENT_STATE_NEW,
+                    payload={
+                        'sequence': self.push_sequence,
+                        'start_byte': start_byte,
+                        'bytes_count': self.push_offset - start_byte,
+                        **audio_fields,
+                        'channels': self.channels,
+                        'bit_depth': self.bit_depth,
+                        'sample_rate': self.sample_rate,
+                    }
+                )
+                self.push_sequence += 1
+                await self.backend_connector.send_event(input_audio_event, binary_field=binary_field)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Live audio isn't retried, Harmony Link notices the gap from the offsets
+                logging.error(f"Failed to push microphone audio to Harmony Link: {e}")
+
+        self.push_next_offset = None
+
+    def read_recording(self, start_byte, bytes_count):
+        # Runs on the encoder pool, the requested range has been recorded already.
+        # Returns the start byte actually read, the audio payload fields and the binary payload field if any
+        end_byte = start_byte + bytes_count
+
+        # Log final indices
+        logging.debug("Bytes count: {0}".format(bytes_count))
+        logging.debug("Start byte / end byte: {0} / {1}".format(start_byte, end_byte))
+
+        start_byte, audio_bytes = self.read_range(start_byte, end_byte)
+        if start_byte > end_byte - bytes_count:
+            logging.warning('Requested audio from byte {0} has been dropped, sending from byte {1}'.format(
+                end_byte - bytes_count, start_byte))
+
+        audio_fields = {}
+        if self.negotiated_local_vad != vad.LOCAL_VAD_OFF:
+            speech_ranges = self.detect_speech_ranges(start_byte, end_byte, audio_bytes)
+            audio_fields['speech_ranges'] = speech_ranges
+            if self.negotiated_local_vad == vad.LOCAL_VAD_SKIP and not speech_ranges:
+                # Only the range gets reported, so Harmony Link can treat it as silence
+                self.vad_skipped_bytes += len(audio_bytes)
+                audio_bytes = b''
+                audio_fields['skipped'] = True
+
+        if self.negotiated_audio_codec != audio_codec.AUDIO_CODEC_PCM:
+            audio_bytes = audio_codec.encode_audio(
+                audio_bytes, self.negotiated_audio_codec, self.sample_rate, self.channels, self.bit_depth
+            )
+            audio_fields['audio_codec'] = self.negotiated_audio_codec
 
+        if self.negotiated_audio_transport == AUDIO_TRANSPORT_BINARY:
+            # Sent as is in a binary frame
+            audio_fields['audio_bytes'] = audio_bytes
+            return start_byte, audio_fields, 'audio_bytes'
+        # Encode to base64
+        audio_fields['audio_bytes'] = base64.b64encode(audio_bytes).decode('utf-8')
+        return start_byte, audio_fields, None
+
+    def read_range(self, start_byte, end_byte):
+        # Get bytes from buffer - data which has been overwritten already is skipped.
+        # Returns the start byte actually read and the audio bytes
+        audio_bytes = None
+        while audio_bytes is None:
+            start_byte = min(max(start_byte, self.recording_buffer.get_oldest_available()), end_byte)
+            audio_bytes = self.recording_buffer.read(start_byte, end_byte)
+        return start_byte, audio_bytes
+
+    def detect_speech_ranges(self, start_byte, end_byte, audio_bytes):
+        # Classifies the audio together with the hangover before and the pre-roll after it, as far as available.
+        # Returns the absolute [start, end) byte ranges within the audio which need to be transcribed
+        frame_bytes = self.channels * self.bytes_per_sample
+        vad_frame_bytes = self.vad.frame_length * frame_bytes
+        context_bytes = self.vad.hangover_frames * vad_frame_bytes
+        context_start, context_before = self.read_range(start_byte - min(context_bytes, start_byte), start_byte)
+        lookahead_bytes = max(0, min(self.vad.preroll_frames * vad_frame_bytes, self.recording_buffer.total_written - end_byte))
+        _, context_after = self.read_range(end_byte, end_byte + lookahead_bytes - lookahead_bytes % frame_bytes)
+
+        samples = vad.pcm_to_mono(b''.join((context_before, audio_bytes, context_after)), self.bit_depth, self.channels)
+        speech_ranges = []
+        for start_frame, end_frame in vad.find_ranges(self.vad.detect(samples)):
+            range_start = max(context_start + start_frame * vad_frame_bytes, start_byte)
+            range_end = min(context_start + end_frame * vad_frame_bytes, end_byte)
+            if range_start < range_end:
+                speech_ranges.append([range_start, range_end])
+        return speech_ranges
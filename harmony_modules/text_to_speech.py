@@ -6,23 +6,261 @@ import logging
 
 # Import Client base Module
 from harmony_modules.common import *
+from harmony_modules import lipsync, dsp, metrics
 
+import numpy as np
 import sounddevice as sd
 import soundfile as sf
 
 import asyncio
+import os
 import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Specify RNG lib here in case we need to replace it at some point
 rng = random.Random()
 
+# Worker threads for decoding utterance audio off the event loop
+decode_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='tts-decode')
+
+# Decoding block sizes in seconds - the first block is kept small, so playback can start
+# within a fixed latency budget regardless of the utterance length
+FIRST_DECODE_BLOCK_DURATION = 0.1
+DECODE_BLOCK_DURATION = 1.0
+
+
+# DecodedAudio - utterance audio which is decoded block by block in a worker thread,
+# and can already be played while decoding is still in progress.
+# Audio is converted into the output stream's format while decoding.
+class DecodedAudio:
+    def __init__(self, audio_file, loop, lipsync_mode, sample_rate, channels):
+        self.audio_file = audio_file
+        self.loop = loop
+        self.lipsync_mode = lipsync_mode
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # Set by the decoding thread
+        self.source_sample_rate = None
+        self.frames = 0
+        self.frames_ready = 0
+        self.audio_data = None
+        self.lipsync_track = None
+        self.done = False
+        # Resolved as soon as the first block can be played
+        self.ready = loop.create_future()
+        # Resolved once the whole file has been decoded successfully
+        self.completed = loop.create_future()
+
+    def start(self):
+        self.loop.run_in_executor(decode_executor, self.decode)
+        return self
+
+    def decode(self):
+        try:
+            with sf.SoundFile(self.audio_file) as audio_file:
+                self.source_sample_rate = audio_file.samplerate
+                converter = dsp.AudioConverter(
+                    input_rate=audio_file.samplerate,
+                    input_channels=audio_file.channels,
+                    output_rate=self.sample_rate,
+                    output_channels=self.channels
+                )
+                self.audio_data = np.zeros((converter.get_output_frames(audio_file.frames), self.channels), dtype=np.float32)
+                # Lipsync is analyzed on the source audio, its track uses the source sample rate
+                self.lipsync_track = lipsync.create_lipsync_track(audio_file.frames, audio_file.samplerate, mode=self.lipsync_mode)
+
+                # Block sizes need to be aligned with lipsync frames, so every block can be analyzed on its own
+                hop_length = lipsync.get_hop_length(audio_file.samplerate)
+                block_size = hop_length * max(1, round(FIRST_DECODE_BLOCK_DURATION * audio_file.samplerate / hop_length))
+                source_position = 0
+                position = 0
+                while source_position < audio_file.frames:
+                    block = audio_file.read(min(block_size, audio_file.frames - source_position), dtype='float32', always_2d=True)
+                    if len(block) == 0:
+                        break
+                    if self.lipsync_track is not None:
+                        self.lipsync_track.analyze(block, source_position)
+                    source_position += len(block)
+
+                    converted = converter.process(block)[:len(self.audio_data) - position]
+                    self.audio_data[position:position + len(converted)] = converted
+                    position += len(converted)
+                    # Publish progress only after the block is fully written
+                    self.frames_ready = position
+                    if not self.ready.done():
+                        self.loop.call_soon_threadsafe(self.set_ready)
+                    block_size = hop_length * max(1, round(DECODE_BLOCK_DURATION * audio_file.samplerate / hop_length))
+
+                self.frames = position
+                self.done = True
+                self.loop.call_soon_threadsafe(self.set_completed)
+        except Exception as e:
+            self.frames = self.frames_ready
+            self.done = True
+            self.loop.call_soon_threadsafe(self.set_error, e)
+
+    def set_ready(self):
+        if not self.ready.done():
+            self.ready.set_result(True)
+
+    def set_completed(self):
+        self.set_ready()
+        self.completed.set_result(True)
+
+    def set_error(self, error):
+        self.completed.set_result(False)
+        if not self.ready.done():
+            self.ready.set_exception(error)
+        else:
+            logging.error('[TextToSpeechHandler]: Decoding of audio file {0} failed: {1}'.format(self.audio_file, error))
+
+    def read(self, start, frames):
+        # Returns the block of decoded audio available from start, and whether the end of the audio was reached
+        available = self.frames if self.done else self.frames_ready
+        end = min(start + frames, available)
+        return self.audio_data[start:end], self.done and end >= available
+
+    def get_lipsync_parameters(self, index):
+        # Maps a playback index in output frames onto the lipsync track
+        if self.lipsync_track is None:
+            return None
+        return self.lipsync_track.parameters_at(index * self.lipsync_track.sample_rate // self.sample_rate)
+
+    def get_size(self):
+        size = self.audio_data.nbytes if self.audio_data is not None else 0
+        if self.lipsync_track is not None:
+            size += self.lipsync_track.values.nbytes
+        return size
+
+
+# DecodedAudioCache - LRU cache of fully decoded utterances, bounded by a memory budget in bytes
+class DecodedAudioCache:
+    def __init__(self, max_bytes, entity_id=None):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        # Metrics
+        self.hits_metric = metrics.TTS_AUDIO_CACHE_LOOKUPS.labels(entity_id=entity_id, result='hit')
+        self.misses_metric = metrics.TTS_AUDIO_CACHE_LOOKUPS.labels(entity_id=entity_id, result='miss')
+        self.size_metric = metrics.TTS_AUDIO_CACHE_SIZE.labels(entity_id=entity_id)
+
+    def get_key(self, audio_file):
+        # Harmony Link reuses output paths for different utterances, so a path alone doesn't identify the audio.
+        # Files which can't be identified anymore, e.g. deleted ones, are never looked up
+        audio_path = os.path.abspath(audio_file)
+        try:
+            file_stat = os.stat(audio_path)
+        except OSError:
+            return None
+        return audio_path, file_stat.st_size, file_stat.st_mtime_ns
+
+    def get(self, key):
+        decoded_audio = self.entries.get(key) if key is not None else None
+        if decoded_audio is None:
+            self.misses_metric.inc()
+            return None
+        self.entries.move_to_end(key)
+        self.hits_metric.inc()
+        return decoded_audio
+
+    def put(self, key, decoded_audio):
+        size = decoded_audio.get_size()
+        if key is None or key in self.entries or size > self.max_bytes:
+            return
+
+        # Evict least recently used entries until the new one fits into the budget
+        while self.size_bytes + size > self.max_bytes:
+            _, evicted_audio = self.entries.popitem(last=False)
+            self.size_bytes -= evicted_audio.get_size()
+
+        self.entries[key] = decoded_audio
+        self.size_bytes += size
+        self.size_metric.set(self.size_bytes)
+
+
+# UtteranceQueuePlayer - feeds queued utterances back to back into a single long-lived output stream,
+# so consecutive utterances play without gaps or device re-open latency
+class UtteranceQueuePlayer:
+    def __init__(self, loop, on_started, on_finished):
+        self.loop = loop
+        # Callbacks are invoked on the event loop with the utterance dict
+        self.on_started = on_started
+        self.on_finished = on_finished
+        self.queue = deque()
+        self.current = None
+        self.lock = threading.Lock()
+        # Seconds from a sample being written to the output buffer until it's audible
+        self.output_latency = 0.0
+        # Bumped by clear(), start notifications still queued for dropped utterances are outdated then
+        self.generation = 0
+
+    def enqueue(self, utterance):
+        with self.lock:
+            self.queue.append(utterance)
+
+    def clear(self):
+        # Drops the current and all queued utterances, returns the dropped ones
+        with self.lock:
+            dropped = ([self.current] if self.current is not None else []) + list(self.queue)
+            self.current = None
+            self.queue.clear()
+            self.generation += 1
+        return dropped
+
+    def is_dropped(self, utterance):
+        # True if the utterance has been dropped by clear() since it started playing
+        return utterance.get('generation') != self.generation
+
+    def is_idle(self):
+        return self.current is None and len(self.queue) == 0
+
+    def fill(self, outdata, frames):
+        # Called from the audio thread - fills the output buffer, continuing seamlessly into the next utterance
+        position = 0
+        with self.lock:
+            while position < frames:
+                if self.current is None:
+                    if len(self.queue) == 0:
+                        break
+                    self.current = self.queue.popleft()
+                    self.current['first_sample_time'] = time.perf_counter() + self.output_latency
+                    self.current['generation'] = self.generation
+                    self.loop.call_soon_threadsafe(self.on_started, self.current)
+
+                data_slice, finished = self.current['audio'].read(self.current['index'], frames - position)
+                outdata[position:position + len(data_slice)] = data_slice
+                position += len(data_slice)
+                self.current['index'] += len(data_slice)
+
+                if finished:
+                    self.loop.call_soon_threadsafe(self.on_finished, self.current)
+                    self.current = None
+                elif position < frames:
+                    # Decoding fell behind, play silence until the next block is ready
+                    break
+
+        outdata[position:] = 0
+
+
 # TextToSpeechHandler - main module class
 class TextToSpeechHandler(HarmonyClientModuleBase):
+    event_subscriptions = {
+        EVENT_TYPE_AI_STATUS: (EVENT_STATE_DONE,),
+        EVENT_TYPE_AI_SPEECH: (EVENT_STATE_DONE,),
+        EVENT_TYPE_AI_ACTION: (EVENT_STATE_DONE,),
+    }
+
     def __init__(self, entity_controller, tts_config):
         # execute the base constructor
         HarmonyClientModuleBase.__init__(self, entity_controller=entity_controller)
         # Set config
         self.config = tts_config
+        # Output format of the speaker stream, utterances are converted to it while decoding
+        self.output_sample_rate = int(self.config.get('output_sample_rate', 44100))
+        self.output_channels = int(self.config.get('output_channels', 2))
         # Setup Audio Device
         self.setup_speaker()
         # Event loop reference for synchronizing threads
@@ -30,9 +268,24 @@ class TextToSpeechHandler(HarmonyClientModuleBase):
         # TTS Handling
         self.speech_suppressed = False
         self.playing_utterance = None
-        self.playing_stream = None
-        self.pending_utterances = []
+        self.output_stream = None
+        self.player = UtteranceQueuePlayer(
+            loop=self.loop,
+            on_started=self.playback_started,
+            on_finished=self.playback_finished
+        )
+        self.last_time_to_first_sample = None
+        self.lipsync_task = None
         self.lipsync_interval = 0.1
+        self.lipsync_mode = self.config.get('lipsync_mode', lipsync.LIPSYNC_MODE_ENVELOPE)
+        if self.lipsync_mode not in (lipsync.LIPSYNC_MODE_FAKE, lipsync.LIPSYNC_MODE_ENVELOPE, lipsync.LIPSYNC_MODE_SPECTRAL):
+            logging.warning('Unknown lipsync mode "{0}", using envelope'.format(self.lipsync_mode))
+            self.lipsync_mode = lipsync.LIPSYNC_MODE_ENVELOPE
+        # Frames written to the output stream ahead of what's audible, lipsync follows the audible position
+        self.output_latency_frames = 0
+        # Decoded audio cache for repeated utterances
+        audio_cache_size = int(float(self.config.get('audio_cache_size_mb', 0)) * 1024 * 1024)
+        self.audio_cache = DecodedAudioCache(max_bytes=audio_cache_size, entity_id=self.entity_controller.entity_id) if audio_cache_size > 0 else None
 
     def setup_speaker(self):
         logging.debug('setting up speaker / audio output device')
@@ -71,13 +324,41 @@ class TextToSpeechHandler(HarmonyClientModuleBase):
 
             # Setup Output device in lib
             sd.check_output_settings(device=speaker_index)
-            sd.default.samplerate = 44100
+            sd.default.samplerate = self.output_sample_rate
             sd.default.device = (sd.default.device[0], speaker_index)
             logging.debug(f'Speaker set to "{speaker_name}" with index {speaker_index}.')
         except Exception as e:
             logging.error(f"Failed to set up speaker: {e}")
             raise
 
+    def activate(self):
+        # Open one long-lived output stream, it plays silence while no utterance is queued
+        self.output_stream = sd.OutputStream(
+            samplerate=self.output_sample_rate,
+            channels=self.output_channels,
+            dtype='float32',
+            latency='low',
+            callback=self.output_callback
+        )
+        self.output_stream.start()
+        self.player.output_latency = self.output_stream.latency
+        self.output_latency_frames = int(self.output_stream.latency * self.output_sample_rate)
+        logging.debug('[{0}]: Output stream started with latency {1:.1f} ms'.format(
+            self.__class__.__name__, self.output_stream.latency * 1000))
+        HarmonyClientModuleBase.activate(self)
+
+    def deactivate(self):
+        HarmonyClientModuleBase.deactivate(self)
+        self.player.clear()
+        if self.output_stream is not None:
+            self.output_stream.close()
+            self.output_stream = None
+
+    def output_callback(self, outdata, frames, time_info, status):
+        if status:
+            logging.debug(f"[TextToSpeechHandler]: output callback status: {status}")
+        self.player.fill(outdata, frames)
+
     async def handle_event(
             self,
             event  # HarmonyLinkEvent
@@ -92,6 +373,9 @@ class TextToSpeechHandler(HarmonyClientModuleBase):
                 event.event_type == EVENT_TYPE_AI_ACTION
         ) and event.status == EVENT_STATE_DONE:
 
+            received_time = time.perf_counter()
+            if event.event_type == EVENT_TYPE_AI_SPEECH:
+                metrics.ai_response_timer.stop(self.entity_controller.entity_id, end_time=received_time)
             utterance_data = event.payload
             audio_file = utterance_data["audio_file"]
 
@@ -109,98 +393,91 @@ class TextToSpeechHandler(HarmonyClientModuleBase):
                     await self.backend_connector.send_event(playback_done_event)
                     return
 
-                # Build Sound source and queue it for playing
-                # soundType can be "BGM", "ENV", "SystemSE" or "GameSE"
-                # they are almost the same but with separated volume control in studio setting
-                audio_data, sample_rate = sf.read(audio_file)
-                logging.debug('[{0}]: Successfully loaded audio file: {1}'.format(self.__class__.__name__, audio_file))
-
-                # Append to queue
-                self.pending_utterances.append((
-                    audio_file,
-                    audio_data,
-                    sample_rate
-                ))
-                # Play
-                await self.play_voice()
+                # Decode audio in a worker thread and wait until the first block is ready for playing
+                # Lipsync analysis is done along with decoding, playback just looks up the precomputed values
+                decoded_audio = self.load_audio(audio_file)
+                try:
+                    await decoded_audio.ready
+                except Exception as e:
+                    logging.error('[{0}]: Failed to load audio file {1}: {2}'.format(self.__class__.__name__, audio_file, e))
+                    return
+                logging.debug('[{0}]: Started loading audio file: {1}'.format(self.__class__.__name__, audio_file))
 
-            # TODO: Update chara to perform lipsync on play
+                # Append to queue, the output stream picks it up right after the currently playing utterance
+                self.player.enqueue({
+                    'audio_file': audio_file,
+                    'audio': decoded_audio,
+                    'index': 0,
+                    'received_time': received_time,
+                    'first_sample_time': None
+                })
 
         return
 
-    async def play_voice(self):
-        if self.playing_utterance is not None:
+    def load_audio(self, audio_file):
+        if self.audio_cache is None:
+            return self.create_decoded_audio(audio_file).start()
+
+        cache_key = self.audio_cache.get_key(audio_file)
+        decoded_audio = self.audio_cache.get(cache_key)
+        if decoded_audio is not None:
+            logging.debug('[{0}]: Audio cache hit for file: {1}'.format(self.__class__.__name__, audio_file))
+            return decoded_audio
+
+        # Add to cache once fully decoded, so cached entries never depend on the source file anymore
+        decoded_audio = self.create_decoded_audio(audio_file).start()
+
+        def add_to_cache(completed):
+            if completed.result():
+                self.audio_cache.put(cache_key, decoded_audio)
+
+        decoded_audio.completed.add_done_callback(add_to_cache)
+        return decoded_audio
+
+    def create_decoded_audio(self, audio_file):
+        return DecodedAudio(
+            audio_file=audio_file,
+            loop=self.loop,
+            lipsync_mode=self.lipsync_mode,
+            sample_rate=self.output_sample_rate,
+            channels=self.output_channels
+        )
+
+    def playback_started(self, utterance):
+        # The utterance may have been suppressed while this notification was queued
+        if self.player.is_dropped(utterance):
             return
+        self.playing_utterance = utterance
+        self.last_time_to_first_sample = utterance['first_sample_time'] - utterance['received_time']
+        metrics.TTS_FIRST_SAMPLE_LATENCY.labels(entity_id=self.entity_controller.entity_id).observe(self.last_time_to_first_sample)
+        logging.debug('[TextToSpeechHandler]: Playing audio file: {0} (time to first sample: {1:.1f} ms)'.format(
+            utterance['audio_file'], self.last_time_to_first_sample * 1000))
 
-        while len(self.pending_utterances) > 0:
-            audio_file, audio_data, sample_rate = self.pending_utterances.pop(0)
-
-            # Keep reference to the currently playing utterance
-            self.playing_utterance = {
-                'audio_file': audio_file,
-                'audio_data': audio_data,
-                'sample_rate': sample_rate,
-                'index': 0,
-                'length': len(audio_data)
-            }
-
-            def callback(outdata, frames, time, status):
-                start = self.playing_utterance['index']
-                end = start + frames
-                if end > self.playing_utterance['length']:
-                    end = self.playing_utterance['length']
-
-                data_slice = self.playing_utterance['audio_data'][start:end]
-                # Reshape array in case audio data is mono
-                if data_slice.ndim == 1:
-                    data_slice = data_slice[:, None]
-
-                out_frames = len(data_slice)
-                outdata[:out_frames] = data_slice
-
-                if out_frames < frames:
-                    outdata[out_frames:] = 0
-                    self.loop.call_soon_threadsafe(self.playback_finished)
-                    raise sd.CallbackStop()
-
-                self.playing_utterance['index'] = end
-
-            # Determine if Stereo or Mono Audio
-            channels = self.playing_utterance['audio_data'].shape[1] if self.playing_utterance['audio_data'].ndim > 1 else 1
-
-            # Play audio
-            self.playing_stream = sd.OutputStream(
-                samplerate=self.playing_utterance['sample_rate'],
-                channels=channels,
-                callback=callback
-            )
-            self.playing_stream.start()
-            logging.debug(f'[TextToSpeechHandler]: Playing audio file: {audio_file}')
-            # Wait until audio stream has been played completely or surpressed
-            await self.monitor_playback()
+        # Keep lipsync running while utterances are playing
+        if self.lipsync_task is None or self.lipsync_task.done():
+            self.lipsync_task = asyncio.create_task(self.monitor_playback())
 
     async def monitor_playback(self):
-        while self.playing_stream and self.playing_stream.active:
-            asyncio.run_coroutine_threadsafe(self.fake_lipsync_update(), self.loop)
+        while self.playing_utterance is not None:
+            self.lipsync_update()
             await asyncio.sleep(self.lipsync_interval)
 
-    def playback_finished(self):
-        logging.debug(f'[TextToSpeechHandler]: Done playing file: {self.playing_utterance["audio_file"]}')
+    def playback_finished(self, utterance):
+        logging.debug(f'[TextToSpeechHandler]: Done playing file: {utterance["audio_file"]}')
 
         # Send Playback done event to harmony link, so the audio file gets cleaned up.
         playback_done_event = HarmonyLinkEvent(
             event_id='playback_done',
             event_type=EVENT_TYPE_TTS_PLAYBACK_DONE,
             status=EVENT_STATE_NEW,
-            payload=self.playing_utterance['audio_file']
+            payload=utterance['audio_file']
         )
         asyncio.create_task(self.backend_connector.send_event(playback_done_event))
 
-        # Cleanup
-        self.playing_stream.close()
-        asyncio.run_coroutine_threadsafe(self.fake_lipsync_stop(), self.loop)
-        self.playing_stream = None
-        self.playing_utterance = None
+        # Cleanup - a directly following utterance is set as playing by its own start notification
+        if self.playing_utterance is utterance:
+            self.lipsync_stop()
+            self.playing_utterance = None
 
     def suppress_speech(self, suppress=False):
         # Update suppression mode
@@ -209,26 +486,42 @@ class TextToSpeechHandler(HarmonyClientModuleBase):
         if not self.speech_suppressed:
             return
 
-        if self.playing_stream is None:
+        if self.playing_utterance is None and self.player.is_idle():
             return
 
-        # Stop the stream and cleanup
-        self.playing_stream.close()
-        asyncio.run_coroutine_threadsafe(self.fake_lipsync_stop(), self.loop)
-        self.playing_stream = None
+        # Drop playing and queued utterances and cleanup, the output stream keeps running
+        self.player.clear()
+        self.lipsync_stop()
         self.playing_utterance = None
-        self.pending_utterances = []
 
-    async def fake_lipsync_stop(self):
-        # logging.debug("[TextToSpeechHandler]: Fake Lipsync stopping")
-        if self.chara is not None:
-            await self.chara.controller.set_mouth_open(0)
+    def lipsync_stop(self):
+        # logging.debug("[TextToSpeechHandler]: Lipsync stopping")
+        if self.chara is None:
+            return
+
+        # Reset every parameter the lipsync track of the current utterance was driving
+        parameters = {'MouthOpen': 0}
+        if self.playing_utterance is not None and self.playing_utterance['audio'].lipsync_track is not None:
+            parameters.update(dict.fromkeys(self.playing_utterance['audio'].lipsync_track.parameter_ids, 0))
+        self.chara.controller.write_parameters(parameters)
+
+    def lipsync_update(self):
+        if self.chara is None or self.playing_utterance is None:
+            return
+
+        audible_index = max(0, self.playing_utterance['index'] - self.output_latency_frames)
+        lipsync_parameters = self.playing_utterance['audio'].get_lipsync_parameters(audible_index)
+        if lipsync_parameters is None:
+            self.fake_lipsync_update()
+            return
+
+        self.chara.controller.write_parameters(lipsync_parameters)
 
-    async def fake_lipsync_update(self):
+    def fake_lipsync_update(self):
         # logging.debug("[TextToSpeechHandler]: Fake Lipsync updating")
         if self.chara is not None:
             mo = rng.random()
             if mo > 0.7:
-                await self.chara.controller.set_mouth_open(1.0)
+                self.chara.controller.write_parameter('MouthOpen', 1.0)
             else:
-                await self.chara.controller.set_mouth_open(mo)
+                self.chara.controller.write_parameter('MouthOpen', mo)
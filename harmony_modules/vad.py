@@ -0,0 +1,80 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# VAD Module
+# Lightweight voice activity detection on raw microphone audio, used to avoid sending silence to Harmony Link.
+# Frames are classified by their energy and zero-crossing rate in a single vectorized pass.
+
+import numpy as np
+
+from harmony_modules import dsp
+
+# Local VAD Modes
+LOCAL_VAD_OFF = 'off'  # All audio is sent without classification
+LOCAL_VAD_MARK = 'mark'  # All audio is sent, annotated with the byte ranges containing speech
+LOCAL_VAD_SKIP = 'skip'  # Audio without speech is not sent, only its range is reported
+
+# Analysis defaults
+DEFAULT_FRAME_DURATION = 0.02  # seconds of audio per classified frame
+DEFAULT_ENERGY_THRESHOLD_DB = -45.0  # RMS level (dBFS) above which a frame counts as speech
+DEFAULT_ZCR_THRESHOLD = 0.25  # zero crossings per sample above which quieter frames count as unvoiced speech
+UNVOICED_ENERGY_MARGIN_DB = 10.0  # how far below the energy threshold unvoiced speech may be
+DEFAULT_HANGOVER = 0.3  # seconds kept after speech, so trailing syllables aren't clipped
+DEFAULT_PREROLL = 0.2  # seconds kept before speech, so word onsets aren't clipped
+
+
+def pcm_to_mono(audio_bytes, bit_depth, channels):
+    # Converts interleaved integer PCM into mono float32 samples in the range -1.0 - 1.0
+    samples = dsp.pcm_to_array(audio_bytes, bit_depth, channels)
+    return (samples.mean(axis=1) / dsp.get_pcm_full_scale(bit_depth)).astype(np.float32)
+
+
+def find_ranges(mask):
+    # Returns (start, end) index pairs of the consecutive True runs in a boolean array
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
+
+
+# EnergyVAD - stateless frame classifier, context around the classified audio is passed in by the caller
+class EnergyVAD:
+    def __init__(
+            self,
+            sample_rate,
+            frame_duration=DEFAULT_FRAME_DURATION,
+            energy_threshold_db=DEFAULT_ENERGY_THRESHOLD_DB,
+            zcr_threshold=DEFAULT_ZCR_THRESHOLD,
+            hangover=DEFAULT_HANGOVER,
+            preroll=DEFAULT_PREROLL
+    ):
+        self.sample_rate = sample_rate
+        self.frame_length = max(1, int(round(sample_rate * frame_duration)))
+        self.energy_threshold_db = energy_threshold_db
+        self.zcr_threshold = zcr_threshold
+        self.hangover_frames = int(round(hangover / frame_duration))
+        self.preroll_frames = int(round(preroll / frame_duration))
+
+    def classify_frames(self, samples):
+        # Raw per-frame decision, the last partial frame is zero padded
+        frame_count = -(-len(samples) // self.frame_length)
+        frames = np.zeros(frame_count * self.frame_length, dtype=np.float32)
+        frames[:len(samples)] = samples
+        frames = frames.reshape(frame_count, self.frame_length)
+
+        rms = np.sqrt(np.mean(np.square(frames), axis=1))
+        energy_db = 20.0 * np.log10(np.maximum(rms, 1e-6))
+        zero_crossings = np.count_nonzero(np.diff(np.signbit(frames), axis=1), axis=1) / self.frame_length
+
+        voiced = energy_db > self.energy_threshold_db
+        # Fricatives and sibilants are quiet but noisy, steady hum and rumble are not
+        unvoiced = (energy_db > self.energy_threshold_db - UNVOICED_ENERGY_MARGIN_DB) & (zero_crossings > self.zcr_threshold)
+        return voiced | unvoiced
+
+    def detect(self, samples):
+        # Speech mask per frame, extended by the hangover after and the pre-roll before each speech frame.
+        # Frame i is kept if any raw speech frame lies within [i - hangover, i + preroll].
+        speech = self.classify_frames(samples)
+        counts = np.concatenate(([0], np.cumsum(speech)))
+        indices = np.arange(len(speech))
+        window_start = np.maximum(indices - self.hangover_frames, 0)
+        window_end = np.minimum(indices + self.preroll_frames + 1, len(speech))
+        return counts[window_end] - counts[window_start] > 0
@@ -0,0 +1,11 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Unit tests, run from the repository root with `python -m pytest tests`
+import os
+import sys
+
+# The plugin modules, and the shared fakes next to the tests
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(tests_dir))
+sys.path.insert(0, tests_dir)
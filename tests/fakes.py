@@ -0,0 +1,45 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Fakes and helpers shared by the tests
+import asyncio
+
+from harmony_modules.common import HarmonyClientModuleBase
+
+TIMEOUT = 5.0
+
+
+# FakeEntityController - the parts of harmony.EntityController the client modules use
+class FakeEntityController:
+    def __init__(self, entity_id, connector):
+        self.entity_id = entity_id
+        self.connector = connector
+
+
+# RecordingModule - client module remembering the events and reconnects it has been notified of
+class RecordingModule(HarmonyClientModuleBase):
+    def __init__(self, entity_controller):
+        HarmonyClientModuleBase.__init__(self, entity_controller)
+        self.events = []
+        self.reconnects = 0
+
+    async def handle_event(self, event):
+        self.events.append(event)
+
+    def handle_reconnect(self):
+        self.reconnects += 1
+
+
+async def wait_for(condition):
+    # Polls until the condition holds, fails the test after TIMEOUT
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout=TIMEOUT)
+
+
+async def stop_link(fake_link):
+    # Stops a fake Harmony Link including the connections to it, like Harmony Link going away
+    await fake_link.stop()
+    for session in list(fake_link.sessions):
+        await session.websocket.close()
@@ -0,0 +1,117 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the audio buffer module
+import pytest
+
+from harmony_modules.audio_buffer import AudioRingBuffer, OffsetWaiterQueue
+
+
+def write_counting(buffer, start, length):
+    # Writes bytes whose value is their absolute offset modulo 256, so reads can be checked against offsets
+    buffer.write(bytes((start + index) % 256 for index in range(length)))
+
+
+def expected_bytes(start, end):
+    return bytes(offset % 256 for offset in range(start, end))
+
+
+def test_read_within_capacity():
+    buffer = AudioRingBuffer(16)
+    write_counting(buffer, 0, 10)
+    assert buffer.read(2, 8) == expected_bytes(2, 8)
+    assert buffer.read(5, 5) == b''
+    assert buffer.dropped_bytes == 0
+    assert buffer.get_oldest_available() == 0
+
+
+def test_read_across_wrap_around():
+    buffer = AudioRingBuffer(16)
+    write_counting(buffer, 0, 12)
+    write_counting(buffer, 12, 12)
+    assert buffer.total_written == 24
+    assert buffer.dropped_bytes == 8
+    assert buffer.get_oldest_available() == 8
+    assert buffer.read(8, 24) == expected_bytes(8, 24)
+    assert len(buffer.get_segments(10, 20)) == 2
+
+
+def test_overwritten_range_returns_none():
+    buffer = AudioRingBuffer(16)
+    write_counting(buffer, 0, 40)
+    assert buffer.read(0, 30) is None
+    assert buffer.read(23, 40) is None
+    assert buffer.read(24, 40) == expected_bytes(24, 40)
+
+
+def test_read_beyond_written_data_raises():
+    buffer = AudioRingBuffer(16)
+    write_counting(buffer, 0, 8)
+    with pytest.raises(ValueError):
+        buffer.read(0, 9)
+
+
+def test_write_larger_than_capacity_keeps_newest_bytes():
+    buffer = AudioRingBuffer(16)
+    write_counting(buffer, 0, 50)
+    assert buffer.total_written == 50
+    assert buffer.dropped_bytes == 34
+    assert buffer.read(34, 50) == expected_bytes(34, 50)
+
+
+def test_write_accepts_non_byte_buffers():
+    buffer = AudioRingBuffer(16)
+    buffer.write(memoryview(bytes(range(8))).cast('H'))
+    assert buffer.read(0, 8) == bytes(range(8))
+
+
+def test_read_detects_overwrite_while_copying():
+    # A write landing between copying and validating invalidates the copied range
+    class RacingRingBuffer(AudioRingBuffer):
+        def get_segments(self, start_byte, end_byte):
+            segments = AudioRingBuffer.get_segments(self, start_byte, end_byte)
+            write_counting(self, self.total_written, 8)
+            return segments
+
+    buffer = RacingRingBuffer(16)
+    write_counting(buffer, 0, 16)
+    assert buffer.read(0, 16) is None
+
+
+def test_waiters_are_released_in_offset_order():
+    queue = OffsetWaiterQueue()
+    queue.add(300, 'c')
+    queue.add(100, 'a')
+    queue.add(200, 'b')
+    assert len(queue) == 3
+    assert queue.next_offset == 100
+
+    assert queue.pop_ready(99) == []
+    assert queue.pop_ready(200) == ['a', 'b']
+    assert queue.next_offset == 300
+    assert queue.pop_ready(1000) == ['c']
+    assert queue.next_offset is None
+    assert len(queue) == 0
+
+
+def test_waiters_for_the_same_offset_keep_insertion_order():
+    queue = OffsetWaiterQueue()
+    for waiter in ('first', 'second', 'third'):
+        queue.add(50, waiter)
+    assert queue.pop_ready(50) == ['first', 'second', 'third']
+
+
+def test_waiters_need_not_be_comparable():
+    queue = OffsetWaiterQueue()
+    queue.add(10, object())
+    queue.add(10, object())
+    assert len(queue.pop_ready(10)) == 2
+
+
+def test_clear_returns_remaining_waiters():
+    queue = OffsetWaiterQueue()
+    queue.add(20, 'b')
+    queue.add(10, 'a')
+    assert queue.clear() == ['a', 'b']
+    assert queue.next_offset is None
+    assert len(queue) == 0
@@ -0,0 +1,60 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the audio codec module
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from harmony_modules import audio_codec, dsp
+
+SAMPLE_RATE = 16000
+
+
+def make_pcm(bit_depth, channels, duration=0.5):
+    t = np.arange(int(SAMPLE_RATE * duration)) / SAMPLE_RATE
+    samples = 0.5 * np.sin(2.0 * np.pi * 440.0 * t)
+    return dsp.float_to_pcm(np.repeat(samples[:, None], channels, axis=1), bit_depth)
+
+
+def test_is_supported():
+    assert audio_codec.is_supported(audio_codec.AUDIO_CODEC_PCM, 32)
+    assert audio_codec.is_supported(audio_codec.AUDIO_CODEC_FLAC, 24)
+    assert not audio_codec.is_supported(audio_codec.AUDIO_CODEC_FLAC, 32)
+    assert audio_codec.is_supported(audio_codec.AUDIO_CODEC_OGG, 16)
+    assert not audio_codec.is_supported('mp3', 16)
+
+
+def test_pcm_and_empty_audio_pass_through():
+    audio = make_pcm(16, 1)
+    assert audio_codec.encode_audio(audio, audio_codec.AUDIO_CODEC_PCM, SAMPLE_RATE, 1, 16) is audio
+    assert audio_codec.encode_audio(b'', audio_codec.AUDIO_CODEC_FLAC, SAMPLE_RATE, 1, 16) == b''
+
+
+@pytest.mark.parametrize('bit_depth', [8, 16, 24])
+@pytest.mark.parametrize('channels', [1, 2])
+def test_flac_is_lossless(bit_depth, channels):
+    audio = make_pcm(bit_depth, channels)
+    encoded = audio_codec.encode_audio(audio, audio_codec.AUDIO_CODEC_FLAC, SAMPLE_RATE, channels, bit_depth)
+    decoded, sample_rate = sf.read(io.BytesIO(encoded), dtype='float64', always_2d=True)
+    assert sample_rate == SAMPLE_RATE
+    assert decoded.shape[1] == channels
+    assert dsp.float_to_pcm(decoded, bit_depth) == audio
+
+
+def test_ogg_decodes_to_similar_audio():
+    audio = make_pcm(16, 1)
+    encoded = audio_codec.encode_audio(audio, audio_codec.AUDIO_CODEC_OGG, SAMPLE_RATE, 1, 16)
+    assert len(encoded) < len(audio)
+    decoded, sample_rate = sf.read(io.BytesIO(encoded), dtype='float32', always_2d=True)
+    original = dsp.pcm_to_float(audio, 16, 1)
+    assert sample_rate == SAMPLE_RATE
+    assert len(decoded) == len(original)
+    assert np.sqrt(np.mean(np.square(decoded - original))) < 0.05
+
+
+def test_unknown_codec_raises():
+    with pytest.raises(ValueError):
+        audio_codec.encode_audio(make_pcm(16, 1), 'mp3', SAMPLE_RATE, 1, 16)
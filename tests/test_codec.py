@@ -0,0 +1,64 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the codec module
+import pytest
+
+from harmony_modules import codec
+from harmony_modules.common import HarmonyLinkEvent
+
+
+def make_event(payload):
+    return HarmonyLinkEvent(event_id='event', event_type='TEST', status='DONE', payload=payload)
+
+
+def test_text_event_round_trip():
+    event = codec.decode_event(codec.encode_event(make_event({'content': 'Hällo', 'values': [1, 2.5, None]})))
+    assert (event.event_id, event.event_type, event.status) == ('event', 'TEST', 'DONE')
+    assert event.payload == {'content': 'Hällo', 'values': [1, 2.5, None]}
+
+
+@pytest.mark.parametrize('message', ['[]', '"event"', '{"event_id": "event", "status": "DONE"}'])
+def test_decode_event_rejects_invalid_messages(message):
+    with pytest.raises(ValueError):
+        codec.decode_event(message)
+
+
+def test_decode_event_rejects_invalid_json():
+    with pytest.raises(ValueError):
+        codec.decode_event('{"event_id": ')
+
+
+def test_binary_event_round_trip():
+    audio = bytes(range(256)) * 4
+    event = make_event({'audio': audio, 'start_byte': 0, 'end_byte': len(audio)})
+    frame = codec.encode_binary_event(event, 'audio')
+    assert frame.startswith(codec.BINARY_FRAME_MAGIC)
+    assert frame.endswith(audio)
+    # The event itself is left untouched
+    assert event.payload['audio'] is audio
+
+    decoded = codec.decode_binary_event(frame)
+    assert decoded.payload == {'audio': audio, 'start_byte': 0, 'end_byte': len(audio)}
+
+
+def test_binary_event_accepts_memoryview():
+    frame = codec.encode_binary_event(make_event({'audio': b'\x01\x02\x03'}), 'audio')
+    assert codec.decode_binary_event(memoryview(frame)).payload['audio'] == b'\x01\x02\x03'
+
+
+@pytest.mark.parametrize('frame', [
+    b'HLB',
+    b'XXXX\x00\x00\x00\x02{}',
+    codec.BINARY_FRAME_PREFIX.pack(codec.BINARY_FRAME_MAGIC, 100) + b'{}',
+])
+def test_decode_binary_event_rejects_invalid_frames(frame):
+    with pytest.raises(ValueError):
+        codec.decode_binary_event(frame)
+
+
+def test_decode_binary_event_requires_binary_field():
+    header = codec.json_dumps(make_event({}).to_dict()).encode('utf-8')
+    frame = codec.BINARY_FRAME_PREFIX.pack(codec.BINARY_FRAME_MAGIC, len(header)) + header + b'\x00'
+    with pytest.raises(ValueError):
+        codec.decode_binary_event(frame)
@@ -0,0 +1,257 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the connector module's event dispatch and reconnect handling, against the fake Harmony Link
+import asyncio
+import socket
+
+import pytest
+
+from benchmarks.fake_harmony_link import FakeHarmonyLink
+from fakes import TIMEOUT, FakeEntityController, RecordingModule, stop_link, wait_for
+from harmony_modules import connector
+from harmony_modules.common import *
+
+
+def make_event(event_type, payload=None):
+    return HarmonyLinkEvent(event_id=event_type.lower(), event_type=event_type, status=EVENT_STATE_NEW, payload=payload or {})
+
+
+def make_connector(endpoint, **kwargs):
+    kwargs.setdefault('reconnect_base_delay', 0.01)
+    kwargs.setdefault('reconnect_max_delay', 0.05)
+    return connector.ConnectorEventHandler(endpoint, shutdown_func=lambda: None, **kwargs)
+
+
+async def restart_link(fake_link):
+    # New server on the same port, the plugin's connections to the old one get closed
+    await stop_link(fake_link)
+    restarted_link = FakeHarmonyLink(port=fake_link.port)
+    await restarted_link.start()
+    return restarted_link
+
+
+def get_unused_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+
+# SpeechModule / DoneSpeechModule - modules subscribed to AI_SPEECH in any state / only in the DONE state
+class SpeechModule(RecordingModule):
+    event_subscriptions = {EVENT_TYPE_AI_SPEECH: None}
+
+
+class DoneSpeechModule(RecordingModule):
+    event_subscriptions = {EVENT_TYPE_AI_SPEECH: (EVENT_STATE_DONE,), EVENT_TYPE_STT_OUTPUT_TEXT: (EVENT_STATE_DONE,)}
+
+
+def test_events_are_dispatched_by_type_and_state():
+    async def run():
+        backend_connector = make_connector('ws://127.0.0.1:1')
+        entity_controller = FakeEntityController('dispatch', backend_connector)
+        speech_module = SpeechModule(entity_controller)
+        done_speech_module = DoneSpeechModule(entity_controller)
+        wildcard_module = RecordingModule(entity_controller)
+        for module in (speech_module, done_speech_module, wildcard_module):
+            module.activate()
+
+        events = [
+            HarmonyLinkEvent('speech_new', EVENT_TYPE_AI_SPEECH, EVENT_STATE_NEW, {}),
+            HarmonyLinkEvent('speech_done', EVENT_TYPE_AI_SPEECH, EVENT_STATE_DONE, {}),
+            HarmonyLinkEvent('text_done', EVENT_TYPE_STT_OUTPUT_TEXT, EVENT_STATE_DONE, {}),
+            HarmonyLinkEvent('other', EVENT_TYPE_ENVIRONMENT_LOADED, EVENT_STATE_DONE, {}),
+        ]
+        for event in events:
+            await backend_connector.handle_event(event)
+        await wait_for(lambda: len(wildcard_module.events) == len(events))
+        assert [event.event_id for event in speech_module.events] == ['speech_new', 'speech_done']
+        assert [event.event_id for event in done_speech_module.events] == ['speech_done', 'text_done']
+        assert [event.event_id for event in wildcard_module.events] == ['speech_new', 'speech_done', 'text_done', 'other']
+
+        # Unregistered modules are removed from the index
+        speech_module.deactivate()
+        wildcard_module.deactivate()
+        await backend_connector.handle_event(events[1])
+        await wait_for(lambda: len(done_speech_module.events) == 3)
+        assert len(speech_module.events) == 2
+        assert len(wildcard_module.events) == 4
+        assert list(backend_connector.event_handler_index) == [EVENT_TYPE_AI_SPEECH, EVENT_TYPE_STT_OUTPUT_TEXT]
+        assert backend_connector.wildcard_event_handlers == []
+        done_speech_module.deactivate()
+
+    asyncio.run(run())
+
+def test_session_events_are_replayed_on_reconnect():
+    async def run():
+        fake_link = FakeHarmonyLink()
+        await fake_link.start()
+        backend_connector = make_connector(fake_link.endpoint)
+        module = RecordingModule(FakeEntityController('character', backend_connector))
+        backend_connector.start()
+        await asyncio.wait_for(backend_connector.wait_connected(), timeout=TIMEOUT)
+        module.activate()
+
+        init_event = make_event(EVENT_TYPE_INIT_ENTITY, {'entity_id': 'character'})
+        assert await backend_connector.send_event(init_event, replay_on_reconnect=True)
+        await wait_for(lambda: fake_link.get_session('character') is not None)
+
+        fake_link = await restart_link(fake_link)
+        await wait_for(lambda: backend_connector.connection_count == 2 and backend_connector.connected.is_set())
+        # Replayed before anything else, so the new session knows its entity right away
+        await wait_for(lambda: fake_link.get_session('character') is not None)
+        assert module.reconnects == 1
+        # Replies to the replayed event reach the modules as usual
+        await wait_for(lambda: any(event.event_type == EVENT_TYPE_INIT_ENTITY for event in module.events))
+
+        backend_connector.stop()
+        await asyncio.gather(backend_connector.task, return_exceptions=True)
+        await fake_link.stop()
+
+    asyncio.run(run())
+
+
+def test_buffered_events_are_sent_after_reconnect():
+    async def run():
+        fake_link = FakeHarmonyLink()
+        await fake_link.start()
+        backend_connector = make_connector(fake_link.endpoint)
+        backend_connector.start()
+        await asyncio.wait_for(backend_connector.wait_connected(), timeout=TIMEOUT)
+
+        await stop_link(fake_link)
+        await wait_for(lambda: not backend_connector.connected.is_set())
+
+        # Buffered while disconnected
+        send_task = asyncio.create_task(backend_connector.send_event(make_event(EVENT_TYPE_ENVIRONMENT_LOADED)))
+        # Only valid for the current connection, so refused right away
+        with pytest.raises(RuntimeError):
+            await backend_connector.send_event(make_event(EVENT_TYPE_STT_INPUT_AUDIO))
+        await asyncio.sleep(0.1)
+        assert not send_task.done()
+
+        fake_link = FakeHarmonyLink(port=fake_link.port)
+        await fake_link.start()
+        assert await asyncio.wait_for(send_task, timeout=TIMEOUT)
+        await wait_for(lambda: fake_link.events_received == 1)
+
+        backend_connector.stop()
+        await asyncio.gather(backend_connector.task, return_exceptions=True)
+        await fake_link.stop()
+
+    asyncio.run(run())
+
+
+def test_unbuffered_events_are_dropped_on_disconnect():
+    async def run():
+        backend_connector = make_connector('ws://127.0.0.1:1')
+        loop = asyncio.get_running_loop()
+        audio_event = connector.OutboundEvent(make_event(EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT), loop.create_future(), False)
+        loaded_event = connector.OutboundEvent(make_event(EVENT_TYPE_ENVIRONMENT_LOADED), loop.create_future(), False)
+        backend_connector.send_queue.put_nowait(audio_event)
+        backend_connector.send_queue.put_nowait(loaded_event)
+
+        backend_connector.drop_unbuffered_events()
+        assert isinstance(audio_event.future.exception(), RuntimeError)
+        assert not loaded_event.future.done()
+        assert backend_connector.send_queue.qsize() == 1
+        assert backend_connector.send_queue.get_nowait() is loaded_event
+
+    asyncio.run(run())
+
+
+def test_reconnect_backoff_is_capped_and_gives_up(monkeypatch):
+    delay_limits = []
+
+    def uniform(low, high):
+        delay_limits.append(high)
+        return 0.0
+
+    monkeypatch.setattr(connector.random, 'uniform', uniform)
+    shutdown_calls = []
+
+    async def run():
+        backend_connector = connector.ConnectorEventHandler(
+            'ws://127.0.0.1:{0}'.format(get_unused_port()),
+            shutdown_func=lambda: shutdown_calls.append(True),
+            reconnect_base_delay=0.5,
+            reconnect_max_delay=2.0,
+            max_reconnect_attempts=5
+        )
+        backend_connector.start()
+        await asyncio.wait_for(backend_connector.task, timeout=TIMEOUT)
+        assert not backend_connector.connected.is_set()
+
+    asyncio.run(run())
+    assert delay_limits == [0.5, 1.0, 2.0, 2.0, 2.0]
+    assert shutdown_calls == [True]
+
+
+def test_cancelled_buffered_send_does_not_break_overflow():
+    async def run():
+        backend_connector = make_connector('ws://127.0.0.1:1', outbound_buffer_size=2)
+        backend_connector.event_loop = asyncio.get_running_loop()
+        # Buffered while disconnected, then given up by its sender, e.g. a restarted STT_START_LISTEN
+        cancelled_task = asyncio.create_task(backend_connector.send_event(make_event(EVENT_TYPE_STT_START_LISTEN)))
+        waiting_task = asyncio.create_task(backend_connector.send_event(make_event(EVENT_TYPE_ENVIRONMENT_LOADED)))
+        await asyncio.sleep(0)
+        cancelled_task.cancel()
+        await asyncio.gather(cancelled_task, return_exceptions=True)
+
+        # Drops the cancelled event, which mustn't affect this sender
+        overflow_task = asyncio.create_task(backend_connector.send_event(make_event(EVENT_TYPE_USER_UTTERANCE)))
+        await asyncio.sleep(0)
+        assert not overflow_task.done()
+        assert [outbound_event.event.event_type for outbound_event in list(backend_connector.send_queue._queue)] == [
+            EVENT_TYPE_ENVIRONMENT_LOADED, EVENT_TYPE_USER_UTTERANCE]
+        waiting_task.cancel()
+        overflow_task.cancel()
+        await asyncio.gather(waiting_task, overflow_task, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_cancelled_send_failing_on_the_connection(caplog):
+    # FailingWebSocket - connection which broke while sending
+    class FailingWebSocket:
+        async def send(self, message):
+            raise ConnectionError('connection reset')
+
+    async def run():
+        backend_connector = make_connector('ws://127.0.0.1:1')
+        backend_connector.running = True
+        backend_connector.websocket = FailingWebSocket()
+        outbound_event = connector.OutboundEvent(
+            make_event(EVENT_TYPE_STT_INPUT_AUDIO), asyncio.get_running_loop().create_future(), False)
+        outbound_event.future.cancel()
+        backend_connector.send_queue.put_nowait(outbound_event)
+        await asyncio.wait_for(backend_connector.producer_handler(), timeout=TIMEOUT)
+
+    asyncio.run(run())
+    assert 'Error in producer_handler' not in caplog.text
+
+
+def test_handler_queue_flood_is_logged_once_and_counted(caplog):
+    async def run():
+        module = RecordingModule(FakeEntityController('flooded', None))
+        event_handler_queue = connector.EventHandlerQueue(module, max_size=2, entity_id='flooded')
+        for _ in range(5):
+            event_handler_queue.put(make_event(EVENT_TYPE_AI_SPEECH))
+        assert event_handler_queue.depth_metric.value == 2
+        assert event_handler_queue.dropped_events_metric.value == 3
+        assert caplog.text.count('dropping events') == 1
+
+        event_handler_queue.queue.get_nowait()
+        assert event_handler_queue.put(make_event(EVENT_TYPE_AI_SPEECH))
+        assert '3 events were dropped' in caplog.text
+
+        # Wait times get observed once the worker handles the events
+        event_handler_queue.start()
+        await wait_for(lambda: len(module.events) == 2)
+        assert event_handler_queue.wait_time_metric.count == 2
+        assert event_handler_queue.depth_metric.value == 0
+        event_handler_queue.close()
+        await event_handler_queue.task
+
+    asyncio.run(run())
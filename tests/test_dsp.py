@@ -0,0 +1,93 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the DSP module
+import numpy as np
+import pytest
+
+from harmony_modules import dsp
+
+
+def make_sine(frequency, sample_rate, duration, channels=1):
+    t = np.arange(int(sample_rate * duration)) / sample_rate
+    return np.repeat((0.5 * np.sin(2.0 * np.pi * frequency * t))[:, None], channels, axis=1).astype(np.float32)
+
+
+@pytest.mark.parametrize('bit_depth', [8, 16, 24, 32])
+def test_pcm_round_trip(bit_depth):
+    samples = np.array([[0.0], [0.5], [-0.5], [-1.0]], dtype=np.float32)
+    audio = dsp.float_to_pcm(samples, bit_depth)
+    assert len(audio) == len(samples) * bit_depth // 8
+    assert np.allclose(dsp.pcm_to_float(audio, bit_depth, 1), samples, atol=2.0 ** (1 - bit_depth))
+
+
+def test_float_to_pcm_clips():
+    assert np.frombuffer(dsp.float_to_pcm(np.array([2.0, 1.0, -2.0]), 16), dtype='<i2').tolist() == [32767, 32767, -32768]
+
+
+def test_pcm_to_array_drops_partial_frames():
+    audio = np.arange(5, dtype='<i2').tobytes() + b'\x00'
+    assert dsp.pcm_to_array(audio, 16, 2).tolist() == [[0, 1], [2, 3]]
+
+
+def test_convert_channels():
+    stereo = np.array([[1.0, 0.0], [0.5, 0.5]], dtype=np.float32)
+    assert dsp.convert_channels(stereo, 1).tolist() == [[0.5], [0.5]]
+    assert dsp.convert_channels(stereo[:, :1], 2).tolist() == [[1.0, 1.0], [0.5, 0.5]]
+    assert dsp.convert_channels(stereo, 2) is stereo
+
+
+@pytest.mark.parametrize('input_rate, output_rate', [(48000, 16000), (44100, 16000), (16000, 48000), (22050, 44100)])
+def test_resampler_output_length_and_tone(input_rate, output_rate):
+    resampler = dsp.PolyphaseResampler(input_rate, output_rate)
+    output = resampler.process(make_sine(440.0, input_rate, 1.0))
+    assert len(output) == output_rate
+
+    # The tone keeps its frequency and level, apart from the filter's settling at the start
+    steady = output[len(output) // 4:, 0]
+    spectrum = np.abs(np.fft.rfft(steady * np.hanning(len(steady))))
+    peak_frequency = np.argmax(spectrum) * output_rate / len(steady)
+    assert abs(peak_frequency - 440.0) < 2.0
+    assert np.sqrt(np.mean(np.square(steady))) == pytest.approx(0.5 / np.sqrt(2.0), rel=0.02)
+
+
+def test_resampler_suppresses_aliasing():
+    # 20 kHz would alias to 4 kHz, the short filter's stopband starts well above the cutoff
+    resampler = dsp.PolyphaseResampler(48000, 16000)
+    output = resampler.process(make_sine(20000.0, 48000, 0.5))
+    assert np.sqrt(np.mean(np.square(output[len(output) // 4:]))) < 0.5 * 10.0 ** (-60.0 / 20.0)
+
+
+def test_resampler_chunked_matches_whole_signal():
+    signal = make_sine(440.0, 44100, 0.5, channels=2)
+    expected = dsp.PolyphaseResampler(44100, 16000).process(signal)
+    resampler = dsp.PolyphaseResampler(44100, 16000)
+    chunks = [resampler.process(signal[start:start + 1013]) for start in range(0, len(signal), 1013)]
+    assert np.allclose(np.concatenate(chunks), expected, atol=1e-6)
+
+
+def test_resampler_same_rate_passes_through():
+    signal = make_sine(440.0, 16000, 0.1)
+    assert np.array_equal(dsp.PolyphaseResampler(16000, 16000).process(signal), signal)
+
+
+def test_pcm_converter_converts_format():
+    converter = dsp.PcmConverter(48000, 2, 24, 16000, 1, 16)
+    audio = dsp.float_to_pcm(make_sine(440.0, 48000, 0.5, channels=2), 24)
+    output = converter.process(audio)
+    assert len(output) == 8000 * 2
+    samples = dsp.pcm_to_float(output, 16, 1)[2000:, 0]
+    assert np.sqrt(np.mean(np.square(samples))) == pytest.approx(0.5 / np.sqrt(2.0), rel=0.02)
+
+
+def test_pcm_converter_output_length_only_depends_on_total_input():
+    # Byte offsets in the converted stream stay stable however the capture is chunked
+    audio = dsp.float_to_pcm(make_sine(440.0, 44100, 1.0), 16)
+    converter = dsp.PcmConverter(44100, 1, 16, 16000, 1, 16)
+    chunk_sizes = [882, 1000, 2, 4410, 17640]
+    output_length = 0
+    position = 0
+    for chunk_size in chunk_sizes * 3:
+        output_length += len(converter.process(audio[position:position + chunk_size]))
+        position += chunk_size
+        assert output_length == converter.converter.get_output_frames(position // 2) * 2
@@ -0,0 +1,114 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the event bus module
+import asyncio
+
+from fakes import FakeEntityController, RecordingModule, wait_for
+from harmony_modules import connector
+from harmony_modules.common import *
+from harmony_modules.event_bus import EventBus
+
+
+def make_utterance(content='Hello everyone!'):
+    return HarmonyLinkEvent(
+        event_id='utterance',
+        event_type=EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE,
+        status=EVENT_STATE_DONE,
+        payload={'entity_id': 'user', 'content': content}
+    )
+
+
+def test_publish_fans_out_to_subscribers_except_the_source():
+    event_bus = EventBus()
+    received = {}
+    for subscriber_id in ('user', 'character_0', 'character_1'):
+        event_bus.subscribe(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, subscriber_id,
+                            lambda event, subscriber_id=subscriber_id: received.setdefault(subscriber_id, []).append(event))
+    event_bus.subscribe(EVENT_TYPE_STT_SPEECH_STARTED, 'character_0', lambda event: received.setdefault('speech', []).append(event))
+
+    assert event_bus.publish(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, make_utterance(), source_id='user') == 2
+    assert sorted(received) == ['character_0', 'character_1']
+    assert event_bus.publish(EVENT_TYPE_AI_SPEECH, make_utterance()) == 0
+
+
+def test_unsubscribe():
+    event_bus = EventBus()
+    received = []
+    for topic in (EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, EVENT_TYPE_STT_SPEECH_STARTED, EVENT_TYPE_STT_SPEECH_STOPPED):
+        event_bus.subscribe(topic, 'character_0', received.append)
+        event_bus.subscribe(topic, 'character_1', received.append)
+
+    event_bus.unsubscribe(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, 'character_0')
+    assert event_bus.publish(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, make_utterance()) == 1
+    event_bus.unsubscribe_all('character_1')
+    assert event_bus.publish(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, make_utterance()) == 0
+    assert event_bus.publish(EVENT_TYPE_STT_SPEECH_STARTED, make_utterance()) == 1
+    # Unknown subscriptions are ignored
+    event_bus.unsubscribe(EVENT_TYPE_AI_SPEECH, 'character_0')
+    assert len(received) == 2
+
+
+def test_subscribers_get_isolated_copies():
+    event_bus = EventBus()
+    received = []
+
+    def modifying_handler(event):
+        event.payload['content'] = 'changed'
+        received.append(event)
+
+    event_bus.subscribe(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, 'character_0', modifying_handler)
+    event_bus.subscribe(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, 'character_1', received.append)
+    event = make_utterance()
+    event_bus.publish(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, event)
+    assert event.payload['content'] == 'Hello everyone!'
+    assert [received_event.payload['content'] for received_event in received] == ['changed', 'Hello everyone!']
+
+
+def test_failing_subscriber_does_not_affect_the_others():
+    event_bus = EventBus()
+    received = []
+
+    def failing_handler(event):
+        raise RuntimeError('subscriber is gone')
+
+    event_bus.subscribe(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, 'character_0', failing_handler)
+    event_bus.subscribe(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, 'character_1', received.append)
+    assert event_bus.publish(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, make_utterance()) == 2
+    assert len(received) == 1
+
+
+def test_slow_subscriber_does_not_hold_up_the_publisher():
+    # BlockedModule - handles events only once released
+    class BlockedModule(RecordingModule):
+        def __init__(self, entity_controller):
+            RecordingModule.__init__(self, entity_controller)
+            self.released = asyncio.Event()
+
+        async def handle_event(self, event):
+            await self.released.wait()
+            await RecordingModule.handle_event(self, event)
+
+    async def run():
+        event_bus = EventBus()
+        modules = []
+        for entity_id, module_class in (('character_0', BlockedModule), ('character_1', RecordingModule)):
+            backend_connector = connector.ConnectorEventHandler('ws://127.0.0.1:1', shutdown_func=lambda: None, entity_id=entity_id)
+            module = module_class(FakeEntityController(entity_id, backend_connector))
+            module.activate()
+            event_bus.subscribe(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, entity_id,
+                                lambda event, module=module: module.backend_connector.queue_event(module, event))
+            modules.append(module)
+        blocked_module, recording_module = modules
+
+        for _ in range(3):
+            event_bus.publish(EVENT_TYPE_PERCEPTION_ACTOR_UTTERANCE, make_utterance(), source_id='user')
+        await wait_for(lambda: len(recording_module.events) == 3)
+        assert blocked_module.events == []
+
+        blocked_module.released.set()
+        await wait_for(lambda: len(blocked_module.events) == 3)
+        for module in modules:
+            module.deactivate()
+
+    asyncio.run(run())
@@ -0,0 +1,104 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the plugin's entity bring-up
+import asyncio
+
+import pytest
+
+import harmony_globals
+
+# Importing the plugin needs sounddevice with the PortAudio library, and pynput
+try:
+    import harmony
+except (ImportError, OSError) as e:
+    pytest.skip('plugin dependencies not available: {0}'.format(e), allow_module_level=True)
+
+
+# FakeController - entity controller recording whether it has been shut down
+class FakeController:
+    def __init__(self):
+        self.shut_down = False
+
+    def shutdown_modules(self):
+        self.shut_down = True
+
+
+@pytest.fixture
+def scene(monkeypatch):
+    # User entity and two characters, with the plugin's shutdown recorded instead of run
+    controllers = {entity_id: FakeController() for entity_id in ('user', 'character_0', 'character_1')}
+    monkeypatch.setattr(harmony_globals, 'active_entities', dict(controllers))
+    monkeypatch.setattr(harmony_globals, 'user_controlled_entity_id', 'user')
+    monkeypatch.setattr(harmony_globals, 'ready_entities', [])
+    monkeypatch.setattr(harmony_globals, 'failed_entities', [])
+    monkeypatch.setattr(harmony, '_post_init_task', None)
+    aborts = []
+    monkeypatch.setattr(harmony, 'shutdown', lambda: aborts.append(True))
+    return controllers, aborts
+
+
+def test_bring_up_isolates_failures_and_limits_concurrency():
+    running = []
+    max_running = []
+
+    async def bring_up(fail):
+        running.append(True)
+        max_running.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        if fail:
+            raise RuntimeError('VTS not reachable')
+
+    entity_tasks = {'character_{0}'.format(index): (lambda fail=index % 3 == 0: bring_up(fail)) for index in range(7)}
+    failed_entities = asyncio.run(harmony._bring_up_entities('Test', entity_tasks, concurrency=2))
+    assert sorted(failed_entities) == ['character_0', 'character_3', 'character_6']
+    assert all(isinstance(error, RuntimeError) for error in failed_entities.values())
+    assert len(max_running) == 7
+    assert max(max_running) == 2
+
+
+def test_failed_character_is_deactivated_on_its_own(scene):
+    controllers, aborts = scene
+    assert harmony._deactivate_failed_entities('Test', ['character_0'])
+    assert list(harmony_globals.active_entities) == ['user', 'character_1']
+    assert controllers['character_0'].shut_down
+    assert not controllers['character_1'].shut_down
+    assert aborts == []
+
+
+def test_failed_user_entity_aborts(scene):
+    controllers, aborts = scene
+    assert not harmony._deactivate_failed_entities('Test', ['user'])
+    assert aborts == [True]
+
+
+def test_all_characters_failing_aborts(scene):
+    controllers, aborts = scene
+    assert not harmony._deactivate_failed_entities('Test', ['character_0', 'character_1'])
+    assert aborts == [True]
+
+
+def test_scene_setup_starts_once_all_remaining_entities_reported(scene, monkeypatch):
+    controllers, aborts = scene
+    post_init_calls = []
+
+    async def post_init():
+        post_init_calls.append(list(harmony_globals.active_entities))
+
+    monkeypatch.setattr(harmony, 'post_init', post_init)
+
+    async def run():
+        harmony_globals.ready_entities.append('user')
+        harmony_globals.failed_entities.append('character_0')
+        harmony._check_init_done()
+        assert harmony._post_init_task is None
+
+        harmony_globals.ready_entities.append('character_1')
+        harmony._check_init_done()
+        await harmony._post_init_task
+
+    asyncio.run(run())
+    assert post_init_calls == [['user', 'character_1']]
+    assert controllers['character_0'].shut_down
+    assert aborts == []
@@ -0,0 +1,159 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the speech to text module's negotiation and reconnect handling, against the fake Harmony Link
+import asyncio
+
+import pytest
+
+from benchmarks.fake_harmony_link import FakeHarmonyLink
+from fakes import TIMEOUT, FakeEntityController, stop_link, wait_for
+from harmony_modules import connector, vad
+from harmony_modules.common import *
+
+# Importing sounddevice fails without the PortAudio library
+try:
+    from harmony_modules.speech_to_text import SpeechToTextHandler
+except (ImportError, OSError) as e:
+    pytest.skip('sounddevice not available: {0}'.format(e), allow_module_level=True)
+
+SAMPLE_RATE = 16000
+STT_CONFIG = {
+    'auto_vad': '1',
+    'microphone': 'default',
+    'channels': '1',
+    'bit_depth': '16',
+    'sample_rate': str(SAMPLE_RATE),
+    'buffer_clip_duration': '10',
+    'record_stepping': '20',
+    'audio_transport': 'binary',
+    'uplink_mode': 'pull',
+}
+BLOCK_FRAMES = 320
+
+
+# ManualMicrophoneHandler - STT module whose capture callback is called by the test instead of a microphone
+class ManualMicrophoneHandler(SpeechToTextHandler):
+    def __init__(self, entity_controller, stt_config):
+        SpeechToTextHandler.__init__(self, entity_controller=entity_controller, stt_config=stt_config)
+
+    def get_microphone(self):
+        return -1, 'manual'
+
+    def start_continuous_recording(self):
+        self.reset_recording()
+        self.audio_stream = object()
+        return True
+
+    async def stop_continuous_recording(self):
+        await self.stop_push(flush=False)
+        self.audio_stream = None
+        return True
+
+    def capture(self, blocks):
+        for _ in range(blocks):
+            self.audio_stream_callback(bytes(BLOCK_FRAMES * 2), BLOCK_FRAMES, None, None)
+
+
+def test_listening_restarts_after_reconnect():
+    async def run():
+        fake_link = FakeHarmonyLink(fetch_window=0.5)
+        await fake_link.start()
+        backend_connector = connector.ConnectorEventHandler(
+            fake_link.endpoint, shutdown_func=lambda: None, reconnect_base_delay=0.01, reconnect_max_delay=0.05)
+        backend_connector.start()
+        await asyncio.wait_for(backend_connector.wait_connected(), timeout=TIMEOUT)
+        microphone = ManualMicrophoneHandler(FakeEntityController('user', backend_connector), STT_CONFIG)
+        microphone.activate()
+        await microphone.start_listen()
+
+        # More audio than the ring buffer holds, so offsets of the old session are gone
+        microphone.capture(3000)
+        await wait_for(lambda: len(fake_link.fetch_log) > 0)
+
+        await stop_link(fake_link)
+        fake_link = FakeHarmonyLink(port=fake_link.port, fetch_window=0.5)
+        await fake_link.start()
+        await wait_for(lambda: backend_connector.connection_count == 2 and backend_connector.connected.is_set())
+
+        # The new session negotiates again and fetches from the start of a fresh recording
+        await wait_for(lambda: fake_link.sessions and fake_link.sessions[0].listen_config is not None)
+        reads = []
+        read_recording = microphone.read_recording
+
+        def recording_reader(start_byte, bytes_count):
+            result = read_recording(start_byte, bytes_count)
+            reads.append((start_byte, bytes_count, result[0]))
+            return result
+
+        microphone.read_recording = recording_reader
+        while not fake_link.fetch_log:
+            microphone.capture(5)
+            await asyncio.sleep(0.01)
+        assert microphone.negotiated_audio_transport == 'binary'
+        assert reads[0] == (0, SAMPLE_RATE, 0)
+        assert fake_link.fetch_log[0][0] == SAMPLE_RATE
+
+        await microphone.stop_continuous_recording()
+        backend_connector.stop()
+        await asyncio.gather(backend_connector.task, return_exceptions=True)
+        await fake_link.stop()
+
+    asyncio.run(run())
+
+
+def make_listen_reply(**payload):
+    return HarmonyLinkEvent(event_id='start_listen', event_type=EVENT_TYPE_STT_START_LISTEN, status=EVENT_STATE_DONE, payload=payload)
+
+
+@pytest.mark.parametrize('accepted_local_vad, negotiated_local_vad', [
+    (None, vad.LOCAL_VAD_OFF),
+    (vad.LOCAL_VAD_OFF, vad.LOCAL_VAD_OFF),
+    (vad.LOCAL_VAD_MARK, vad.LOCAL_VAD_MARK),
+    (vad.LOCAL_VAD_SKIP, vad.LOCAL_VAD_SKIP),
+])
+def test_local_vad_is_only_used_once_confirmed(accepted_local_vad, negotiated_local_vad):
+    async def run():
+        backend_connector = connector.ConnectorEventHandler('ws://127.0.0.1:1', shutdown_func=lambda: None)
+        microphone = ManualMicrophoneHandler(
+            FakeEntityController('user', backend_connector), dict(STT_CONFIG, local_vad=vad.LOCAL_VAD_SKIP))
+        microphone.start_continuous_recording()
+        microphone.capture(100)
+        payload = {'audio_transport': 'binary'}
+        if accepted_local_vad is not None:
+            payload['local_vad'] = accepted_local_vad
+        await microphone.handle_event(make_listen_reply(**payload))
+        assert microphone.negotiated_local_vad == negotiated_local_vad
+
+        # Silence gets skipped only if Harmony Link understands it
+        _, audio_fields, _ = microphone.read_recording(0, SAMPLE_RATE)
+        assert ('speech_ranges' in audio_fields) == (negotiated_local_vad != vad.LOCAL_VAD_OFF)
+        assert audio_fields.get('skipped', False) == (negotiated_local_vad == vad.LOCAL_VAD_SKIP)
+        assert len(audio_fields['audio_bytes']) == (0 if negotiated_local_vad == vad.LOCAL_VAD_SKIP else SAMPLE_RATE)
+        assert microphone.vad_lookahead_bytes == (microphone.vad_skip_lookahead_bytes if negotiated_local_vad == vad.LOCAL_VAD_SKIP else 0)
+
+    asyncio.run(run())
+
+
+def test_fetch_while_not_recording_is_rejected():
+    async def run():
+        backend_connector = connector.ConnectorEventHandler('ws://127.0.0.1:1', shutdown_func=lambda: None)
+        sent_events = []
+
+        async def send_event(event, **kwargs):
+            sent_events.append(event)
+            return True
+
+        backend_connector.send_event = send_event
+        microphone = ManualMicrophoneHandler(FakeEntityController('user', backend_connector), STT_CONFIG)
+        fetch_event = HarmonyLinkEvent(event_id='fetch', event_type=EVENT_TYPE_STT_FETCH_MICROPHONE, status=EVENT_STATE_DONE,
+                                       payload={'start_byte': 0, 'bytes_count': SAMPLE_RATE})
+        await microphone.handle_event(fetch_event)
+
+        # Answered right away instead of waiting for audio which never arrives
+        assert [(event.event_id, event.event_type, event.status) for event in sent_events] == [
+            ('fetch', EVENT_TYPE_STT_FETCH_MICROPHONE_RESULT, EVENT_STATE_ERROR)]
+        assert microphone.active_recording_events == {}
+        assert len(microphone.fetch_waiters) == 0
+
+    asyncio.run(run())
@@ -0,0 +1,104 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the text to speech module
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+
+from fakes import FakeEntityController
+from harmony_modules import connector
+
+# Importing sounddevice fails without the PortAudio library
+try:
+    from harmony_modules import text_to_speech
+except (ImportError, OSError) as e:
+    pytest.skip('sounddevice not available: {0}'.format(e), allow_module_level=True)
+
+
+# SizedAudio - stands in for decoded audio of a given size
+class SizedAudio:
+    def __init__(self, size):
+        self.size = size
+
+    def get_size(self):
+        return self.size
+
+
+def test_audio_cache_key_changes_with_the_file(tmp_path):
+    audio_cache = text_to_speech.DecodedAudioCache(max_bytes=1000, entity_id='cache_key')
+    audio_file = tmp_path / 'utterance.wav'
+    audio_file.write_bytes(b'first')
+    first_key = audio_cache.get_key(str(audio_file))
+    audio_file.write_bytes(b'second utterance')
+    assert audio_cache.get_key(str(audio_file)) != first_key
+
+    # Deleted files are never looked up
+    os.remove(audio_file)
+    assert audio_cache.get_key(str(audio_file)) is None
+    assert audio_cache.get(None) is None
+
+
+def test_audio_cache_evicts_least_recently_used_and_counts_lookups():
+    audio_cache = text_to_speech.DecodedAudioCache(max_bytes=100, entity_id='cache_lru')
+    audio_cache.put('a', SizedAudio(40))
+    audio_cache.put('b', SizedAudio(40))
+    assert audio_cache.get('a') is not None
+    audio_cache.put('c', SizedAudio(40))
+    assert list(audio_cache.entries) == ['a', 'c']
+    assert audio_cache.size_bytes == 80
+    assert audio_cache.size_metric.value == 80
+
+    # Larger than the whole budget, not cached
+    audio_cache.put('d', SizedAudio(200))
+    assert audio_cache.get('d') is None
+    assert audio_cache.get('b') is None
+    assert audio_cache.hits_metric.value == 1
+    assert audio_cache.misses_metric.value == 2
+
+
+# SilentAudio - decoded audio which never ends, without lipsync track
+class SilentAudio:
+    lipsync_track = None
+
+    def read(self, start, frames):
+        return np.zeros((frames, 2), dtype=np.float32), False
+
+
+# DevicelessSpeechHandler - TTS module without a speaker, the test fills the output buffer itself
+class DevicelessSpeechHandler(text_to_speech.TextToSpeechHandler):
+    def setup_speaker(self):
+        pass
+
+
+def make_utterance(audio_file):
+    return {'audio_file': audio_file, 'audio': SilentAudio(), 'index': 0, 'received_time': time.perf_counter(), 'first_sample_time': None}
+
+
+def test_start_notification_of_a_suppressed_utterance_is_ignored():
+    async def run():
+        backend_connector = connector.ConnectorEventHandler('ws://127.0.0.1:1', shutdown_func=lambda: None)
+        speech_handler = DevicelessSpeechHandler(FakeEntityController('character', backend_connector), {})
+        outdata = np.zeros((512, 2), dtype=np.float32)
+
+        # Suppressed after the audio thread started it, but before the start notification ran
+        speech_handler.player.enqueue(make_utterance('suppressed.wav'))
+        speech_handler.player.fill(outdata, len(outdata))
+        speech_handler.suppress_speech(True)
+        await asyncio.sleep(0)
+        assert speech_handler.playing_utterance is None
+        assert speech_handler.lipsync_task is None
+
+        speech_handler.suppress_speech(False)
+        speech_handler.player.enqueue(make_utterance('next.wav'))
+        speech_handler.player.fill(outdata, len(outdata))
+        await asyncio.sleep(0)
+        assert speech_handler.playing_utterance['audio_file'] == 'next.wav'
+
+        speech_handler.suppress_speech(True)
+        await asyncio.gather(speech_handler.lipsync_task)
+
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the VAD module
+import numpy as np
+
+from harmony_modules import dsp, vad
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = int(SAMPLE_RATE * vad.DEFAULT_FRAME_DURATION)
+
+
+def make_tone(duration, level_db, frequency=220.0):
+    t = np.arange(int(SAMPLE_RATE * duration)) / SAMPLE_RATE
+    # Sine RMS is 3 dB below its peak
+    amplitude = 10.0 ** ((level_db + 3.0) / 20.0)
+    return (amplitude * np.sin(2.0 * np.pi * frequency * t)).astype(np.float32)
+
+
+def make_silence(duration):
+    return np.zeros(int(SAMPLE_RATE * duration), dtype=np.float32)
+
+
+def test_find_ranges():
+    mask = np.array([False, True, True, False, True, False, False, True])
+    assert vad.find_ranges(mask) == [(1, 3), (4, 5), (7, 8)]
+    assert vad.find_ranges(np.zeros(4, dtype=bool)) == []
+
+
+def test_pcm_to_mono_averages_channels():
+    stereo = np.array([[16384, -16384], [8192, 8192]], dtype='<i2').tobytes()
+    assert np.allclose(vad.pcm_to_mono(stereo, 16, 2), [0.0, 0.25])
+
+
+def test_pcm_to_mono_24_bit():
+    samples = np.array([0.5, -0.25], dtype=np.float32)
+    assert np.allclose(vad.pcm_to_mono(dsp.float_to_pcm(samples, 24), 24, 1), samples, atol=1e-6)
+
+
+def test_silence_and_loud_tone_are_classified():
+    detector = vad.EnergyVAD(SAMPLE_RATE)
+    assert not detector.classify_frames(make_silence(0.2)).any()
+    assert detector.classify_frames(make_tone(0.2, -20.0)).all()
+
+
+def test_quiet_hum_is_not_speech():
+    # Below the energy threshold and low frequency, so no unvoiced speech either
+    detector = vad.EnergyVAD(SAMPLE_RATE)
+    assert not detector.classify_frames(make_tone(0.2, vad.DEFAULT_ENERGY_THRESHOLD_DB - 5.0, frequency=50.0)).any()
+
+
+def test_quiet_noisy_frames_count_as_unvoiced_speech():
+    detector = vad.EnergyVAD(SAMPLE_RATE)
+    level_db = vad.DEFAULT_ENERGY_THRESHOLD_DB - vad.UNVOICED_ENERGY_MARGIN_DB / 2.0
+    assert detector.classify_frames(make_tone(0.2, level_db, frequency=5000.0)).all()
+
+
+def test_partial_frame_is_classified():
+    detector = vad.EnergyVAD(SAMPLE_RATE)
+    assert len(detector.classify_frames(make_tone(0.05, -20.0))) == 3
+
+
+def test_detect_extends_speech_by_preroll_and_hangover():
+    detector = vad.EnergyVAD(SAMPLE_RATE)
+    samples = np.concatenate((make_silence(1.0), make_tone(0.2, -20.0), make_silence(1.0)))
+    speech_ranges = vad.find_ranges(detector.detect(samples))
+    assert len(speech_ranges) == 1
+    start, end = speech_ranges[0]
+    speech_start = int(1.0 / vad.DEFAULT_FRAME_DURATION)
+    speech_end = speech_start + int(0.2 / vad.DEFAULT_FRAME_DURATION)
+    assert start == speech_start - detector.preroll_frames
+    assert end == speech_end + detector.hangover_frames
+
+
+def test_detect_merges_short_pauses():
+    detector = vad.EnergyVAD(SAMPLE_RATE)
+    samples = np.concatenate((make_tone(0.2, -20.0), make_silence(0.2), make_tone(0.2, -20.0)))
+    assert len(vad.find_ranges(detector.detect(samples))) == 1
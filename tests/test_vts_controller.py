@@ -0,0 +1,174 @@
+# Harmony Link Plugin for VTube Studio
+# (c) 2023-2025 Project Harmony.AI (contact@project-harmony.ai)
+#
+# Tests for the VTube Studio API client
+import asyncio
+import json
+import logging
+
+import pytest
+import websockets
+
+from benchmarks.fake_vts import FakeVTubeStudio
+from fakes import wait_for
+from VTSController import VTSController
+
+
+# ReorderingVTubeStudio - answers requests in batches in reverse order, and never answers 'SilentRequest'
+class ReorderingVTubeStudio:
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.server = None
+
+    @property
+    def endpoint(self):
+        return 'ws://127.0.0.1:{0}'.format(self.server.sockets[0].getsockname()[1])
+
+    async def start(self):
+        self.server = await websockets.serve(self.handle_connection, '127.0.0.1', 0)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_connection(self, websocket):
+        batch = []
+        async for message in websocket:
+            request = json.loads(message)
+            if request['messageType'] == 'SilentRequest':
+                continue
+            batch.append(request)
+            if len(batch) < self.batch_size:
+                continue
+            for request in reversed(batch):
+                await websocket.send(json.dumps({
+                    'requestID': request['requestID'],
+                    'messageType': request['messageType'].replace('Request', 'Response'),
+                    'data': request['data'],
+                }))
+            batch = []
+
+
+async def connect(vts_controller):
+    # The connection part of VTSController.initialise(), without authentication
+    vts_controller.websocket = await websockets.connect(vts_controller.endpoint)
+    vts_controller.reader_task = asyncio.create_task(vts_controller.receive_responses())
+
+
+def test_concurrent_replies_are_routed_by_request_id():
+    async def run():
+        fake_vts = ReorderingVTubeStudio(batch_size=3)
+        await fake_vts.start()
+        vts_controller = VTSController(endpoint=fake_vts.endpoint, request_timeout=5.0)
+        await connect(vts_controller)
+
+        responses = await asyncio.gather(*(
+            vts_controller.send_request(message_type='TestRequest', data={'index': index}) for index in range(3)
+        ))
+        assert [response['data']['index'] for response in responses] == [0, 1, 2]
+        assert vts_controller.pending_requests == {}
+
+        await vts_controller.close()
+        await fake_vts.stop()
+
+    asyncio.run(run())
+
+
+def test_request_timeout_leaves_other_requests_working():
+    async def run():
+        fake_vts = ReorderingVTubeStudio(batch_size=1)
+        await fake_vts.start()
+        vts_controller = VTSController(endpoint=fake_vts.endpoint, request_timeout=5.0)
+        await connect(vts_controller)
+
+        with pytest.raises(TimeoutError):
+            await vts_controller.send_request(message_type='SilentRequest', timeout=0.05)
+        assert vts_controller.pending_requests == {}
+        response = await vts_controller.send_request(message_type='TestRequest', data={'index': 1})
+        assert response['messageType'] == 'TestResponse'
+
+        await vts_controller.close()
+        await fake_vts.stop()
+
+    asyncio.run(run())
+
+
+def test_pending_requests_fail_when_the_connection_closes():
+    async def run():
+        fake_vts = ReorderingVTubeStudio(batch_size=1)
+        await fake_vts.start()
+        vts_controller = VTSController(endpoint=fake_vts.endpoint, request_timeout=5.0)
+        await connect(vts_controller)
+
+        request_task = asyncio.create_task(vts_controller.send_request(message_type='SilentRequest'))
+        await asyncio.sleep(0.05)
+        await vts_controller.websocket.close()
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(request_task, timeout=5.0)
+
+        # No reader anymore, requests fail right away
+        with pytest.raises(ConnectionError):
+            await vts_controller.send_request(message_type='TestRequest')
+
+        await vts_controller.close()
+        await fake_vts.stop()
+
+    asyncio.run(run())
+
+
+def test_parameter_sink_sends_the_latest_values_once_per_tick():
+    async def run():
+        fake_vts = FakeVTubeStudio()
+        await fake_vts.start()
+        vts_controller = VTSController(endpoint=fake_vts.endpoint, parameter_update_rate=20.0)
+        await vts_controller.initialise()
+
+        for mouth_open in (0.1, 0.5, 0.9):
+            vts_controller.write_parameter('MouthOpen', mouth_open)
+        vts_controller.write_parameters({'MouthSmile': 0.3})
+        await wait_for(lambda: fake_vts.injections == 1)
+        assert fake_vts.parameters == {'MouthOpen': 0.9, 'MouthSmile': 0.3}
+        assert fake_vts.injected_values == 2
+
+        # Nothing written, nothing sent
+        await asyncio.sleep(0.2)
+        assert fake_vts.injections == 1
+
+        await vts_controller.close()
+        await fake_vts.stop()
+
+    asyncio.run(run())
+
+
+def test_parameter_sink_flushes_values_written_during_a_failure(caplog):
+    caplog.set_level(logging.INFO)
+
+    async def run():
+        fake_vts = FakeVTubeStudio()
+        await fake_vts.start()
+        vts_controller = VTSController(endpoint=fake_vts.endpoint, parameter_update_rate=20.0)
+        await vts_controller.initialise()
+
+        # The first injection fails after the batch has been taken, while a newer value gets written
+        inject_params = vts_controller.inject_params
+        failures = []
+
+        async def failing_inject_params(parameters):
+            if not failures:
+                failures.append(parameters)
+                vts_controller.write_parameter('MouthOpen', 0.7)
+                raise ConnectionError('VTube Studio is busy')
+            await inject_params(parameters)
+
+        vts_controller.inject_params = failing_inject_params
+        vts_controller.write_parameter('MouthOpen', 0.2)
+        await wait_for(lambda: fake_vts.injections == 1)
+        assert failures == [[('MouthOpen', 0.2)]]
+        assert fake_vts.parameters == {'MouthOpen': 0.7}
+        assert 'retrying silently' in caplog.text
+        assert 'recovered' in caplog.text
+
+        await vts_controller.close()
+        await fake_vts.stop()
+
+    asyncio.run(run())